@@ -0,0 +1,171 @@
+import calendar
+import hashlib
+import time
+
+import requests
+from github import Requester
+
+from fusion.common.cache_backing_store import FileSystemBackingStore
+from fusion.common import config
+from fusion.common import metrics
+from fusion.common.process import ProcessOwner
+from fusion.openstack.common import log as logging
+
+logger = logging.getLogger(__name__)
+
+# Unused responses are collected after a week.
+MAX_AGE = 7 * 24 * 60 * 60
+
+NOT_MODIFIED = "not_modified"
+STORED = "stored"
+UNCACHED = "uncached"
+
+REQUESTS = metrics.Counter(
+    "fusion_github_http_cache_requests_total",
+    "GitHub API GETs by HTTP cache result.", ("result",))
+
+_store = None
+_store_dir = None
+_session = None
+_session_owner = ProcessOwner()
+
+
+class CachedResponse(object):
+    """A stored response replayed to PyGithub in place of a 304."""
+
+    def __init__(self, status, headers, body):
+        self.status = status
+        self.headers = headers
+        self.text = body
+
+    def getheaders(self):
+        return self.headers.iteritems()
+
+    def read(self):
+        return self.text
+
+
+class ConditionalRequestsMixin(object):
+    """Revalidate GitHub GETs against responses stored on disk.
+
+    A stored response is sent back with If-None-Match and
+    If-Modified-Since. GitHub answers 304 without a body and without
+    counting the request against the rate limit when nothing changed; the
+    stored response is then handed to PyGithub. Responses are keyed by
+    URL, Accept header and a digest of the Authorization header, so users
+    never see each other's responses.
+    """
+
+    def __init__(self, host, port=None, strict=False, timeout=None,
+                 retry=None, **kwargs):
+        super(ConditionalRequestsMixin, self).__init__(
+            host, port=port, strict=strict, timeout=timeout, retry=retry,
+            **kwargs)
+        # Connections are created per request once these classes are
+        # injected; share one session to keep connections alive.
+        if not retry:
+            self.session = get_session()
+
+    def getresponse(self):
+        store = _store
+        if store is None or self.verb != "GET":
+            return super(ConditionalRequestsMixin, self).getresponse()
+        key = self._cache_key()
+        cached = store.lookup(key).value
+        headers = dict(self.headers)
+        if cached:
+            if cached['etag']:
+                headers['If-None-Match'] = cached['etag']
+            if cached['last_modified']:
+                headers['If-Modified-Since'] = cached['last_modified']
+        self.headers = headers
+        response = super(ConditionalRequestsMixin, self).getresponse()
+        if response.status == 304 and cached:
+            REQUESTS.labels(result=NOT_MODIFIED).inc()
+            # The GC expires files by when they were written; a response
+            # still in use must not expire.
+            store.renew(key)
+            # Keep the fresh rate limit headers of the 304.
+            headers = dict(cached['headers'])
+            headers.update(_lower(response.headers))
+            return CachedResponse(cached['status'], headers, cached['body'])
+        response_headers = _lower(response.headers)
+        if response.status == 200 and (response_headers.get('etag') or
+                                       response_headers.get('last-modified')):
+            store.cache(key, (calendar.timegm(time.gmtime()), {
+                'status': response.status,
+                'headers': response_headers,
+                'body': response.text,
+                'etag': response_headers.get('etag'),
+                'last_modified': response_headers.get('last-modified'),
+            }))
+            REQUESTS.labels(result=STORED).inc()
+        else:
+            REQUESTS.labels(result=UNCACHED).inc()
+        return response
+
+    def _cache_key(self):
+        authorization = self.headers.get('Authorization') or ""
+        return "%s://%s:%s%s|%s|%s" % (
+            self.protocol, self.host, self.port, self.url,
+            self.headers.get('Accept') or "",
+            hashlib.sha1(authorization.encode('utf-8')).hexdigest())
+
+
+class ConditionalHTTPConnection(ConditionalRequestsMixin,
+                                Requester.HTTPRequestsConnectionClass):
+    pass
+
+
+class ConditionalHTTPSConnection(ConditionalRequestsMixin,
+                                 Requester.HTTPSRequestsConnectionClass):
+    pass
+
+
+def _lower(headers):
+    return dict((name.lower(), value) for name, value in headers.items())
+
+
+def get_session():
+    """Return the requests session of this process."""
+    global _session
+    if _session_owner.claim() or _session is None:
+        _session = requests.Session()
+    return _session
+
+
+def install(cache_dir=None):
+    """Send PyGithub's requests through the HTTP cache in cache_dir.
+
+    cache_dir defaults to the [github] http_cache_dir option. Returns
+    False, leaving PyGithub unchanged, when neither is set.
+    """
+    global _store, _store_dir
+    cache_dir = cache_dir or config.safe_get_config("github",
+                                                    "http_cache_dir")
+    if not cache_dir:
+        return False
+    if _store is not None and _store_dir == cache_dir:
+        return True
+    _store_dir = cache_dir
+    _store = FileSystemBackingStore(
+        MAX_AGE, cache_root=cache_dir,
+        max_bytes=config.safe_get_config("github", "http_cache_max_bytes"),
+        gc_interval=config.safe_get_config("cache",
+                                           "filesystem_gc_interval"))
+    _store.bind("github_http")
+    Requester.Requester.injectConnectionClasses(ConditionalHTTPConnection,
+                                                ConditionalHTTPSConnection)
+    logger.info("Caching GitHub API responses in %s", cache_dir)
+    return True
+
+
+def installed():
+    """Whether PyGithub's requests go through the HTTP cache."""
+    return _store is not None
+
+
+def uninstall():
+    global _store, _store_dir
+    _store = _store_dir = None
+    Requester.Requester.resetConnectionClasses()
@@ -0,0 +1,110 @@
+import time
+
+from eventlet import semaphore
+from github import GithubException
+
+from fusion.openstack.common import log as logging
+
+logger = logging.getLogger(__name__)
+
+INDEXES = {}
+
+
+class RepositoryIndex(object):
+    """Map repository ids of a user or organization to their repos.
+
+    Each entry holds the repo's id, name, default branch and pushed_at
+    time, and the repo object itself so templates can be read from it
+    without further lookups. get_owner is called once to find the owner.
+
+    The index is brought up to date at most every interval seconds by
+    listing repos most recently pushed first and stopping at the first
+    known repo that has not been pushed since; a listing usually costs a
+    single page. Every full_interval seconds it is rebuilt from a complete
+    listing instead, which also drops deleted and picks up renamed repos.
+    """
+
+    def __init__(self, get_owner, interval=300, full_interval=3600):
+        self._get_owner = get_owner
+        self._owner = None
+        self._interval = interval or 0
+        self._full_interval = full_interval or 0
+        self._entries = {}
+        self._checked_at = None
+        self._built_at = None
+        self._lock = semaphore.Semaphore()
+
+    def get(self, repo_id):
+        """Return the entry for repo_id, or None for an unknown id."""
+        self.refresh_if_due()
+        return self._entries.get(str(repo_id))
+
+    def entries(self):
+        """Return every entry, oldest repo first."""
+        self.refresh_if_due()
+        return sorted(self._entries.itervalues(),
+                      key=lambda entry: int(entry['id']))
+
+    def refresh_if_due(self):
+        if not self._due():
+            return
+        with self._lock:
+            # Another greenthread may have refreshed while we waited.
+            if self._due():
+                self.refresh()
+
+    def refresh(self):
+        now = time.time()
+        full = (self._built_at is None or
+                now - self._built_at >= self._full_interval)
+        self._checked_at = now
+        try:
+            if self._owner is None:
+                self._owner = self._get_owner()
+            if self._owner is None:
+                return
+            entries = self._list(full)
+        except GithubException:
+            logger.error("Error listing template repositories",
+                         exc_info=True)
+            return
+        self._entries = entries
+        if full:
+            self._built_at = now
+        logger.debug("%s repository index now has %d repos",
+                     "Rebuilt" if full else "Updated", len(entries))
+
+    def _list(self, full):
+        entries = {} if full else dict(self._entries)
+        newest = None if full else max(
+            [entry['pushed_at'] for entry in entries.itervalues()
+             if entry['pushed_at'] is not None] or [None])
+        for repo in self._owner.get_repos(sort="pushed", direction="desc"):
+            entry = self._entry(repo)
+            if (newest is not None and entry['id'] in entries and
+                    entry['pushed_at'] is not None and
+                    entry['pushed_at'] <= newest):
+                break
+            entries[entry['id']] = entry
+        return entries
+
+    def _due(self):
+        return (self._checked_at is None or
+                time.time() - self._checked_at >= self._interval)
+
+    @staticmethod
+    def _entry(repo):
+        return {'id': str(repo.id),
+                'name': repo.name,
+                'default_branch': repo.default_branch,
+                'pushed_at': repo.pushed_at,
+                'repo': repo}
+
+
+def get_index(key, get_owner, interval=None, full_interval=None):
+    """Return the process-wide index for key, creating it if needed."""
+    key = tuple(key)
+    if key not in INDEXES:
+        INDEXES[key] = RepositoryIndex(get_owner, interval=interval,
+                                       full_interval=full_interval)
+    return INDEXES[key]
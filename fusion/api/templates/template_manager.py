@@ -1,17 +1,29 @@
 import base64
+import tarfile
 import yaml
+import zlib
 
 from eventlet import greenpool
 import github
 from github import GithubException
+import requests
+from requests.packages.urllib3 import exceptions as urllib3_exceptions
 
+from fusion.api.templates import http_cache
+from fusion.api.templates import repo_index
 from fusion.common import cache
-from fusion.common.cache_backing_store import MEMCACHE
+from fusion.common import cache_warmer
+from fusion.common.cache_snapshot import CacheSnapshot
+from fusion.common import config
+from fusion.common.cache_backing_store import CONFIGURED
+from fusion.common.memory_store import MemoryStore
 from fusion.openstack.common import log as logging
 
 logger = logging.getLogger(__name__)
 
-TEMPLATES = {}
+TEMPLATES = MemoryStore.from_config()
+WARM_CONCURRENCY = 10
+ARCHIVE_TIMEOUT = 30
 
 
 class TemplateManager(object):
@@ -45,6 +57,7 @@ class GithubManager(TemplateManager):
         self._template_file = self._github_options.template_file
 
     def get_client(self):
+        http_cache.install()
         return github.Github(login_or_token=self._github_options.username,
                              password=self._github_options.password,
                              base_url=self._github_options.api_base,
@@ -56,11 +69,27 @@ class GithubManager(TemplateManager):
     def __repr__(self):
         return self.__str__()
 
+    def cache_key(self):
+        return [self._github_options.api_base, self._repo_org]
+
     def get_catalog(self):
         tag = self._github_options.default_version
         return TemplateCatalog(self.get_templates([tag], False))
 
-    @cache.Cache(store=TEMPLATES, backing_store=MEMCACHE)
+    def warm_cache(self):
+        """Populate the template caches for the default version."""
+        ref = self._github_options.default_version
+        for with_meta in (False, True):
+            templates = self.get_templates([ref], with_meta)
+            pile = greenpool.GreenPile(WARM_CONCURRENCY)
+            for template in templates:
+                pile.spawn(self.get_template, template['id'], ref,
+                           with_meta)
+            list(pile)
+
+    @cache.Cache(store=TEMPLATES, backing_store=CONFIGURED,
+                 namespace="templates",
+                 key_args=("self", "refs", "with_meta"))
     def get_templates(self, refs, with_meta):
         """
         Gets all templates owned by self._repo_org organization
@@ -69,8 +98,7 @@ class GithubManager(TemplateManager):
         :return:
         """
         templates = []
-        org = self._get_repo_owner()
-        repos = org.get_repos()
+        repos = [entry['repo'] for entry in self._repo_index().entries()]
         pool = greenpool.GreenPile()
         for ref in refs:
             for repo in repos:
@@ -80,51 +108,120 @@ class GithubManager(TemplateManager):
                 templates.append(result)
         return templates
 
-    @cache.Cache(store=TEMPLATES, backing_store=MEMCACHE)
+    @cache.Cache(store=TEMPLATES, backing_store=CONFIGURED,
+                 namespace="templates",
+                 key_args=("self", "template_id", "ref", "with_meta"))
     def get_template(self, template_id, ref, with_meta):
-        try:
-            org = self._get_repo_owner()
-            repos = org.get_repos()
-            template_repo = None
-            for repo in repos:
-                if str(repo.id) == str(template_id):
-                    template_repo = repo
-                    break
-            if template_repo:
-                return self._get_template(template_repo, ref, with_meta)
-        except GithubException:
-            logger.error("Unexpected error getting template from repo %s",
-                         repo.clone_url, exc_info=True)
+        entry = self._repo_index().get(template_id)
+        if entry is None:
+            logger.debug("No repository with id %s in %s", template_id,
+                         self._repo_org)
+            return None
+        return self._get_template(entry['repo'], ref, with_meta)
 
     def _get_template(self, repo, ref, with_meta):
         try:
-            template = self._get_file_from_repo(repo, ref, self._template_file)
+            file_names = [self._template_file]
+            if with_meta:
+                file_names.append(self._metadata_file)
+            files = self._get_files(repo, ref, file_names)
+            template = files[self._template_file]
             if template:
                 template.update({
                     'id': str(repo.id),
                     'version': ref
                 })
                 if with_meta:
-                    metadata = self._get_file_from_repo(repo, ref,
-                                                        self._metadata_file)
-                    template.update(metadata)
+                    template.update(files[self._metadata_file])
                 return template
         except GithubException:
             logger.error("Unexpected error getting template from repo %s",
                          repo.clone_url, exc_info=True)
         return None
 
+    def _get_files(self, repo, ref, file_names):
+        """Return a dict of the parsed YAML files of repo at ref.
+
+        Several files are read from one tarball of the repo, which costs
+        a single API call; a single file, or files the tarball could not
+        provide, are read through the contents API. Missing files map to
+        {}. With the HTTP cache installed the contents API is always
+        used: its unchanged files are revalidated for free, while the
+        tarball would be downloaded again every time.
+        """
+        if len(file_names) > 1 and not http_cache.installed():
+            files = self._get_files_from_archive(repo, ref, file_names)
+            if files is not None:
+                return files
+        return dict((file_name, self._get_file_from_repo(repo, ref,
+                                                         file_name))
+                    for file_name in file_names)
+
+    def _get_files_from_archive(self, repo, ref, file_names):
+        """Read file_names from the tarball of repo at ref, or None."""
+        max_bytes = config.safe_get_config("github", "archive_max_bytes")
+        files = {}
+        try:
+            url = repo.get_archive_link("tarball", ref)
+            response = http_cache.get_session().get(url, stream=True,
+                                                    timeout=ARCHIVE_TIMEOUT)
+            try:
+                response.raise_for_status()
+                stream = LimitedReader(response.raw, max_bytes)
+                archive = tarfile.open(fileobj=stream, mode="r|gz")
+                for member in archive:
+                    # Members are below a "<owner>-<repo>-<sha>/" directory.
+                    path = member.name.split("/", 1)[-1]
+                    if path in file_names and member.isfile():
+                        files[path] = self._load_yaml(
+                            repo, archive.extractfile(member).read())
+                        if len(files) == len(file_names):
+                            break
+            finally:
+                response.close()
+        # Reading response.raw raises urllib3's errors, not requests', when
+        # the download breaks off.
+        except (GithubException, requests.RequestException,
+                urllib3_exceptions.HTTPError, tarfile.TarError, zlib.error,
+                IOError, EOFError):
+            logger.warn("Could not read the archive of repo %s at %s; "
+                        "falling back to the contents API", repo.clone_url,
+                        ref, exc_info=True)
+            return None
+        for file_name in file_names:
+            files.setdefault(file_name, {})
+        return files
+
+    @classmethod
+    def _get_file_from_repo(cls, repo, ref, file_name):
+        encoded_file = repo.get_file_contents(file_name, ref=ref)
+        if not encoded_file:
+            return {}
+        content = encoded_file.content
+        if not content and encoded_file.size:
+            # The contents API leaves files over 1 MB empty; the blob API
+            # serves them.
+            content = repo.get_git_blob(encoded_file.sha).content
+        if not content:
+            return {}
+        return cls._load_yaml(repo, base64.b64decode(content))
+
     @staticmethod
-    def _get_file_from_repo(repo, ref, file_name):
+    def _load_yaml(repo, file_content):
         try:
-            encoded_file = repo.get_file_contents(file_name, ref=ref)
-            if encoded_file and encoded_file.content:
-                file_content = base64.b64decode(encoded_file.content)
-                return yaml.load(file_content)
+            return yaml.load(file_content) or {}
         except (yaml.scanner.ScannerError, yaml.parser.ParserError):
             logger.warn("Template '%s' has invalid YAML", repo.clone_url)
         return {}
 
+    def _repo_index(self):
+        """Return the id to repo index of self._repo_org."""
+        return repo_index.get_index(
+            self.cache_key(), self._get_repo_owner,
+            interval=config.safe_get_config("github", "repo_index_interval"),
+            full_interval=config.safe_get_config("github",
+                                                 "repo_index_full_interval"))
+
     def _get_repo_owner(self):
         """Return the user or organization owning the repo."""
         if self._repo_org:
@@ -138,3 +235,35 @@ class GithubManager(TemplateManager):
                 except GithubException:
                     logger.warn("Could not find user or org %s.",
                                 self._repo_org)
+
+
+class LimitedReader(object):
+    """File-like wrapper failing once more than max_bytes were read."""
+
+    def __init__(self, stream, max_bytes=None):
+        self._stream = stream
+        self._max_bytes = max_bytes
+        self._read = 0
+
+    def read(self, size=-1):
+        data = self._stream.read(size)
+        self._read += len(data)
+        if self._max_bytes and self._read > self._max_bytes:
+            raise IOError("Archive is larger than %d bytes" %
+                          self._max_bytes)
+        return data
+
+
+def create_warmer(options):
+    """Return a CacheWarmer for the template caches, or None if disabled."""
+    if not config.safe_get_config("cache", "warm_on_start"):
+        return None
+    manager = GithubManager(options)
+    return cache_warmer.CacheWarmer(
+        [manager.warm_cache],
+        interval=config.safe_get_config("cache", "warm_interval"))
+
+
+def create_snapshot():
+    """Return a CacheSnapshot of TEMPLATES, or None if disabled."""
+    return CacheSnapshot.from_config(TEMPLATES)
@@ -1,5 +1,6 @@
 import routes
 
+from fusion.api.v1 import cache_admin
 from fusion.api.v1 import templates
 from fusion.api.v1 import heat_wrapper
 from fusion.common import wsgi
@@ -25,6 +26,34 @@ class API(wsgi.Router):
                                     action="get_template",
                                     conditions={'method': 'GET'})
 
+        cache_admin_resource = cache_admin.create_resource(conf)
+        with mapper.submapper(controller=cache_admin_resource,
+                              path_prefix="/cache") as cache_mapper:
+            cache_mapper.connect("cache_keys",
+                                 "/keys",
+                                 action="get_keys",
+                                 conditions={'method': 'GET'})
+            cache_mapper.connect("cache_key",
+                                 "/keys/{key}",
+                                 action="get_key",
+                                 conditions={'method': 'GET'})
+            cache_mapper.connect("cache_key_purge",
+                                 "/keys/{key}",
+                                 action="delete_key",
+                                 conditions={'method': 'DELETE'})
+            cache_mapper.connect("cache_namespace_purge",
+                                 "/namespaces/{namespace}",
+                                 action="delete_namespace",
+                                 conditions={'method': 'DELETE'})
+            cache_mapper.connect("cache_warm",
+                                 "/warm",
+                                 action="warm",
+                                 conditions={'method': 'POST'})
+            cache_mapper.connect("cache_stats",
+                                 "/stats",
+                                 action="get_stats",
+                                 conditions={'method': 'GET'})
+
         heat_wrapper_resource = heat_wrapper.create_resource(conf)
         with mapper.submapper(
                 controller=heat_wrapper_resource,
@@ -0,0 +1,178 @@
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+"""
+Cache administration endpoint for fusion v1 ReST API.
+"""
+
+import hmac
+import os
+
+import eventlet
+from webob import exc
+
+from fusion.common import cache
+from fusion.common import cache_warmer
+from fusion.common import circuit_breaker
+from fusion.common.cache_backing_store import TieredBackingStore
+from fusion.common import config
+from fusion.common import refresh_executor
+from fusion.common import wsgi
+from fusion.openstack.common import log as logging
+
+logger = logging.getLogger(__name__)
+
+TOKEN_HEADER = "X-Cache-Admin-Token"
+
+
+class CacheAdminController(object):
+    """
+    WSGI controller for the cache administration resource
+
+    Every action requires the [cache] admin_token in the
+    X-Cache-Admin-Token header. Listing and stats describe the worker
+    serving the request; purges reach every worker through the
+    invalidation bus.
+    """
+
+    def __init__(self, options):
+        self._options = options
+
+    def get_keys(self, req):
+        """
+        Lists the in-process cache entries of this worker
+        """
+        denied = self._deny(req)
+        if denied:
+            return denied
+        namespace = req.params.get('namespace')
+        seen = set()
+        keys = []
+        for _cache in self._caches(namespace):
+            for entry in _cache.entries():
+                if (entry['key'], entry['tier']) not in seen:
+                    seen.add((entry['key'], entry['tier']))
+                    entry['namespace'] = _cache.namespace
+                    keys.append(entry)
+        return {"keys": sorted(keys, key=lambda entry: entry['key']),
+                "pid": os.getpid()}
+
+    def get_key(self, req, key):
+        """
+        Shows which tiers hold a key
+        """
+        denied = self._deny(req)
+        if denied:
+            return denied
+        caches = self._owners(key)
+        if not caches:
+            return exc.HTTPNotFound()
+        tiers = set(entry['tier'] for _cache in caches
+                    for entry in _cache.entries() if entry['key'] == key)
+        for _cache in caches:
+            store = _cache.backing_store
+            if not store:
+                continue
+            stores = (store.tiers if isinstance(store, TieredBackingStore)
+                      else [store])
+            for tier in stores:
+                if tier.lookup(key).found:
+                    tiers.add(tier.__class__.__name__)
+        return {"key": key, "tiers": sorted(tiers)}
+
+    def delete_key(self, req, key):
+        """
+        Purges a key from every tier and worker
+        """
+        denied = self._deny(req)
+        if denied:
+            return denied
+        caches = self._owners(key)
+        if not caches:
+            return exc.HTTPNotFound()
+        for _cache in caches:
+            _cache.delete(key)
+        logger.info("Purged cache key %s", key)
+        return {"purged": key}
+
+    def delete_namespace(self, req, namespace):
+        """
+        Purges a namespace from every tier and worker
+        """
+        denied = self._deny(req)
+        if denied:
+            return denied
+        caches = list(self._caches(namespace))
+        if not caches:
+            return exc.HTTPNotFound()
+        # Caches sharing a namespace share its generation; bump it once.
+        caches[0].purge()
+        for _cache in caches[1:]:
+            _cache.on_invalidation({'prefix': _cache.namespace_prefix})
+        return {"purged": namespace}
+
+    def warm(self, req):
+        """
+        Starts a warm-up of this worker's caches
+        """
+        denied = self._deny(req)
+        if denied:
+            return denied
+        eventlet.spawn_n(cache_warmer.warm_all)
+        return exc.HTTPAccepted()
+
+    def get_stats(self, req):
+        """
+        Reports hit, miss and stale ratios per cached function, along
+        with refresh, warmer and circuit breaker state
+        """
+        denied = self._deny(req)
+        if denied:
+            return denied
+        return {"stats": {
+            "pid": os.getpid(),
+            "functions": [_cache.report() for _cache in self._caches()],
+            "refresh": refresh_executor.get_executor().metrics(),
+            "warmers": cache_warmer.stats(),
+            "breakers": circuit_breaker.stats(),
+        }}
+
+    @staticmethod
+    def _caches(namespace=None):
+        return [_cache for _cache in list(cache.CACHES)
+                if namespace is None or _cache.namespace == namespace]
+
+    @classmethod
+    def _owners(cls, key):
+        return [_cache for _cache in cls._caches()
+                if key.startswith(_cache.namespace_prefix)]
+
+    @staticmethod
+    def _deny(req):
+        """Return an error response unless req carries the admin token."""
+        token = config.safe_get_config("cache", "admin_token")
+        if not token:
+            return exc.HTTPForbidden("The cache admin API is disabled")
+        supplied = req.headers.get(TOKEN_HEADER) or ""
+        if not hmac.compare_digest(str(supplied), str(token)):
+            return exc.HTTPUnauthorized()
+        return None
+
+
+def create_resource(options):
+    """
+    Cache admin resource factory method.
+    """
+    deserializer = wsgi.JSONRequestDeserializer()
+    serializer = wsgi.JSONResponseSerializer()
+    return wsgi.Resource(CacheAdminController(options), deserializer,
+                         serializer)
@@ -1,10 +1,22 @@
 import time
 import calendar
+import math
+import random
+import weakref
+from timeit import default_timer
 
 import eventlet
-from eventlet.green import threading
+from eventlet import event
 
 from fusion.common.cache_backing_store import BackingStore
+from fusion.common.cache_backing_store import CacheEntry, MISSING
+from fusion.common.cache_backing_store import STORED_BYTES
+from fusion.common.cache_key import KeyBuilder
+from fusion.common import invalidation
+from fusion.common.memory_store import estimate_size, MemoryStore
+from fusion.common import metrics
+from fusion.common import refresh_executor
+from fusion.common.write_behind import WriteBehindQueue
 from fusion.common import config
 from fusion.openstack.common import log as logging
 from oslo.config import cfg
@@ -12,112 +24,602 @@ from oslo.config import cfg
 
 logger = logging.getLogger(__name__)
 
-BACKGROUND_REFRESH = {}
+REFRESH_BACKOFF = {}
+IN_FLIGHT = {}
+# Purge generation of each namespace prefix and when it was last read
+# from the backing store.
+GENERATIONS = {}
+GENERATION_CHECK_INTERVAL = 60
+
+CACHES = weakref.WeakSet()
+
+MEMORY = "memory"
+NEGATIVE = "negative"
+MISS = "miss"
+
+HITS = metrics.Counter(
+    "fusion_cache_hits_total",
+    "Fresh values served, by the tier that held them.", ("function", "tier"))
+STALE = metrics.Counter(
+    "fusion_cache_stale_total",
+    "Expired values found, by the tier that held them.",
+    ("function", "tier"))
+MISSES = metrics.Counter(
+    "fusion_cache_misses_total",
+    "Lookups that found no value in any tier.", ("function",))
+LOOKUP_SECONDS = metrics.Histogram(
+    "fusion_cache_backing_store_lookup_seconds",
+    "Backing store lookup time, by the tier that answered.",
+    ("function", "tier"))
+REFRESH_SECONDS = metrics.Histogram(
+    "fusion_cache_refresh_seconds",
+    "Time taken to compute a value.", ("function",))
+REFRESH_FAILURES = metrics.Counter(
+    "fusion_cache_refresh_failures_total",
+    "Value computations that raised.", ("function",))
 
 
 class Cache(object):
-    def __init__(self, timeout=None, backing_store=None, store=None):
+    def __init__(self, timeout=None, backing_store=None, store=None,
+                 wait_timeout=None, stale_grace=None, max_stale=None,
+                 namespace=None, key_args=None, key_version=1,
+                 write_behind=None,
+                 invalidation_bus=invalidation.CONFIGURED,
+                 early_refresh_beta=None, executor=None,
+                 negative_timeout=None, negative_max_entries=None):
         self._max_age = self.__default_timeout() if not timeout else timeout
+        self._wait_timeout = self.__config("single_flight_timeout",
+                                           wait_timeout)
+        self._stale_grace = self.__config("stale_grace", stale_grace)
+        self._max_stale = self.__config("max_stale", max_stale)
+        self._early_refresh_beta = self.__config("early_refresh_beta",
+                                                 early_refresh_beta)
         self._store = {} if store is None else store
-        self._backing_store = BackingStore.create(backing_store,
-                                                  self._max_age)
+        if isinstance(self._store, MemoryStore):
+            # A store shared by several caches must keep entries for the
+            # longest any of them serves stale.
+            self._store.retain(max(
+                self._max_age + (self._stale_grace or 0),
+                self._max_stale or 0))
+        self._refresh_executor = executor
+        self.name = None
+        # None results are kept apart from the values, for a shorter time
+        # and in a bounded store, so unknown keys cannot fill memory.
+        self._negative_timeout = self.__config("negative_timeout",
+                                               negative_timeout)
+        self._negative = None
+        if self._negative_timeout:
+            self._negative = MemoryStore(
+                max_entries=self.__config("negative_max_entries",
+                                          negative_max_entries),
+                ttl=self._negative_timeout,
+                sweep_interval=self._negative_timeout)
+        self._key_builder = KeyBuilder(namespace=namespace,
+                                       key_args=key_args,
+                                       version=key_version)
+        self._backing_store = BackingStore.create(
+            backing_store, self._max_age, stale_grace=self._stale_grace,
+            max_stale=self._max_stale)
+        self._bus = None
+        if self._backing_store:
+            self._bus = invalidation.get_bus(invalidation_bus)
+        if self._bus:
+            self._bus.subscribe(self.on_invalidation)
+        self._write_behind = None
+        if self._backing_store and self.__config("write_behind",
+                                                 write_behind):
+            self._write_behind = WriteBehindQueue(
+                self._backing_store,
+                config.safe_get_config("cache", "write_behind_queue_size"),
+                on_write=self.broadcast)
 
-    def expired(self, key):
-        if key in self._store:
-            birthday, data = self._store[key]
-            age = calendar.timegm(time.gmtime()) - birthday
-            return age >= self._max_age
-        elif self._backing_store:
-            birthday, value = self._backing_store.retrieve(key)
-            if value:
-                age = calendar.timegm(time.gmtime()) - birthday
-                return age >= self._max_age
-        return None
+    def lookup(self, key):
+        """Return the CacheEntry for key from memory or the backing store.
 
-    def exists(self, key):
+        Backing store hits are promoted into the in-process store.
+        """
+        if self._bus:
+            self._bus.ensure_listener()
         if key in self._store:
-            return True
-        else:
-            if self._backing_store:
-                return self._backing_store.exists(key)
-        return False
+            logger.debug("[%s] Cache hit for key %s",
+                         self.__class__.__name__, key)
+            return CacheEntry.from_stored(self._store[key], MEMORY)
+        if self._backing_store:
+            started = default_timer()
+            entry = self._backing_store.lookup(key)
+            LOOKUP_SECONDS.labels(function=self.name,
+                                  tier=entry.tier or MISS).observe(
+                default_timer() - started)
+            if entry.found:
+                logger.debug("[%s] Cache hit for key %s",
+                             self._backing_store.__class__.__name__, key)
+                self.remember(key, entry.stored())
+            return entry
+        return MISSING
+
+    def in_backoff(self, key):
+        backoff = REFRESH_BACKOFF.get(key)
+        return (backoff is not None and
+                calendar.timegm(time.gmtime()) < backoff['retry_at'])
 
     def start_background_refresh(self, key, func, args, kwargs):
-        background_stats = BACKGROUND_REFRESH.get(key, {})
-        background_thread = background_stats.get('background_thread')
-        refresh_lock = background_stats.get('refresh_lock', threading.Lock())
-        if background_thread is None and refresh_lock.acquire(False):
-            try:
-                background_thread = eventlet.spawn_n(
-                    self.refresh_cache, key, func, args, kwargs)
-                logger.debug("Refreshing cache for key %s", key)
-            except StandardError:
-                background_thread = None
-                logger.error("Error initiating cache refresh", exc_info=True)
-            finally:
-                refresh_lock.release()
-                background_stats.update({
-                    'background_thread': background_thread,
-                    'refresh_lock': refresh_lock
-                })
-                BACKGROUND_REFRESH[key] = background_stats
+        if self.in_backoff(key):
+            logger.debug("Cache refresh for key %s is backing off after "
+                         "failures", key)
+        elif self.refresh_executor.submit(key, self.background_refresh, key,
+                                          func, args, kwargs):
+            logger.debug("Queued cache refresh for key %s", key)
         else:
-            logger.debug("Cache refresh for key %s is already in progress",
+            logger.debug("Cache refresh for key %s is already pending",
                          key)
 
-    def refresh_cache(self, key, func, args, kwargs):
-        result = func(*args, **kwargs)
-        self.update_cache(key, result)
-        if BACKGROUND_REFRESH.get(key):
-            BACKGROUND_REFRESH.get(key)['background_thread'] = None
+    @property
+    def refresh_executor(self):
+        if self._refresh_executor is None:
+            return refresh_executor.get_executor()
+        return self._refresh_executor
+
+    def refresh_cache(self, key, func, args, kwargs, lease=None):
+        started = default_timer()
+        try:
+            result = func(*args, **kwargs)
+        except Exception:
+            REFRESH_FAILURES.labels(function=self.name).inc()
+            self.record_refresh_failure(key)
+            raise
+        REFRESH_BACKOFF.pop(key, None)
+        delta = round(default_timer() - started, 3)
+        REFRESH_SECONDS.labels(function=self.name).observe(delta)
+        if result is None and self._negative is not None:
+            self.cache_negative(key)
+        else:
+            self.update_cache(key, result, delta=delta, lease=lease)
         logger.debug("Cache refreshed for key %s", key)
         return result
 
+    def background_refresh(self, key, func, args, kwargs):
+        lease = None
+        if self._backing_store:
+            lease = self._backing_store.acquire_lease(
+                key, self.__config("refresh_lease_ttl", None) or 60)
+            if lease is None:
+                self.defer_refresh(key)
+                return
+        try:
+            self.refresh_cache(key, func, args, kwargs, lease=lease)
+        except Exception:
+            logger.warn("Background refresh failed for key %s; serving "
+                        "stale value", key, exc_info=True)
+        finally:
+            if lease is not None:
+                self._backing_store.release_lease(key, lease)
+
+    def defer_refresh(self, key):
+        """Leave key to the process holding its refresh lease.
+
+        A fresher value already written by that process is promoted into
+        memory; otherwise the stale value keeps being served and this
+        process checks again after refresh_lease_retry seconds.
+        """
+        entry = self._backing_store.lookup(key)
+        now = calendar.timegm(time.gmtime())
+        if entry.found and now - entry.birthday < self._max_age:
+            self.remember(key, entry.stored())
+            logger.debug("Picked up key %s refreshed by another process",
+                         key)
+            return
+        retry = self.__config("refresh_lease_retry", None) or 1
+        REFRESH_BACKOFF[key] = {'failures': 0, 'retry_at': now + retry}
+        logger.debug("Key %s is being refreshed by another process; "
+                     "checking again in %ss", key, retry)
+
+    def record_refresh_failure(self, key):
+        """Back off exponentially before the next refresh of key."""
+        backoff = REFRESH_BACKOFF.setdefault(key, {'failures': 0})
+        backoff['failures'] += 1
+        base = config.safe_get_config("cache", "refresh_backoff") or 1
+        limit = config.safe_get_config("cache", "refresh_backoff_max")
+        delay = base * 2 ** (backoff['failures'] - 1)
+        if limit:
+            delay = min(delay, limit)
+        backoff['retry_at'] = calendar.timegm(time.gmtime()) + delay
+        logger.debug("Refresh of key %s failed %d time(s); retrying in %ss",
+                     key, backoff['failures'], delay)
+
+    def revalidate(self, key, func, args, kwargs, entry, age):
+        """Refresh an entry that is past its stale grace window.
+
+        The last good value keeps being served while refreshes fail or are
+        backing off, until it is max_stale seconds old.
+        """
+        if self.in_backoff(key) and age < self._max_stale:
+            return entry.value
+        try:
+            return self.load(key, func, args, kwargs)
+        except Exception:
+            if age < self._max_stale:
+                logger.warn("Refresh failed for key %s; serving value that "
+                            "is %ss old", key, age, exc_info=True)
+                return entry.value
+            raise
+
+    def load(self, key, func, args, kwargs):
+        """Compute a missing key once and share it with concurrent callers.
+
+        The first caller for a key runs func; callers arriving while that
+        computation is in flight wait up to wait_timeout seconds for its
+        result (or exception) instead of starting their own.
+        """
+        pending = IN_FLIGHT.get(key)
+        if pending is not None:
+            logger.debug("Waiting for in-flight load of key %s", key)
+            with eventlet.Timeout(self._wait_timeout, False):
+                return pending.wait()
+            logger.warn("Timed out after %ss waiting for in-flight load of "
+                        "key %s", self._wait_timeout, key)
+            return self.refresh_cache(key, func, args, kwargs)
+
+        pending = event.Event()
+        IN_FLIGHT[key] = pending
+        try:
+            result = self.refresh_cache(key, func, args, kwargs)
+        except Exception as exc:
+            pending.send_exception(exc)
+            raise
+        else:
+            pending.send(result)
+            return result
+        finally:
+            if IN_FLIGHT.get(key) is pending:
+                del IN_FLIGHT[key]
+
     def __call__(self, func):
         if not self.caching_enabled():
             return func
+        self._key_builder.bind(func)
+        self.name = func.__name__
+        if self._backing_store:
+            self._backing_store.bind(self.name)
+        CACHES.add(self)
 
         def wrapped_f(*args, **kwargs):
             key = self.get_hash(func.__name__, *args, **kwargs)
-            if self.exists(key):
-                if self.expired(key):
-                    self.start_background_refresh(key, func, args, kwargs)
-                result = self.get(key)
-            else:
-                result = self.refresh_cache(key, func, args, kwargs)
-            return result
+            if self.negative_hit(key):
+                return None
+            return self.serve(key, self.lookup(key), func, args, kwargs)
+
+        def get_many(arg_list, **kwargs):
+            return self.get_many(func, arg_list, **kwargs)
 
+        wrapped_f.get_many = get_many
         return wrapped_f
 
+    def serve(self, key, entry, func, args, kwargs):
+        """Return the value for a looked up entry, refreshing as needed."""
+        if not entry.found:
+            MISSES.labels(function=self.name).inc()
+            return self.load(key, func, args, kwargs)
+        age = calendar.timegm(time.gmtime()) - entry.birthday
+        tier = entry.tier or MEMORY
+        if age < self._max_age:
+            HITS.labels(function=self.name, tier=tier).inc()
+            if self.refresh_early(entry, age):
+                logger.debug("Refreshing key %s %ss before it expires", key,
+                             self._max_age - age)
+                self.start_background_refresh(key, func, args, kwargs)
+            return entry.value
+        STALE.labels(function=self.name, tier=tier).inc()
+        if age < self._max_age + self._stale_grace:
+            self.start_background_refresh(key, func, args, kwargs)
+            return entry.value
+        return self.revalidate(key, func, args, kwargs, entry, age)
+
+    def negative_hit(self, key):
+        """Whether key recently computed to None."""
+        if self._negative is None:
+            return False
+        negative = self._negative.get(key)
+        if negative is None:
+            return False
+        age = calendar.timegm(time.gmtime()) - negative[0]
+        if age < self._negative_timeout:
+            logger.debug("Negative cache hit for key %s", key)
+            HITS.labels(function=self.name, tier=NEGATIVE).inc()
+            return True
+        del self._negative[key]
+        return False
+
+    def cache_negative(self, key):
+        self._negative[key] = (calendar.timegm(time.gmtime()), None)
+        logger.debug("Cached missing result for key %s for %ss", key,
+                     self._negative_timeout)
+        if self._store.pop(key, None) is None:
+            # Nothing was cached; unknown keys must not cost a delete in
+            # every tier and a message to every worker.
+            return
+        # Neither the backing store nor other workers may keep serving the
+        # value the function no longer returns.
+        if self._write_behind:
+            self._write_behind.discard(key)
+        if self._backing_store:
+            self._backing_store.delete(key)
+        self.broadcast([key])
+
+    def refresh_early(self, entry, age):
+        """Decide whether to refresh a fresh entry ahead of expiry (XFetch).
+
+        An entry that took delta seconds to compute is refreshed once
+        age + delta * early_refresh_beta * -ln(random()) reaches max_age.
+        The chance rises as expiry nears and with the cost of the entry,
+        so one reader of a busy key usually refreshes it before any reader
+        sees it expire. Disabled when the beta is 0 or delta is unknown.
+        """
+        if not self._early_refresh_beta or not entry.delta:
+            return False
+        gap = -entry.delta * self._early_refresh_beta * math.log(
+            1.0 - random.random())
+        return age + gap >= self._max_age
+
+    def lookup_many(self, keys):
+        """Look up many keys with at most one backing store call.
+
+        Returns a dict mapping every key to its CacheEntry.
+        """
+        if self._bus:
+            self._bus.ensure_listener()
+        entries = {}
+        missing = []
+        for key in keys:
+            if key in self._store:
+                entries[key] = CacheEntry.from_stored(self._store[key],
+                                                      MEMORY)
+            else:
+                missing.append(key)
+        if missing and self._backing_store:
+            found = self._backing_store.get_many(missing)
+            for key, entry in found.iteritems():
+                if entry.found:
+                    self.remember(key, entry.stored())
+            entries.update(found)
+        for key in missing:
+            entries.setdefault(key, MISSING)
+        return entries
+
+    def get_many(self, func, arg_list, **kwargs):
+        """Return func(*args, **kwargs) for every args tuple in arg_list.
+
+        Cached values are fetched together; only the misses call func.
+        """
+        calls = [(self.get_hash(func.__name__, *args, **kwargs), args)
+                 for args in arg_list]
+        negative = set(key for key, _ in calls if self.negative_hit(key))
+        entries = self.lookup_many([key for key, _ in calls
+                                    if key not in negative])
+        return [None if key in negative else
+                self.serve(key, entries[key], func, args, kwargs)
+                for key, args in calls]
+
     def caching_enabled(self):
         return 'cache' in cfg.CONF
 
     def get(self, key):
-        if key in self._store:
-            logger.debug("[%s] Cache hit for key %s",
-                         self.__class__.__name__, key)
-            _, data = self._store[key]
-            return data
-        elif self._backing_store:
-            birthday, value = self._backing_store.retrieve(key)
-            logger.debug("[%s] Cache hit for key %s",
-                         self._backing_store.__class__.__name__, key)
-            self._store[key] = (birthday, value)
-            return value
-        return None
+        return self.lookup(key).value
 
-    def update_cache(self, key, value):
-        birthday = calendar.timegm(time.gmtime())
-        self._store[key] = (birthday, value)
+    def remember(self, key, stored):
+        """Keep a stored tuple in the in-process store."""
+        self._store[key] = stored
+        if isinstance(self._store, MemoryStore):
+            size = self._store.size_of(key)
+        else:
+            size = estimate_size(stored)
+        STORED_BYTES.labels(function=self.name, tier=MEMORY).inc(size)
+
+    def update_cache(self, key, value, delta=0, lease=None):
+        stored = CacheEntry(value, calendar.timegm(time.gmtime()), True,
+                            delta).stored()
+        self.remember(key, stored)
+        self.forget_negative(key)
         logger.debug("[%s] Updated cache for key %s",
                      self.__class__.__name__, key)
-        if self._backing_store:
-            self._backing_store.cache(key, (birthday, value))
-            logger.debug("[%s] Updated cache for key %s",
+        if lease is not None:
+            # Written now, while the lease is held, rather than behind it;
+            # a lease lost mid-refresh may already have let another
+            # process write a newer value, so ours stays local.
+            if self._backing_store.cache_fenced(key, stored, lease):
+                self.broadcast([key])
+            else:
+                logger.warn("Lost refresh lease for key %s; not writing it "
+                            "to the backing store", key)
+        elif self._write_behind:
+            self._write_behind.put(key, stored)
+            logger.debug("[%s] Queued cache update for key %s",
                          self._backing_store.__class__.__name__, key)
+        elif self._backing_store:
+            # Other workers only drop their copy once they can read the new
+            # value; otherwise they would all miss and reload it.
+            if self._backing_store.cache(key, stored):
+                logger.debug("[%s] Updated cache for key %s",
+                             self._backing_store.__class__.__name__, key)
+                self.broadcast([key])
+
+    def set_many(self, values):
+        """Cache many key/value pairs with one backing store call."""
+        birthday = calendar.timegm(time.gmtime())
+        items = dict((key, (birthday, value))
+                     for key, value in values.iteritems())
+        for key, item in items.iteritems():
+            self.remember(key, item)
+            self.forget_negative(key)
+        if self._backing_store and self._backing_store.set_many(items):
+            self.broadcast(items.keys())
+
+    def broadcast(self, keys):
+        """Tell other workers to drop their in-memory copies of keys."""
+        if self._bus:
+            self._bus.publish({'keys': list(keys)})
+
+    def invalidate(self, *keys):
+        """Drop keys from memory here and in every other worker."""
+        for key in keys:
+            self._store.pop(key, None)
+            self.forget_negative(key)
+        self.broadcast(keys)
+
+    def delete(self, *keys):
+        """Remove keys from every tier, and from memory in every worker."""
+        for key in keys:
+            if self._write_behind:
+                self._write_behind.discard(key)
+            if self._backing_store:
+                self._backing_store.delete(key)
+        self.invalidate(*keys)
+
+    @property
+    def generation(self):
+        """The purge generation of this cache's namespace.
+
+        It is shared by every Cache using the namespace in this process
+        and re-read from the backing store at most every
+        GENERATION_CHECK_INTERVAL seconds.
+        """
+        prefix = self._key_builder.namespace_prefix()
+        generation, checked_at = GENERATIONS.get(prefix, (0, None))
+        now = calendar.timegm(time.gmtime())
+        if self._backing_store and (
+                checked_at is None or
+                now - checked_at >= GENERATION_CHECK_INTERVAL):
+            stored = self._backing_store.get_counter(
+                self._key_builder.generation_key())
+            if isinstance(stored, (int, long)):
+                generation = max(generation, stored)
+            GENERATIONS[prefix] = (generation, now)
+        return generation
+
+    def purge(self):
+        """Purge this cache's namespace from every tier and worker.
+
+        Memory is cleared directly. Backing stores cannot all enumerate
+        keys, so the namespace generation is bumped instead: every key is
+        built anew and entries of older generations are left to expire.
+        The generation itself is stored as a counter that never expires.
+        """
+        prefix = self._key_builder.namespace_prefix()
+        generation = self.generation + 1
+        now = calendar.timegm(time.gmtime())
+        GENERATIONS[prefix] = (generation, now)
+        if self._backing_store:
+            self._backing_store.set_counter(
+                self._key_builder.generation_key(), generation)
+        self.on_invalidation({'prefix': prefix})
+        if self._bus:
+            self._bus.publish({'prefix': prefix, 'generation': generation})
+        logger.info("Purged cache namespace %s; now at generation %d",
+                    prefix, generation)
+
+    def on_invalidation(self, message):
+        """Apply an invalidation broadcast by another worker."""
+        own_prefix = self._key_builder.namespace_prefix()
+        if message.get('resync'):
+            prefix = own_prefix
+            # Purges may have been missed too.
+            if prefix in GENERATIONS:
+                GENERATIONS[prefix] = (GENERATIONS[prefix][0], None)
+        else:
+            prefix = message.get('prefix')
+        if prefix == own_prefix and message.get('generation'):
+            generation = GENERATIONS.get(prefix, (0, None))[0]
+            GENERATIONS[prefix] = (max(generation, message['generation']),
+                                   calendar.timegm(time.gmtime()))
+        keys = message.get('keys') or []
+        if prefix is not None:
+            keys = [key for key in list(self._store)
+                    if key.startswith(prefix)]
+            if self._negative is not None:
+                keys.extend(key for key in list(self._negative)
+                            if key.startswith(prefix))
+        for key in keys:
+            self._store.pop(key, None)
+            self.forget_negative(key)
+
+    def forget_negative(self, key):
+        if self._negative is not None:
+            self._negative.pop(key, None)
 
     def get_hash(self, func_name, *args, **kwargs):
-        return str((func_name, args, tuple(sorted(kwargs.items()))))
+        return self._key_builder.build(func_name, args, kwargs,
+                                       generation=self.generation)
+
+    @property
+    def namespace(self):
+        return self._key_builder.namespace
+
+    @property
+    def namespace_prefix(self):
+        return self._key_builder.namespace_prefix()
+
+    @property
+    def backing_store(self):
+        return self._backing_store
+
+    def entries(self):
+        """Describe the in-process entries of this cache's namespace.
+
+        Yields dicts with the key, tier ('memory' or 'negative'), age in
+        seconds and approximate size in bytes.
+        """
+        prefix = self._key_builder.namespace_prefix()
+        now = calendar.timegm(time.gmtime())
+        for tier, store in ((MEMORY, self._store),
+                            (NEGATIVE, self._negative)):
+            if store is None:
+                continue
+            for key in list(store):
+                if not key.startswith(prefix):
+                    continue
+                if isinstance(store, MemoryStore):
+                    stored, size = store.peek(key), store.size_of(key)
+                else:
+                    stored = store.get(key)
+                    size = estimate_size(stored)
+                if stored is None:
+                    continue
+                yield {'key': key, 'tier': tier, 'age': now - stored[0],
+                       'size': size}
+
+    def report(self):
+        """Return this cache's counters with hit, miss and stale ratios.
+
+        The counters are read from the metrics registry, so they cover
+        every cache of the same function in this process. Bounded
+        in-process stores report their size and evictions, and a
+        write-behind queue its depth and its written, coalesced, dropped
+        and failed writes.
+        """
+        negative = HITS.total(function=self.name, tier=NEGATIVE)
+        counts = {'hits': HITS.total(function=self.name) - negative,
+                  'misses': MISSES.total(function=self.name),
+                  'stale': STALE.total(function=self.name),
+                  'negative': negative}
+        served = sum(counts.values())
+        report = dict(counts, name=self.name, namespace=self.namespace,
+                      generation=self.generation)
+        for name in ('hits', 'misses', 'stale'):
+            report['%s_ratio' % name] = (float(counts[name]) / served
+                                         if served else 0.0)
+        if isinstance(self._store, MemoryStore):
+            report['store'] = self._store.stats()
+        if isinstance(self._negative, MemoryStore):
+            report['negative_store'] = self._negative.stats()
+        if self._write_behind:
+            report['write_behind'] = dict(self._write_behind.stats,
+                                          depth=self._write_behind.depth)
+        return report
 
     def __default_timeout(self):
         return config.safe_get_config("cache", "default_timeout")
+
+    @staticmethod
+    def __config(name, value):
+        if value is not None:
+            return value
+        return config.safe_get_config("cache", name)
@@ -1,8 +1,24 @@
-import cPickle as pickle
+import errno
+import hashlib
+import itertools
 import os
 import pylibmc
+import random
 import redis
+import time
+import weakref
 
+import eventlet
+
+from fusion.common.cache_codec import Codec
+from fusion.common.cache_codec import CodecError
+from fusion.common import circuit_breaker
+from fusion.common.circuit_breaker import CircuitOpenError
+from fusion.common import config
+from fusion.common import fileutils
+from fusion.common import metrics
+from fusion.common.periodic import PeriodicTask
+from fusion.common.process import ProcessOwner
 from fusion.openstack.common import log as logging
 from oslo.config import cfg
 from redis.exceptions import ConnectionError
@@ -12,85 +28,426 @@ logger = logging.getLogger(__name__)
 REDIS = "redis"
 MEMCACHE = "memcache"
 FILE_SYSTEM = "filesystem"
-REDIS_CLIENT = None
-MEMCACHE_CLIENT = None
-
-try:
-    REDIS_CLIENT = redis.from_url(
-        cfg.CONF.cache.redis_connection_string)
-except StandardError as exc:
-    logger.warn("Error connecting to Redis: %s", exc)
-except NoSuchOptError as exc:
-    logger.warn("Redis configuration not found!")
-
-try:
-    servers = cfg.CONF.cache.memcache_servers
-    MEMCACHE_CLIENT = pylibmc.Client(servers, behaviors={
-        "tcp_nodelay": True, "ketama": True}, binary=True)
-except StandardError as exc:
-    logger.warn("Error connecting to memcache: %s", exc)
-except NoSuchOptError as exc:
-    logger.warn("Memcache configuration not found!")
+CONFIGURED = "configured"
+LEASE_PREFIX = "lease:"
+FENCE_PREFIX = "fence:"
+# Fencing counters outlive any lease they were taken for by far, so a
+# token is never handed out twice while its holder may still write, yet
+# counters of keys no longer refreshed are eventually removed.
+FENCE_TTL = 24 * 60 * 60
+# Compare-and-delete, so a lease is only released by its holder.
+RELEASE_LEASE_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+# Compare-and-set, so a value is only written while its refresh lease is
+# held, or expired without being taken over.
+FENCED_SET_SCRIPT = """
+local holder = redis.call("get", KEYS[1])
+if holder and holder ~= ARGV[1] then
+    return 0
+end
+if tonumber(ARGV[3]) > 0 then
+    redis.call("set", KEYS[2], ARGV[2], "EX", ARGV[3])
+else
+    redis.call("set", KEYS[2], ARGV[2])
+end
+return 1
+"""
+_LOCAL_FENCE = itertools.count(1)
+# memcache reads expiry times above 30 days as absolute unix timestamps.
+MEMCACHE_MAX_TTL = 60 * 60 * 24 * 30
+_CLIENTS = {}
+_CLIENTS_OWNER = ProcessOwner()
+
+
+def _get_client(name, factory):
+    """Return this process's client for name, creating it on first use.
+
+    Clients are never shared across a fork: clients created by another
+    process (the parent) are replaced by new ones.
+    """
+    if _CLIENTS_OWNER.claim():
+        _CLIENTS.clear()
+    client = _CLIENTS.get(name)
+    if client is not None:
+        return client
+    try:
+        client = factory()
+    except StandardError as exc:
+        logger.warn("Error creating %s client: %s", name, exc)
+        return None
+    _CLIENTS[name] = client
+    return client
+
+
+def _create_redis_client():
+    get = config.safe_get_config
+    pool = redis.ConnectionPool.from_url(
+        get("cache", "redis_connection_string"),
+        max_connections=get("cache", "redis_pool_size"),
+        socket_timeout=get("cache", "redis_socket_timeout"),
+        socket_connect_timeout=get("cache", "redis_connect_timeout"))
+    return redis.Redis(connection_pool=pool)
+
+
+def _create_memcache_client():
+    get = config.safe_get_config
+    behaviors = {"tcp_nodelay": True, "ketama": True}
+    connect_timeout = get("cache", "memcache_connect_timeout")
+    if connect_timeout:
+        behaviors["connect_timeout"] = int(connect_timeout * 1000)
+    io_timeout = get("cache", "memcache_io_timeout")
+    if io_timeout:
+        behaviors["receive_timeout"] = int(io_timeout * 1000000)
+        behaviors["send_timeout"] = int(io_timeout * 1000000)
+    client = pylibmc.Client(get("cache", "memcache_servers"),
+                            behaviors=behaviors, binary=True)
+    pool_size = get("cache", "memcache_pool_size")
+    if pool_size and pool_size > 1:
+        return MemcacheClientPool(client, pool_size)
+    return client
+
+
+def get_redis_client():
+    return _get_client(REDIS, _create_redis_client)
+
+
+def get_memcache_client():
+    return _get_client(MEMCACHE, _create_memcache_client)
+
+
+def _fence_ttl(lease_ttl):
+    return max(int(lease_ttl * 10), FENCE_TTL)
+
+
+def _parse_counter(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        # Missing, or written before counters were stored as integers.
+        return None
+
+
+class MemcacheClientPool(object):
+    """Run each pylibmc call on a client reserved from a pool."""
+
+    def __init__(self, client, size):
+        self._pool = pylibmc.ClientPool(client, size)
+
+    def __getattr__(self, name):
+        def call(*args, **kwargs):
+            with self._pool.reserve() as client:
+                return getattr(client, name)(*args, **kwargs)
+        return call
+
+
+class CacheEntry(object):
+    """Envelope returned by a single cache lookup.
+
+    delta is the number of seconds it took to compute value, when known.
+    tier names the store the entry was read from; it is not stored.
+    """
+
+    __slots__ = ('value', 'birthday', 'found', 'delta', 'tier')
+
+    def __init__(self, value=None, birthday=None, found=False, delta=0,
+                 tier=None):
+        self.value = value
+        self.birthday = birthday
+        self.found = found
+        self.delta = delta
+        self.tier = tier
+
+    @classmethod
+    def from_stored(cls, stored, tier=None):
+        """Build an entry from a stored (birthday, value[, delta]) tuple."""
+        if stored is None:
+            return MISSING
+        birthday, value = stored[0], stored[1]
+        delta = stored[2] if len(stored) > 2 else 0
+        return cls(value, birthday, True, delta, tier)
+
+    def stored(self):
+        """Return the tuple stores hold for this entry.
+
+        The compute time is only appended when it was measured, so other
+        entries keep the (birthday, value) form older releases read.
+        """
+        if self.delta:
+            return self.birthday, self.value, self.delta
+        return self.birthday, self.value
+
+    def __repr__(self):
+        return "CacheEntry(found=%s, birthday=%s)" % (self.found,
+                                                      self.birthday)
+
+
+MISSING = CacheEntry()
+
+STORE_ERRORS = metrics.Counter(
+    "fusion_cache_backing_store_errors_total",
+    "Failed backing store operations.", ("function", "tier"))
+STORED_BYTES = metrics.Counter(
+    "fusion_cache_stored_bytes_total",
+    "Bytes written to each cache tier.", ("function", "tier"))
 
 
 class BackingStore(object):
     @staticmethod
-    def create(type, max_age):
+    def create(type, max_age, stale_grace=None, max_stale=None):
+        """Create the store named by type.
+
+        type may also be a list of store names, which creates a tiered
+        store reading them in order, or CONFIGURED for the [cache]
+        backing_stores option. Entries are kept for as long as a cache
+        with the given stale_grace and max_stale (by default the [cache]
+        options) may serve them.
+        """
+        if type == CONFIGURED:
+            type = config.safe_get_config("cache", "backing_stores")
+        if isinstance(type, (list, tuple)):
+            tiers = [tier for tier in (
+                BackingStore.create(name, max_age, stale_grace, max_stale)
+                for name in type) if tier]
+            if len(tiers) > 1:
+                return TieredBackingStore(max_age, tiers)
+            return tiers[0] if tiers else None
+        if type not in (REDIS, MEMCACHE, FILE_SYSTEM):
+            return None
+        get = config.safe_get_config
+        if stale_grace is None:
+            stale_grace = get("cache", "stale_grace")
+        if max_stale is None:
+            max_stale = get("cache", "max_stale")
+        # Entries are served stale until max_stale, so keep them that long.
+        options = {
+            'codec': Codec.from_config(),
+            'ttl': max(max_age + (stale_grace or 0), max_stale or 0),
+            'ttl_jitter': get("cache", "backing_store_ttl_jitter"),
+        }
         if type == REDIS:
-            return RedisBackingStore(max_age, REDIS_CLIENT)
+            return RedisBackingStore(
+                max_age, breaker=circuit_breaker.get_breaker(REDIS), **options)
         elif type == MEMCACHE:
-            return MemcacheBackingStore(max_age, MEMCACHE_CLIENT)
-        elif type == FILE_SYSTEM:
-            return FileSystemBackingStore(max_age)
+            return MemcacheBackingStore(
+                max_age, breaker=circuit_breaker.get_breaker(MEMCACHE),
+                **options)
         else:
-            return None
+            return FileSystemBackingStore(
+                max_age,
+                max_bytes=config.safe_get_config("cache",
+                                                 "filesystem_max_bytes"),
+                gc_interval=config.safe_get_config("cache",
+                                                   "filesystem_gc_interval"),
+                **options)
 
-    def __init__(self, max_age):
+    def __init__(self, max_age, codec=None, ttl=None, ttl_jitter=None,
+                 breaker=None):
         self._max_age = max_age
+        self._codec = codec or Codec()
+        self._ttl = ttl
+        self._ttl_jitter = ttl_jitter or 0
+        self._breaker = breaker
+        self.function = None
+
+    # Name of this store in metrics and cache entries.
+    tier = None
+
+    @property
+    def breaker(self):
+        return self._breaker
+
+    def bind(self, function):
+        """Label this store's metrics with the cached function's name."""
+        self.function = function
+
+    def _call(self, operation, *args, **kwargs):
+        """Call the store's client, failing fast while its circuit is open.
+        """
+        try:
+            if self._breaker is None:
+                return operation(*args, **kwargs)
+            return self._breaker.call(operation, *args, **kwargs)
+        except CircuitOpenError:
+            raise
+        except Exception:
+            self._record_error()
+            raise
+
+    def _record_error(self):
+        STORE_ERRORS.labels(function=self.function, tier=self.tier).inc()
+
+    def ttl(self):
+        """Server-side expiry in seconds for a new write, or None.
+
+        A random jitter is added so entries written together by different
+        workers do not all expire at the same moment.
+        """
+        if not self._ttl:
+            return None
+        return self._ttl + random.randint(0, self._ttl_jitter)
+
+    # Whether leases are shared with other processes through this store.
+    shared_leases = False
+
+    def acquire_lease(self, key, ttl):
+        """Try to become the only refresher of key for ttl seconds.
+
+        Returns an increasing fencing token when the lease is granted and
+        None while another holder has it. Stores without shared state grant
+        every request, leaving de-duplication to the calling process.
+        """
+        return next(_LOCAL_FENCE)
+
+    def lease_valid(self, key, token):
+        """Whether token still holds the lease on key."""
+        return True
+
+    def release_lease(self, key, token):
+        pass
+
+    def cache_fenced(self, key, data, token):
+        """Store data under key only while token holds its lease.
+
+        Returns whether data was written. This default checks the lease
+        and then writes, which leaves a window in which a newer holder
+        can be overwritten; stores that can should check and write in one
+        step.
+        """
+        if not self.lease_valid(key, token):
+            return False
+        return self.cache(key, data)
 
     def cache(self, key, data):
+        """Store data under key; returns whether it was written."""
         logger.warn("Cache.update_cache called with cache_key %s, "
                     "but was not implemented", key)
+        return False
+
+    def delete(self, key):
+        logger.warn("Cache.delete called with cache_key %s, but was not "
+                    "implemented", key)
 
     def retrieve(self, key):
         logger.warn("Cache.try_cache called with cache_key %s, but was not "
                     "implemented", key)
 
+    def get_counter(self, key):
+        """Return the integer stored under key by set_counter, or None."""
+        return None
+
+    def set_counter(self, key, value):
+        """Store the integer value under key without expiry.
+
+        Counters, like the purge generation of a namespace, must outlive
+        the entries they describe, so they get no ttl and are never
+        collected.
+        """
+        logger.warn("Cache.set_counter called with key %s, but was not "
+                    "implemented", key)
+
     def exists(self, key):
         logger.warn("Cache.try_cache called with key %s, but was not "
                     "implemented", key)
 
-    @staticmethod
-    def encode(data):
-        """Encode python data into format we can restore from Redis."""
-        return pickle.dumps(data, pickle.HIGHEST_PROTOCOL)
+    def lookup(self, key):
+        """Fetch key with a single retrieve and return a CacheEntry.
 
-    @staticmethod
-    def decode(data):
-        """Decode our python data from the Redis string."""
-        return pickle.loads(data)
+        A hit costs one round trip and one deserialisation; errors and
+        misses return MISSING.
+        """
+        try:
+            return CacheEntry.from_stored(self.retrieve(key), self.tier)
+        except KeyError:
+            return MISSING
+
+    def get_many(self, keys):
+        """Return a dict mapping each of keys to its CacheEntry."""
+        return dict((key, self.lookup(key)) for key in keys)
+
+    def set_many(self, items):
+        """Store every key/data pair of the items dict.
+
+        Returns whether they were written.
+        """
+        written = [self.cache(key, data) for key, data in items.iteritems()]
+        return all(written)
+
+    def encode(self, data):
+        """Encode python data with the store's codec."""
+        encoded = self._codec.encode(data)
+        STORED_BYTES.labels(function=self.function,
+                            tier=self.tier).inc(len(encoded))
+        return encoded
+
+    def decode(self, data):
+        """Decode python data written by any codec."""
+        return self._codec.decode(data)
+
+    def _decode_stored(self, key, data):
+        """Decode the value of key, or return None if it cannot be.
+
+        A value written with a codec this node lacks, e.g. during a
+        rolling deploy, or a corrupt one counts as an error and a miss.
+        """
+        try:
+            return self.decode(data)
+        except Exception:
+            self._record_error()
+            logger.warn("Error decoding %s value of key %s", self.tier, key,
+                        exc_info=True)
+            return None
 
 
 class RedisBackingStore(BackingStore):
-    def __init__(self, max_age, redis_client):
-        self._redis_client = redis_client
-        super(RedisBackingStore, self).__init__(max_age)
+    tier = REDIS
+
+    def __init__(self, max_age, redis_client=None, **kwargs):
+        self._client = redis_client
+        super(RedisBackingStore, self).__init__(max_age, **kwargs)
+
+    @property
+    def _redis_client(self):
+        return self._client or get_redis_client()
 
     def exists(self, key):
-        return self._redis_client.exists(key)
+        return self._call(self._redis_client.exists, key)
 
     def cache(self, key, data):
         try:
-            self._redis_client.set(key, self.encode(data))
+            ttl = self.ttl()
+            if ttl:
+                self._call(self._redis_client.set, key, self.encode(data),
+                           ex=ttl)
+            else:
+                self._call(self._redis_client.set, key, self.encode(data))
+            return True
+        except CircuitOpenError:
+            logger.debug("Skipping Redis write of key %s; circuit open", key)
         except ConnectionError as exc:
             logger.warn("Error connecting to Redis: %s", exc)
         except Exception as exc:
             logger.warn("Error storing value in redis backing store: %s",
                         exc)
+        return False
+
+    def delete(self, key):
+        try:
+            self._call(self._redis_client.delete, key)
+        except CircuitOpenError:
+            logger.debug("Skipping Redis delete of key %s; circuit open",
+                         key)
+        except Exception as exc:
+            logger.warn("Error deleting key %s from Redis: %s", key, exc)
 
     def retrieve(self, key):
         try:
-            result = self._redis_client.get(key)
+            result = self._call(self._redis_client.get, key)
+        except CircuitOpenError:
+            return None
         except ConnectionError as exc:
             logger.warn("Error connecting to Redis: %s", exc)
             return None
@@ -98,59 +455,397 @@ class RedisBackingStore(BackingStore):
             logger.warn("Error accesing redis backing store: %s", exc)
             return None
         if result:
-            return self.decode(result)
+            return self._decode_stored(key, result)
         else:
             raise KeyError("Key %s not found" % key)
 
+    def get_counter(self, key):
+        try:
+            return _parse_counter(self._call(self._redis_client.get, key))
+        except CircuitOpenError:
+            return None
+        except Exception as exc:
+            logger.warn("Error reading counter %s from Redis: %s", key, exc)
+            return None
+
+    def set_counter(self, key, value):
+        try:
+            self._call(self._redis_client.set, key, value)
+        except CircuitOpenError:
+            logger.debug("Skipping Redis write of counter %s; circuit open",
+                         key)
+        except Exception as exc:
+            logger.warn("Error storing counter %s in Redis: %s", key, exc)
+
+    shared_leases = True
+
+    def acquire_lease(self, key, ttl):
+        fence = FENCE_PREFIX + key
+        try:
+            token = self._call(self._redis_client.incr, fence)
+            self._call(self._redis_client.expire, fence, _fence_ttl(ttl))
+            if self._call(self._redis_client.set, LEASE_PREFIX + key, token,
+                          nx=True, px=int(ttl * 1000)):
+                return token
+            return None
+        except Exception as exc:
+            # Without Redis there is nothing to coordinate on; let this
+            # process refresh rather than nobody.
+            logger.warn("Error acquiring Redis lease for key %s: %s", key,
+                        exc)
+            return super(RedisBackingStore, self).acquire_lease(key, ttl)
+
+    def lease_valid(self, key, token):
+        try:
+            holder = self._call(self._redis_client.get, LEASE_PREFIX + key)
+        except Exception as exc:
+            logger.warn("Error checking Redis lease for key %s: %s", key,
+                        exc)
+            return True
+        return holder is None or str(holder) == str(token)
+
+    def release_lease(self, key, token):
+        try:
+            self._call(self._redis_client.eval, RELEASE_LEASE_SCRIPT, 1,
+                       LEASE_PREFIX + key, token)
+        except Exception as exc:
+            logger.warn("Error releasing Redis lease for key %s: %s", key,
+                        exc)
+
+    def cache_fenced(self, key, data, token):
+        try:
+            return bool(self._call(self._redis_client.eval,
+                                   FENCED_SET_SCRIPT, 2, LEASE_PREFIX + key,
+                                   key, token, self.encode(data),
+                                   self.ttl() or 0))
+        except CircuitOpenError:
+            logger.debug("Skipping Redis write of key %s; circuit open", key)
+        except Exception as exc:
+            logger.warn("Error storing value in redis backing store: %s",
+                        exc)
+        return False
+
+    def get_many(self, keys):
+        keys = list(keys)
+        try:
+            results = self._call(self._redis_client.mget, keys)
+        except CircuitOpenError:
+            results = [None] * len(keys)
+        except ConnectionError as exc:
+            logger.warn("Error connecting to Redis: %s", exc)
+            results = [None] * len(keys)
+        except Exception as exc:
+            logger.warn("Error accesing redis backing store: %s", exc)
+            results = [None] * len(keys)
+        return dict((key, CacheEntry.from_stored(
+                         self._decode_stored(key, result), self.tier)
+                     if result else MISSING)
+                    for key, result in zip(keys, results))
+
+    def set_many(self, items):
+        try:
+            pipeline = self._redis_client.pipeline(transaction=False)
+            for key, data in items.iteritems():
+                ttl = self.ttl()
+                if ttl:
+                    pipeline.set(key, self.encode(data), ex=ttl)
+                else:
+                    pipeline.set(key, self.encode(data))
+            self._call(pipeline.execute)
+            return True
+        except CircuitOpenError:
+            logger.debug("Skipping Redis batch write; circuit open")
+        except ConnectionError as exc:
+            logger.warn("Error connecting to Redis: %s", exc)
+        except Exception as exc:
+            logger.warn("Error storing values in redis backing store: %s",
+                        exc)
+        return False
+
 
 class FileSystemBackingStore(BackingStore):
-    def __init__(self, max_age):
-        self._cache_root = cfg.CONF.cache.cache_root
-        super(FileSystemBackingStore, self).__init__(max_age)
+    """Store entries as files below cache_root.
+
+    Files are named by the SHA-1 of their key and sharded into two levels
+    of subdirectories below cache_root, which defaults to the [cache]
+    cache_root option. Writes go to a temporary file that is renamed into
+    place, so readers never see a partial entry. A garbage collector
+    removes files older than the store ttl and, when the cache root grows
+    past max_bytes, the least recently read files; one DiskCacheCollector
+    per cache root runs it in each process. Counters are kept in
+    files ending in COUNTER_SUFFIX, which the collector leaves alone.
+    """
+
+    TEMP_PREFIX = fileutils.TEMP_PREFIX
+    COUNTER_SUFFIX = ".counter"
+    tier = FILE_SYSTEM
+
+    def __init__(self, max_age, max_bytes=None, gc_interval=None,
+                 cache_root=None, **kwargs):
+        self._cache_root = cache_root or cfg.CONF.cache.cache_root
+        self._max_bytes = max_bytes
+        self._gc_interval = gc_interval
+        super(FileSystemBackingStore, self).__init__(max_age, **kwargs)
 
     def retrieve(self, key):
-        if self.exists(key):
-            try:
-                with open(self._cache_file(key), 'r') as cache:
-                    contents = cache.read()
-                return self.decode(contents)
-            except IOError:
-                logger.warn("Error reading disk cache", exc_info=True)
-        else:
+        entry = self.lookup(key)
+        if not entry.found:
             raise KeyError("Key %s not found" % key)
+        return entry.stored()
+
+    def lookup(self, key):
+        path = self._cache_file(key)
+        try:
+            with open(path, 'rb') as cache:
+                contents = cache.read()
+        except IOError as exc:
+            if exc.errno != errno.ENOENT:
+                self._record_error()
+                logger.warn("Error reading disk cache", exc_info=True)
+            return MISSING
+        try:
+            entry = CacheEntry.from_stored(self.decode(contents), self.tier)
+        except Exception:
+            self._record_error()
+            logger.warn("Error decoding disk cache file for key %s", key,
+                        exc_info=True)
+            return MISSING
+        self._touch(path)
+        return entry
 
     def cache(self, key, data):
-        if not os.path.exists(self._cache_root):
-            try:
-                os.makedirs(self._cache_root, 0o766)
-            except (OSError, IOError):
-                logger.warn("Could not create cache directory", exc_info=True)
-                return
+        path = self._cache_file(key)
+        if not self._make_directory(path):
+            return False
+        self._ensure_gc()
         try:
-            with open(self._cache_file(key), 'w') as cache:
-                cache.write(self.encode(data))
-        except IOError:
+            fileutils.write_atomically(path, self.encode(data))
+        except (OSError, IOError, CodecError):
+            self._record_error()
             logger.warn("Error updating disk cache", exc_info=True)
+            return False
+        return True
 
-    def _cache_file(self, cache_key):
-        return os.path.join(self._cache_root, ".%s_cache" % cache_key)
+    def delete(self, key):
+        self._unlink(self._cache_file(key))
+
+    def renew(self, key):
+        """Restart the expiry of key as if its entry had just been written.
+        """
+        try:
+            os.utime(self._cache_file(key), None)
+        except OSError:
+            pass
+
+    def get_counter(self, key):
+        try:
+            with open(self._cache_file(key) + self.COUNTER_SUFFIX) as counter:
+                return _parse_counter(counter.read())
+        except IOError as exc:
+            if exc.errno != errno.ENOENT:
+                self._record_error()
+                logger.warn("Error reading disk cache counter",
+                            exc_info=True)
+            return None
+
+    def set_counter(self, key, value):
+        path = self._cache_file(key) + self.COUNTER_SUFFIX
+        if not self._make_directory(path):
+            return
+        try:
+            fileutils.write_atomically(path, str(value))
+        except (OSError, IOError):
+            self._record_error()
+            logger.warn("Error updating disk cache counter", exc_info=True)
+
+    def _make_directory(self, path):
+        directory = os.path.dirname(path)
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory, 0o766)
+            except (OSError, IOError):
+                if not os.path.isdir(directory):
+                    self._record_error()
+                    logger.warn("Could not create cache directory",
+                                exc_info=True)
+                    return False
+        return True
 
     def exists(self, key):
         return os.path.exists(self._cache_file(key))
 
+    def _cache_file(self, cache_key):
+        if isinstance(cache_key, unicode):
+            cache_key = cache_key.encode('utf-8')
+        digest = hashlib.sha1(cache_key).hexdigest()
+        return os.path.join(self._cache_root, digest[:2], digest[2:4],
+                            digest)
+
+    @property
+    def expiry(self):
+        """Age in seconds after which the collector removes a file."""
+        return self._ttl or self._max_age
+
+    @property
+    def max_bytes(self):
+        return self._max_bytes
+
+    def gc(self):
+        """Collect the cache root with this store's expiry and max_bytes.
+
+        Returns the number of files removed.
+        """
+        return collect(self._cache_root, self.expiry, self._max_bytes)
+
+    def _ensure_gc(self):
+        if self._gc_interval:
+            get_collector(self._cache_root, self._gc_interval).add(self)
+
+    @staticmethod
+    def _touch(path):
+        # Record the read for LRU collection without changing the mtime,
+        # which marks when the entry was written.
+        try:
+            stat = os.stat(path)
+            os.utime(path, (time.time(), stat.st_mtime))
+        except OSError:
+            pass
+
+    @staticmethod
+    def _unlink(path):
+        try:
+            os.unlink(path)
+            return 1
+        except OSError:
+            return 0
+
+
+def collect(cache_root, expiry=None, max_bytes=None):
+    """Remove files below cache_root older than expiry seconds, then the
+    least recently read files while the root exceeds max_bytes.
+
+    Other greenthreads run between directories. Returns the number of
+    files removed.
+    """
+    now = time.time()
+    files = []
+    removed = 0
+    for directory, _, names in os.walk(cache_root):
+        for name in names:
+            if name.endswith(FileSystemBackingStore.COUNTER_SUFFIX):
+                continue
+            path = os.path.join(directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            if name.startswith(FileSystemBackingStore.TEMP_PREFIX):
+                # Leftovers of writes that died before the rename.
+                if now - stat.st_mtime > 3600:
+                    removed += FileSystemBackingStore._unlink(path)
+            elif expiry and now - stat.st_mtime > expiry:
+                removed += FileSystemBackingStore._unlink(path)
+            else:
+                files.append((stat.st_atime, stat.st_size, path))
+        eventlet.sleep(0)
+    total = sum(size for _, size, _ in files)
+    if max_bytes and total > max_bytes:
+        for _, size, path in sorted(files):
+            if total <= max_bytes:
+                break
+            if FileSystemBackingStore._unlink(path):
+                total -= size
+                removed += 1
+    logger.debug("Disk cache GC of %s removed %d files; %d bytes remain",
+                 cache_root, removed, total)
+    return removed
+
+
+class DiskCacheCollector(PeriodicTask):
+    """Collect a cache root shared by several FileSystemBackingStores.
+
+    Files are kept for the longest expiry of the stores added, and the
+    root is held under the smallest of their max_bytes.
+    """
+
+    def __init__(self, cache_root, interval):
+        super(DiskCacheCollector, self).__init__(interval)
+        self._cache_root = cache_root
+        self._stores = weakref.WeakSet()
+
+    def add(self, store):
+        """Collect for store too, starting in this process if needed."""
+        self._stores.add(store)
+        self.start()
+
+    def run_periodic(self):
+        stores = list(self._stores)
+        if not stores:
+            return
+        limits = [store.max_bytes for store in stores if store.max_bytes]
+        try:
+            collect(self._cache_root,
+                    max(store.expiry for store in stores),
+                    min(limits) if limits else None)
+        except Exception:
+            logger.warn("Disk cache GC of %s failed", self._cache_root,
+                        exc_info=True)
+
+
+COLLECTORS = {}
+
+
+def get_collector(cache_root, interval):
+    """Return the collector of cache_root, creating it if needed."""
+    if cache_root not in COLLECTORS:
+        COLLECTORS[cache_root] = DiskCacheCollector(cache_root, interval)
+    return COLLECTORS[cache_root]
+
 
 class MemcacheBackingStore(BackingStore):
-    def __init__(self, max_age, memcache_client):
-        self.memcache_client = memcache_client
-        super(MemcacheBackingStore, self).__init__(max_age)
+    tier = MEMCACHE
+
+    def __init__(self, max_age, memcache_client=None, **kwargs):
+        self._client = memcache_client
+        super(MemcacheBackingStore, self).__init__(max_age, **kwargs)
+
+    @property
+    def memcache_client(self):
+        return self._client or get_memcache_client()
+
+    def decode(self, data):
+        # Entries written before codecs existed were pickled by pylibmc and
+        # come back as python objects.
+        if not isinstance(data, str):
+            return data
+        return super(MemcacheBackingStore, self).decode(data)
 
     def cache(self, key, data):
         try:
-            self.memcache_client.set(key, data)
+            ttl = self.ttl()
+            if ttl:
+                self._call(self.memcache_client.set, key, self.encode(data),
+                           time=min(ttl, MEMCACHE_MAX_TTL))
+            else:
+                self._call(self.memcache_client.set, key, self.encode(data))
+            return True
+        except CircuitOpenError:
+            logger.debug("Skipping memcache write of key %s; circuit open",
+                         key)
         except pylibmc.Error as exc:
             logger.warn("Error while retrieving value from memcache: %s", exc)
         except Exception as exc:
             logger.warn("Error accesing memcache backing store: %s", exc)
+        return False
+
+    def delete(self, key):
+        try:
+            self._call(self.memcache_client.delete, key)
+        except CircuitOpenError:
+            logger.debug("Skipping memcache delete of key %s; circuit open",
+                         key)
+        except Exception as exc:
+            logger.warn("Error deleting key %s from memcache: %s", key, exc)
 
     def exists(self, key):
         try:
@@ -164,7 +859,9 @@ class MemcacheBackingStore(BackingStore):
 
     def retrieve(self, key):
         try:
-            data = self.memcache_client.get(key)
+            data = self._call(self.memcache_client.get, key)
+        except CircuitOpenError:
+            return None
         except pylibmc.Error as exc:
             logger.warn("Error while retrieving value from memcache: %s",
                         exc)
@@ -173,6 +870,223 @@ class MemcacheBackingStore(BackingStore):
             logger.warn("Error accesing memcache backing store: %s", exc)
             return None
         if data:
-            return data
+            return self._decode_stored(key, data)
         else:
             raise KeyError("Key %s not found" % key)
+
+    def get_counter(self, key):
+        try:
+            return _parse_counter(self._call(self.memcache_client.get, key))
+        except CircuitOpenError:
+            return None
+        except Exception as exc:
+            logger.warn("Error reading counter %s from memcache: %s", key,
+                        exc)
+            return None
+
+    def set_counter(self, key, value):
+        try:
+            self._call(self.memcache_client.set, key, value, time=0)
+        except CircuitOpenError:
+            logger.debug("Skipping memcache write of counter %s; circuit "
+                         "open", key)
+        except Exception as exc:
+            logger.warn("Error storing counter %s in memcache: %s", key,
+                        exc)
+
+    shared_leases = True
+
+    def acquire_lease(self, key, ttl):
+        fence = FENCE_PREFIX + key
+        try:
+            self._call(self.memcache_client.add, fence, 0,
+                       time=min(_fence_ttl(ttl), MEMCACHE_MAX_TTL))
+            token = self._call(self.memcache_client.incr, fence)
+            if self._call(self.memcache_client.add, LEASE_PREFIX + key,
+                          token, time=max(int(ttl), 1)):
+                return token
+            return None
+        except Exception as exc:
+            logger.warn("Error acquiring memcache lease for key %s: %s", key,
+                        exc)
+            return super(MemcacheBackingStore, self).acquire_lease(key, ttl)
+
+    def lease_valid(self, key, token):
+        try:
+            holder = self._call(self.memcache_client.get, LEASE_PREFIX + key)
+        except Exception as exc:
+            logger.warn("Error checking memcache lease for key %s: %s", key,
+                        exc)
+            return True
+        return holder is None or holder == token
+
+    def release_lease(self, key, token):
+        # memcache has no compare-and-delete; the check narrows, but does
+        # not close, the window in which a newer holder could be removed.
+        try:
+            if self.lease_valid(key, token):
+                self._call(self.memcache_client.delete, LEASE_PREFIX + key)
+        except Exception as exc:
+            logger.warn("Error releasing memcache lease for key %s: %s", key,
+                        exc)
+
+    def get_many(self, keys):
+        keys = list(keys)
+        try:
+            found = self._call(self.memcache_client.get_multi, keys)
+        except CircuitOpenError:
+            found = {}
+        except pylibmc.Error as exc:
+            logger.warn("Error while retrieving values from memcache: %s",
+                        exc)
+            found = {}
+        except Exception as exc:
+            logger.warn("Error accesing memcache backing store: %s", exc)
+            found = {}
+        return dict((key, CacheEntry.from_stored(
+                         self._decode_stored(key, found[key]), self.tier)
+                     if found.get(key) else MISSING)
+                    for key in keys)
+
+    def set_many(self, items):
+        ttl = self.ttl()
+        try:
+            encoded = dict((key, self.encode(data))
+                           for key, data in items.iteritems())
+            if ttl:
+                self._call(self.memcache_client.set_multi, encoded,
+                           time=min(ttl, MEMCACHE_MAX_TTL))
+            else:
+                self._call(self.memcache_client.set_multi, encoded)
+            return True
+        except CircuitOpenError:
+            logger.debug("Skipping memcache batch write; circuit open")
+        except pylibmc.Error as exc:
+            logger.warn("Error while storing values in memcache: %s", exc)
+        except Exception as exc:
+            logger.warn("Error accesing memcache backing store: %s", exc)
+        return False
+
+
+class TieredBackingStore(BackingStore):
+    """Chain backing stores, fastest first.
+
+    Reads return the first hit and copy it into every faster tier that
+    missed it; writes go to every tier and succeed when any tier took
+    them.
+    """
+
+    tier = "tiered"
+
+    def __init__(self, max_age, tiers, **kwargs):
+        self._tiers = list(tiers)
+        super(TieredBackingStore, self).__init__(max_age, **kwargs)
+
+    @property
+    def tiers(self):
+        return self._tiers
+
+    def bind(self, function):
+        super(TieredBackingStore, self).bind(function)
+        for tier in self._tiers:
+            tier.bind(function)
+
+    @property
+    def _lease_store(self):
+        for tier in self._tiers:
+            if tier.shared_leases:
+                return tier
+        return None
+
+    @property
+    def shared_leases(self):
+        return self._lease_store is not None
+
+    def acquire_lease(self, key, ttl):
+        store = self._lease_store
+        if store is None:
+            return super(TieredBackingStore, self).acquire_lease(key, ttl)
+        return store.acquire_lease(key, ttl)
+
+    def lease_valid(self, key, token):
+        store = self._lease_store
+        return store is None or store.lease_valid(key, token)
+
+    def release_lease(self, key, token):
+        store = self._lease_store
+        if store is not None:
+            store.release_lease(key, token)
+
+    def cache_fenced(self, key, data, token):
+        store = self._lease_store
+        if store is None:
+            return super(TieredBackingStore, self).cache_fenced(key, data,
+                                                                token)
+        if not store.cache_fenced(key, data, token):
+            return False
+        for tier in self._tiers:
+            if tier is not store:
+                tier.cache(key, data)
+        return True
+
+    def lookup(self, key):
+        for index, tier in enumerate(self._tiers):
+            entry = tier.lookup(key)
+            if entry.found:
+                for faster in self._tiers[:index]:
+                    faster.cache(key, entry.stored())
+                return entry
+        return MISSING
+
+    def retrieve(self, key):
+        entry = self.lookup(key)
+        if not entry.found:
+            raise KeyError("Key %s not found" % key)
+        return entry.stored()
+
+    def exists(self, key):
+        return self.lookup(key).found
+
+    def cache(self, key, data):
+        written = [tier.cache(key, data) for tier in self._tiers]
+        return any(written)
+
+    def delete(self, key):
+        for tier in self._tiers:
+            tier.delete(key)
+
+    def get_counter(self, key):
+        values = [value for value in (tier.get_counter(key)
+                                      for tier in self._tiers)
+                  if value is not None]
+        return max(values) if values else None
+
+    def set_counter(self, key, value):
+        for tier in self._tiers:
+            tier.set_counter(key, value)
+
+    def get_many(self, keys):
+        entries = {}
+        missing = list(keys)
+        missed_by = []
+        for tier in self._tiers:
+            if not missing:
+                break
+            found = dict((key, entry) for key, entry
+                         in tier.get_many(missing).iteritems()
+                         if entry.found)
+            if found:
+                promoted = dict((key, entry.stored())
+                                for key, entry in found.iteritems())
+                for faster in missed_by:
+                    faster.set_many(promoted)
+                entries.update(found)
+                missing = [key for key in missing if key not in found]
+            missed_by.append(tier)
+        for key in missing:
+            entries[key] = MISSING
+        return entries
+
+    def set_many(self, items):
+        written = [tier.set_many(items) for tier in self._tiers]
+        return any(written)
@@ -0,0 +1,196 @@
+import cPickle as pickle
+import datetime
+import json
+import marshal
+import zlib
+
+from fusion.common import config
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import lz4.block as lz4
+except ImportError:
+    lz4 = None
+
+# Encoded values start with MAGIC followed by one byte naming the serializer
+# and one naming the compressor. Values without the header are plain pickles
+# written before codecs existed.
+MAGIC = "\xfa"
+HEADER_SIZE = 3
+
+PICKLE = "pickle"
+JSON = "json"
+MARSHAL = "marshal"
+MSGPACK = "msgpack"
+
+NONE = "none"
+ZLIB = "zlib"
+LZ4 = "lz4"
+
+
+def _pickle_dumps(data):
+    return pickle.dumps(data, pickle.HIGHEST_PROTOCOL)
+
+
+# Dates, e.g. the heat_template_version PyYAML reads from templates, are
+# not native to json and msgpack; they are stored as tagged ISO strings.
+DATE_FORMATS = {
+    "date": (datetime.date, "%Y-%m-%d"),
+    "datetime": (datetime.datetime, "%Y-%m-%dT%H:%M:%S.%f"),
+}
+_DATE_TAG = "__%s__"
+_MSGPACK_DATE_CODES = {"date": 1, "datetime": 2}
+_MSGPACK_DATE_NAMES = dict((code, name)
+                           for name, code in _MSGPACK_DATE_CODES.items())
+
+
+def _date_name(obj):
+    # datetime is a subclass of date, so check it first.
+    if isinstance(obj, datetime.datetime) and obj.tzinfo is None:
+        return "datetime"
+    if type(obj) is datetime.date:
+        return "date"
+    raise TypeError("%r cannot be serialized" % (obj,))
+
+
+def _format_date(obj):
+    name = _date_name(obj)
+    return name, obj.strftime(DATE_FORMATS[name][1])
+
+
+def _parse_date(name, text):
+    date_type, date_format = DATE_FORMATS[name]
+    parsed = datetime.datetime.strptime(text, date_format)
+    return parsed.date() if date_type is datetime.date else parsed
+
+
+def _json_default(obj):
+    name, text = _format_date(obj)
+    return {_DATE_TAG % name: text}
+
+
+def _json_object_hook(obj):
+    if len(obj) == 1:
+        tag, text = obj.items()[0]
+        for name in DATE_FORMATS:
+            if tag == _DATE_TAG % name:
+                return _parse_date(name, text)
+    return obj
+
+
+def _json_dumps(data):
+    return json.dumps(data, separators=(',', ':'), default=_json_default)
+
+
+def _json_loads(blob):
+    return json.loads(blob, object_hook=_json_object_hook)
+
+
+def _msgpack_default(obj):
+    name, text = _format_date(obj)
+    return msgpack.ExtType(_MSGPACK_DATE_CODES[name], text)
+
+
+def _msgpack_ext_hook(code, data):
+    if code in _MSGPACK_DATE_NAMES:
+        return _parse_date(_MSGPACK_DATE_NAMES[code], data)
+    return msgpack.ExtType(code, data)
+
+
+def _msgpack_dumps(data):
+    return msgpack.packb(data, use_bin_type=True, default=_msgpack_default)
+
+
+def _msgpack_loads(blob):
+    return msgpack.unpackb(blob, raw=False, ext_hook=_msgpack_ext_hook)
+
+
+SERIALIZERS = {
+    PICKLE: (1, _pickle_dumps, pickle.loads),
+    JSON: (2, _json_dumps, _json_loads),
+    MARSHAL: (3, marshal.dumps, marshal.loads),
+    MSGPACK: (4, _msgpack_dumps, _msgpack_loads),
+}
+
+COMPRESSORS = {
+    NONE: (0, None, None),
+    ZLIB: (1, zlib.compress, zlib.decompress),
+    LZ4: (2, lz4 and lz4.compress, lz4 and lz4.decompress),
+}
+
+_SERIALIZERS_BY_ID = dict((v[0], (k, v)) for k, v in SERIALIZERS.items())
+_COMPRESSORS_BY_ID = dict((v[0], (k, v)) for k, v in COMPRESSORS.items())
+
+_OPTIONAL = {MSGPACK: msgpack, LZ4: lz4}
+
+
+class CodecError(ValueError):
+    pass
+
+
+class Codec(object):
+    """Serialize cache values with a self-describing header.
+
+    Values are serialized with the configured serializer and compressed
+    when they are at least compress_threshold bytes long. json and msgpack
+    also keep dates; marshal only holds builtin types, and encode() raises
+    CodecError for values a serializer cannot hold. Decoding reads
+    the header, so a store can switch codecs without being flushed.
+    """
+
+    def __init__(self, serializer=PICKLE, compressor=NONE,
+                 compress_threshold=0):
+        for name, table in ((serializer, SERIALIZERS),
+                            (compressor, COMPRESSORS)):
+            if name not in table:
+                raise CodecError("Unknown codec %s" % name)
+            if name in _OPTIONAL and _OPTIONAL[name] is None:
+                raise CodecError("Codec %s requires the %s package" %
+                                 (name, name))
+        self._serializer = serializer
+        self._compressor = compressor
+        self._compress_threshold = compress_threshold or 0
+
+    @classmethod
+    def from_config(cls):
+        get = config.safe_get_config
+        return cls(serializer=get("cache", "serializer") or PICKLE,
+                   compressor=get("cache", "compressor") or NONE,
+                   compress_threshold=get("cache", "compress_threshold"))
+
+    def encode(self, data):
+        serializer_id, dumps, _ = SERIALIZERS[self._serializer]
+        try:
+            payload = dumps(data)
+        except (TypeError, ValueError, pickle.PicklingError) as exc:
+            # marshal, for one, cannot hold dates or any other class.
+            raise CodecError("Cannot encode value with %s: %s" %
+                             (self._serializer, exc))
+        compressor_id, compress, _ = COMPRESSORS[NONE]
+        if (self._compressor != NONE and
+                len(payload) >= self._compress_threshold):
+            compressor_id, compress, _ = COMPRESSORS[self._compressor]
+            payload = compress(payload)
+        return MAGIC + chr(serializer_id) + chr(compressor_id) + payload
+
+    @staticmethod
+    def decode(blob):
+        if not blob.startswith(MAGIC):
+            return pickle.loads(blob)
+        try:
+            serializer, (_, _, loads) = _SERIALIZERS_BY_ID[ord(blob[1])]
+            compressor, (_, _, decompress) = _COMPRESSORS_BY_ID[ord(blob[2])]
+        except (KeyError, IndexError):
+            raise CodecError("Unknown codec header %r" % blob[:HEADER_SIZE])
+        if (serializer in _OPTIONAL and _OPTIONAL[serializer] is None or
+                compressor in _OPTIONAL and _OPTIONAL[compressor] is None):
+            raise CodecError("Value was encoded with %s/%s which is not "
+                             "installed" % (serializer, compressor))
+        payload = blob[HEADER_SIZE:]
+        if decompress:
+            payload = decompress(payload)
+        return loads(payload)
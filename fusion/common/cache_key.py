@@ -0,0 +1,92 @@
+import hashlib
+import inspect
+import json
+
+from fusion.common import config
+
+SCHEMA_VERSION = 1
+DEFAULT_PREFIX = "fusion"
+
+
+def canonical(value):
+    """Reduce value to JSON-encodable data that is stable across runs.
+
+    Objects can control how they are keyed by defining cache_key(); any
+    other object falls back to its repr.
+    """
+    if value is None or isinstance(value, (bool, int, long, float)):
+        return value
+    if isinstance(value, basestring):
+        return value if isinstance(value, unicode) else value.decode('utf-8')
+    if isinstance(value, dict):
+        return dict((unicode(k), canonical(v)) for k, v in value.iteritems())
+    if isinstance(value, (list, tuple)):
+        return [canonical(item) for item in value]
+    if isinstance(value, (set, frozenset)):
+        return sorted(canonical(item) for item in value)
+    if hasattr(value, 'cache_key'):
+        return canonical(value.cache_key())
+    return repr(value)
+
+
+class KeyBuilder(object):
+    """Build compact cache keys of the form prefix:namespace:vN:digest.
+
+    Once a namespace has been purged its keys also carry the purge
+    generation, as prefix:namespace:vN:gG:digest.
+
+    The digest is a SHA-1 of a canonical JSON encoding of the function
+    name and its arguments, so keys have a fixed length and are safe to
+    use with memcache and as file names. When key_args is given, only the
+    named arguments contribute to the digest.
+    """
+
+    def __init__(self, namespace=None, key_args=None,
+                 version=SCHEMA_VERSION, prefix=None):
+        self._namespace = namespace
+        self._key_args = tuple(key_args) if key_args else None
+        self._version = version
+        self._prefix = prefix
+        self._func = None
+
+    def bind(self, func):
+        self._func = func
+        if self._namespace is None:
+            self._namespace = func.__name__
+        if self._key_args:
+            arg_names = inspect.getargspec(func).args
+            unknown = set(self._key_args) - set(arg_names)
+            if unknown:
+                raise ValueError("%s has no argument(s) %s" %
+                                 (func.__name__, ", ".join(sorted(unknown))))
+
+    @property
+    def namespace(self):
+        return self._namespace
+
+    def namespace_prefix(self, namespace=None):
+        prefix = (self._prefix or config.safe_get_config("cache",
+                                                         "key_prefix") or
+                  DEFAULT_PREFIX)
+        return "%s:%s:v%d:" % (prefix, namespace or self._namespace,
+                               self._version)
+
+    def generation_key(self):
+        """Key under which the namespace's purge generation is stored."""
+        return self.namespace_prefix() + "generation"
+
+    def build(self, func_name, args, kwargs, generation=0):
+        payload = json.dumps([func_name, self._arguments(args, kwargs)],
+                             sort_keys=True, separators=(',', ':'))
+        digest = hashlib.sha1(payload.encode('utf-8')).hexdigest()
+        prefix = self.namespace_prefix(self._namespace or func_name)
+        if generation:
+            prefix += "g%d:" % generation
+        return prefix + digest
+
+    def _arguments(self, args, kwargs):
+        if self._func is not None and self._key_args:
+            call_args = inspect.getcallargs(self._func, *args, **kwargs)
+            return dict((name, canonical(call_args[name]))
+                        for name in self._key_args)
+        return [canonical(args), canonical(kwargs)]
@@ -0,0 +1,94 @@
+import errno
+import weakref
+
+from fusion.common import cache_codec
+from fusion.common.cache_codec import Codec
+from fusion.common import config
+from fusion.common import fileutils
+from fusion.common.periodic import PeriodicTask
+from fusion.openstack.common import log as logging
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_VERSION = 1
+
+SNAPSHOTS = weakref.WeakSet()
+
+
+class CacheSnapshot(PeriodicTask):
+    """Save a MemoryStore to a local file and load it back.
+
+    save() writes the store atomically, so concurrent workers sharing the
+    path never leave a partial file; the last one to finish wins. load()
+    restores the entries with their original birthdays. start() saves
+    every interval seconds from a greenthread in the calling process;
+    workers also call save_all() when they are stopped.
+    """
+
+    TEMP_PREFIX = fileutils.TEMP_PREFIX
+
+    def __init__(self, store, path, interval=None):
+        super(CacheSnapshot, self).__init__(interval)
+        self._store = store
+        self._path = path
+        self._codec = Codec(serializer=cache_codec.PICKLE,
+                            compressor=cache_codec.ZLIB)
+        SNAPSHOTS.add(self)
+
+    @classmethod
+    def from_config(cls, store):
+        """Create a snapshot of store, or None if snapshot_path is unset."""
+        path = config.safe_get_config("cache", "snapshot_path")
+        if not path:
+            return None
+        return cls(store, path,
+                   interval=config.safe_get_config("cache",
+                                                   "snapshot_interval"))
+
+    def save(self):
+        try:
+            fileutils.write_atomically(self._path, self._codec.encode(
+                {'version': SNAPSHOT_VERSION,
+                 'entries': self._store.snapshot()}))
+        except Exception:
+            logger.warn("Error saving cache snapshot to %s", self._path,
+                        exc_info=True)
+            return False
+        return True
+
+    def load(self):
+        """Restore the saved entries; returns how many were loaded."""
+        try:
+            with open(self._path, 'rb') as snapshot:
+                data = self._codec.decode(snapshot.read())
+        except IOError as exc:
+            if exc.errno != errno.ENOENT:
+                logger.warn("Error reading cache snapshot %s", self._path,
+                            exc_info=True)
+            return 0
+        except Exception:
+            logger.warn("Ignoring unreadable cache snapshot %s", self._path,
+                        exc_info=True)
+            return 0
+        if not isinstance(data, dict) or (data.get('version') !=
+                                          SNAPSHOT_VERSION):
+            logger.warn("Ignoring cache snapshot %s with unknown version",
+                        self._path)
+            return 0
+        loaded = self._store.restore(data['entries'])
+        logger.info("Restored %d cache entries from %s", loaded, self._path)
+        return loaded
+
+    def run_periodic(self):
+        self.save()
+
+
+def save_all():
+    """Save every snapshot of this process.
+
+    Only worker processes should call this: a parent that forked workers
+    holds the entries it had at startup and would overwrite the fresher
+    snapshots saved by its workers.
+    """
+    for snapshot in list(SNAPSHOTS):
+        snapshot.save()
@@ -0,0 +1,63 @@
+import time
+import weakref
+from timeit import default_timer
+
+from fusion.common.periodic import PeriodicTask
+from fusion.openstack.common import log as logging
+
+logger = logging.getLogger(__name__)
+
+WARMERS = weakref.WeakSet()
+
+
+class CacheWarmer(PeriodicTask):
+    """Populate caches before serving and keep them warm.
+
+    jobs are callables that read through cached functions. warm() runs
+    each of them once and marks the warmer ready when it finishes, even if
+    some jobs failed. start() repeats the warm-up every interval seconds
+    from a greenthread in the calling process.
+    """
+
+    def __init__(self, jobs, interval=None):
+        super(CacheWarmer, self).__init__(interval)
+        self._jobs = list(jobs)
+        self.ready = False
+        self.stats = {'runs': 0, 'failures': 0, 'last_run': None,
+                      'last_duration': None}
+        WARMERS.add(self)
+
+    def warm(self):
+        started = default_timer()
+        for job in self._jobs:
+            try:
+                job()
+            except Exception:
+                self.stats['failures'] += 1
+                logger.warn("Cache warm-up job %s failed", job,
+                            exc_info=True)
+        duration = default_timer() - started
+        self.stats.update({'runs': self.stats['runs'] + 1,
+                           'last_run': time.time(),
+                           'last_duration': duration})
+        if not self.ready:
+            logger.info("Cache warm-up finished in %.1fs", duration)
+        self.ready = True
+
+    def run_periodic(self):
+        self.warm()
+
+
+def is_ready():
+    """Whether every warmer in this process has finished warming up."""
+    return all(warmer.ready for warmer in list(WARMERS))
+
+
+def warm_all():
+    for warmer in list(WARMERS):
+        warmer.warm()
+
+
+def stats():
+    return [dict(warmer.stats, ready=warmer.ready)
+            for warmer in list(WARMERS)]
@@ -0,0 +1,125 @@
+import time
+
+from fusion.common import config
+from fusion.common import metrics
+from fusion.openstack.common import log as logging
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+BREAKERS = {}
+
+TRIPS = metrics.Counter(
+    "fusion_circuit_trips_total",
+    "Times a circuit opened, by the service it guards.", ("service",))
+REJECTED = metrics.Counter(
+    "fusion_circuit_rejected_total",
+    "Calls skipped while a circuit was open.", ("service",))
+
+
+class CircuitOpenError(Exception):
+    pass
+
+
+class CircuitBreaker(object):
+    """Skip calls to a failing service for a cool-down period.
+
+    After failure_threshold consecutive failures the breaker opens and
+    allow() returns False for reset_timeout seconds. A single probe call is
+    then let through; its success closes the breaker again and its failure
+    re-opens it. A probe that never reports back is replaced after another
+    reset_timeout.
+    """
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30):
+        self.name = name
+        self._failure_threshold = failure_threshold
+        self._reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.trips = 0
+        self.rejected = 0
+        self._opened_at = None
+        self._probe_at = None
+
+    def allow(self):
+        if self.state == CLOSED:
+            return True
+        now = time.time()
+        if self.state == OPEN and now - self._opened_at >= self._reset_timeout:
+            self.state = HALF_OPEN
+        if self.state == HALF_OPEN and (
+                self._probe_at is None or
+                now - self._probe_at >= self._reset_timeout):
+            self._probe_at = now
+            logger.info("Circuit %s half-open; probing", self.name)
+            return True
+        self.rejected += 1
+        REJECTED.labels(service=self.name).inc()
+        return False
+
+    def record_success(self):
+        if self.state != CLOSED:
+            logger.info("Circuit %s closed", self.name)
+        self.state = CLOSED
+        self.failures = 0
+        self._probe_at = None
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == HALF_OPEN or (
+                self.state == CLOSED and
+                self.failures >= self._failure_threshold):
+            self.trip()
+
+    def trip(self):
+        logger.warn("Circuit %s open after %d failure(s); skipping calls "
+                    "for %ss", self.name, self.failures, self._reset_timeout)
+        self.state = OPEN
+        self.trips += 1
+        TRIPS.labels(service=self.name).inc()
+        self._opened_at = time.time()
+        self._probe_at = None
+
+    def call(self, operation, *args, **kwargs):
+        """Run operation through the breaker.
+
+        Raises CircuitOpenError without calling operation while open.
+        """
+        if not self.allow():
+            raise CircuitOpenError("Circuit %s is open" % self.name)
+        try:
+            result = operation(*args, **kwargs)
+        except Exception:
+            self.record_failure()
+            raise
+        self.record_success()
+        return result
+
+    def stats(self):
+        return {
+            'state': self.state,
+            'failures': self.failures,
+            'trips': self.trips,
+            'rejected': self.rejected,
+        }
+
+
+def get_breaker(name):
+    """Return the process-wide breaker for the named service."""
+    if name not in BREAKERS:
+        BREAKERS[name] = CircuitBreaker(
+            name,
+            failure_threshold=config.safe_get_config(
+                "cache", "circuit_failure_threshold") or 5,
+            reset_timeout=config.safe_get_config(
+                "cache", "circuit_reset_timeout") or 30)
+    return BREAKERS[name]
+
+
+def stats():
+    return dict((name, breaker.stats())
+                for name, breaker in BREAKERS.items())
@@ -67,7 +67,29 @@ github_opts = [
                help="github password"),
     cfg.StrOpt('default_version',
                default="stable",
-               help="default template version")
+               help="default template version"),
+    cfg.IntOpt('repo_index_interval',
+               default=300,
+               help="seconds between incremental updates of the template "
+                    "repository index"),
+    cfg.IntOpt('repo_index_full_interval',
+               default=3600,
+               help="seconds between full rebuilds of the template "
+                    "repository index, which drop deleted repositories"),
+    cfg.StrOpt('http_cache_dir',
+               default=None,
+               help="directory GitHub API responses are cached in and "
+                    "revalidated from with conditional requests; unset "
+                    "disables the cache"),
+    cfg.IntOpt('http_cache_max_bytes',
+               default=104857600,
+               help="size above which the least recently read GitHub API "
+                    "responses are removed from http_cache_dir"),
+    cfg.IntOpt('archive_max_bytes',
+               default=10485760,
+               help="largest repository tarball read to fetch a template "
+                    "and its metadata at once; larger repositories are "
+                    "read file by file")
 ]
 
 cache_group = cfg.OptGroup('cache')
@@ -84,6 +106,166 @@ cache_opts = [
     cfg.ListOpt('memcache_servers',
                 default="memcache_servers was not defined!",
                 help="memcache servers"),
+    cfg.ListOpt('backing_stores',
+                default=['memcache'],
+                help="ordered backing store tiers behind the in-process "
+                     "cache, fastest first: any of memcache, redis and "
+                     "filesystem"),
+    cfg.IntOpt('redis_pool_size',
+               default=10,
+               help="maximum Redis connections per worker process"),
+    cfg.FloatOpt('redis_connect_timeout',
+                 default=0.5,
+                 help="seconds to wait for a Redis connection"),
+    cfg.FloatOpt('redis_socket_timeout',
+                 default=1.0,
+                 help="seconds to wait for a Redis reply"),
+    cfg.IntOpt('memcache_pool_size',
+               default=1,
+               help="memcache clients per worker process"),
+    cfg.FloatOpt('memcache_connect_timeout',
+                 default=0.5,
+                 help="seconds to wait for a memcache connection"),
+    cfg.FloatOpt('memcache_io_timeout',
+                 default=1.0,
+                 help="seconds to wait when sending to or receiving from "
+                      "memcache"),
+    cfg.StrOpt('key_prefix',
+               default="fusion",
+               help="prefix of every cache key, shared by all deployments "
+                    "using the same backing store"),
+    cfg.IntOpt('memory_max_entries',
+               default=4096,
+               help="maximum number of entries kept in the in-process cache"),
+    cfg.IntOpt('memory_max_bytes',
+               default=67108864,
+               help="maximum estimated size in bytes of the in-process "
+                    "cache"),
+    cfg.StrOpt('memory_eviction_policy',
+               default="lru",
+               help="in-process cache eviction policy: lru or ttl"),
+    cfg.IntOpt('memory_sweep_interval',
+               default=60,
+               help="seconds between sweeps of expired in-process cache "
+                    "entries"),
+    cfg.IntOpt('single_flight_timeout',
+               default=30,
+               help="seconds a cache miss waits for an identical in-flight "
+                    "load before computing the value itself"),
+    cfg.IntOpt('stale_grace',
+               default=3600,
+               help="seconds past default_timeout during which an expired "
+                    "value is served while it is refreshed in the "
+                    "background"),
+    cfg.IntOpt('max_stale',
+               default=86400,
+               help="maximum age in seconds of a value served because its "
+                    "refresh failed"),
+    cfg.StrOpt('admin_token',
+               default=None,
+               secret=True,
+               help="token required by the cache admin API in the "
+                    "X-Cache-Admin-Token header; unset disables the API"),
+    cfg.BoolOpt('warm_on_start',
+                default=True,
+                help="populate the template caches before serving"),
+    cfg.IntOpt('warm_interval',
+               default=900,
+               help="seconds between warm-ups of the template caches in "
+                    "each worker; 0 disables periodic warm-up"),
+    cfg.StrOpt('snapshot_path',
+               default=None,
+               help="file the in-memory template cache is saved to and "
+                    "restored from across restarts; unset to disable"),
+    cfg.IntOpt('snapshot_interval',
+               default=300,
+               help="seconds between saves of the in-memory cache "
+                    "snapshot in each worker; 0 saves only on exit"),
+    cfg.IntOpt('refresh_concurrency',
+               default=4,
+               help="maximum number of background refreshes running at "
+                    "once in each worker"),
+    cfg.IntOpt('refresh_queue_size',
+               default=1000,
+               help="maximum number of keys waiting for a background "
+                    "refresh; further keys are refreshed on a later read"),
+    cfg.FloatOpt('early_refresh_beta',
+                 default=0.0,
+                 help="how eagerly entries are refreshed before they "
+                      "expire, weighted by how long they took to compute "
+                      "(1.0 is typical); 0 disables early refresh"),
+    cfg.IntOpt('negative_timeout',
+               default=60,
+               help="seconds a None result, such as an unknown template "
+                    "id, is cached; 0 caches it like any other value"),
+    cfg.IntOpt('negative_max_entries',
+               default=1000,
+               help="maximum number of None results kept in memory per "
+                    "cached function"),
+    cfg.IntOpt('refresh_backoff',
+               default=5,
+               help="seconds to wait before retrying a failed refresh; "
+                    "doubled after every consecutive failure"),
+    cfg.IntOpt('refresh_backoff_max',
+               default=300,
+               help="maximum seconds between retries of a failed refresh"),
+    cfg.BoolOpt('write_behind',
+                default=False,
+                help="write refreshed values to the backing store from a "
+                     "background worker instead of the request"),
+    cfg.IntOpt('write_behind_queue_size',
+               default=1000,
+               help="maximum number of keys waiting to be written to the "
+                    "backing store; further writes are dropped"),
+    cfg.StrOpt('serializer',
+               default="pickle",
+               help="serializer for backing store values: pickle, json, "
+                    "marshal or msgpack"),
+    cfg.StrOpt('compressor',
+               default="zlib",
+               help="compression for backing store values: none, zlib or "
+                    "lz4"),
+    cfg.IntOpt('compress_threshold',
+               default=4096,
+               help="minimum serialized size in bytes of a backing store "
+                    "value before it is compressed"),
+    cfg.IntOpt('backing_store_ttl_jitter',
+               default=300,
+               help="maximum random seconds added to the server-side "
+                    "expiry of backing store entries, which is "
+                    "default_timeout plus stale_grace"),
+    cfg.IntOpt('filesystem_max_bytes',
+               default=1073741824,
+               help="size in bytes above which the filesystem cache "
+                    "removes its least recently read files"),
+    cfg.IntOpt('filesystem_gc_interval',
+               default=600,
+               help="seconds between garbage collections of the "
+                    "filesystem cache; 0 disables collection"),
+    cfg.IntOpt('circuit_failure_threshold',
+               default=5,
+               help="consecutive Redis or memcache failures after which "
+                    "the store is skipped"),
+    cfg.IntOpt('circuit_reset_timeout',
+               default=30,
+               help="seconds a failing Redis or memcache store is skipped "
+                    "before a single probe request is let through"),
+    cfg.IntOpt('refresh_lease_ttl',
+               default=60,
+               help="seconds a process holds the fleet-wide lease to "
+                    "refresh an expired key"),
+    cfg.StrOpt('invalidation_bus',
+               default=None,
+               help="bus telling other workers to drop in-memory entries "
+                    "this worker replaced: redis, local or unset to "
+                    "disable"),
+    cfg.StrOpt('invalidation_channel',
+               default="fusion:cache:invalidate",
+               help="Redis pub/sub channel of the invalidation bus"),
+    cfg.IntOpt('refresh_lease_retry',
+               default=5,
+               help="seconds to wait before checking again on a key "
+                    "another process is refreshing"),
 ]
 
 proxy_group = cfg.OptGroup('proxy')
@@ -0,0 +1,27 @@
+import os
+import tempfile
+
+# Temporary files start with this prefix until they are renamed into
+# place, so collectors can tell them apart from complete files.
+TEMP_PREFIX = ".tmp-"
+
+
+def write_atomically(path, data):
+    """Write data to path through a temporary file renamed into place.
+
+    Readers see either the previous contents or data, never a partial
+    file. Raises OSError or IOError, after removing the temporary file,
+    when the write fails.
+    """
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".",
+                                     prefix=TEMP_PREFIX)
+    try:
+        with os.fdopen(fd, 'wb') as temp:
+            temp.write(data)
+        os.rename(temp_path, path)
+    except (OSError, IOError):
+        try:
+            os.unlink(temp_path)
+        except OSError:
+            pass
+        raise
@@ -0,0 +1,173 @@
+import json
+import socket
+import uuid
+
+import eventlet
+import redis
+
+from fusion.common import cache_backing_store
+from fusion.common import config
+from fusion.common.process import ProcessOwner
+from fusion.openstack.common import log as logging
+
+logger = logging.getLogger(__name__)
+
+LOCAL = "local"
+REDIS = "redis"
+CONFIGURED = "configured"
+RECONNECT_DELAY = 1
+
+BUSES = {}
+
+
+class InvalidationBus(object):
+    """Broadcast in-memory cache invalidations to every worker.
+
+    Messages are dicts carrying either the 'keys' a worker replaced or the
+    key 'prefix' it purged. Each worker stamps its messages with an origin
+    id and ignores its own, so only the other workers drop their copies.
+    """
+
+    def __init__(self):
+        self._handlers = []
+        self._origin = None
+        self._origin_owner = ProcessOwner()
+        self.stats = {'published': 0, 'received': 0, 'failed': 0}
+
+    @property
+    def origin(self):
+        # A forked worker must not share its parent's id.
+        if self._origin_owner.claim():
+            self._origin = "%s:%d:%s" % (socket.gethostname(),
+                                         self._origin_owner.pid,
+                                         uuid.uuid4().hex)
+        return self._origin
+
+    def subscribe(self, handler):
+        self._handlers.append(handler)
+
+    def ensure_listener(self):
+        """Start receiving messages in this process if not already."""
+        pass
+
+    def publish(self, message):
+        payload = json.dumps(dict(message, origin=self.origin))
+        try:
+            self._send(payload)
+            self.stats['published'] += 1
+        except Exception as exc:
+            self.stats['failed'] += 1
+            logger.warn("Error publishing cache invalidation: %s", exc)
+
+    def deliver(self, payload):
+        try:
+            message = json.loads(payload)
+        except (TypeError, ValueError):
+            logger.warn("Ignoring malformed cache invalidation %r", payload)
+            return
+        if message.get('origin') == self.origin:
+            return
+        self.stats['received'] += 1
+        self._dispatch(message)
+
+    def _dispatch(self, message):
+        for handler in list(self._handlers):
+            try:
+                handler(message)
+            except Exception:
+                logger.warn("Error handling cache invalidation %s", message,
+                            exc_info=True)
+
+    def _send(self, payload):
+        raise NotImplementedError()
+
+
+class LocalBus(InvalidationBus):
+    """Deliver messages between buses in this process.
+
+    Buses sharing a peers list behave like workers sharing a Redis
+    channel, which makes this a stand-in for RedisBus in tests.
+    """
+
+    def __init__(self, peers=None):
+        super(LocalBus, self).__init__()
+        self._peers = [] if peers is None else peers
+        self._peers.append(self)
+
+    def _send(self, payload):
+        for bus in list(self._peers):
+            bus.deliver(payload)
+
+
+class RedisBus(InvalidationBus):
+    """Deliver messages over a Redis pub/sub channel.
+
+    Each worker listens from its own greenthread on a dedicated connection
+    without a read timeout. Messages sent while a worker is disconnected
+    are lost, so after reconnecting it drops its whole in-memory cache.
+    """
+
+    def __init__(self, channel, client=None, pubsub_factory=None):
+        super(RedisBus, self).__init__()
+        self._channel = channel
+        self._client = client
+        self._pubsub_factory = pubsub_factory or self._create_pubsub
+        self._listener = ProcessOwner()
+
+    def ensure_listener(self):
+        if self._listener.claim():
+            eventlet.spawn_n(self._listen, self._listener.pid)
+
+    def _send(self, payload):
+        client = self._client or cache_backing_store.get_redis_client()
+        if client is None:
+            raise RuntimeError("No Redis client available")
+        client.publish(self._channel, payload)
+
+    def _listen(self, pid):
+        connected_before = False
+        while self._listener.pid == pid:
+            try:
+                pubsub = self._pubsub_factory()
+                pubsub.subscribe(self._channel)
+                if connected_before:
+                    self._dispatch({'resync': True})
+                connected_before = True
+                for item in pubsub.listen():
+                    if item.get('type') == 'message':
+                        self.deliver(item['data'])
+            except Exception as exc:
+                logger.warn("Cache invalidation listener disconnected: %s",
+                            exc)
+            eventlet.sleep(RECONNECT_DELAY)
+
+    @staticmethod
+    def _create_pubsub():
+        get = config.safe_get_config
+        client = redis.Redis.from_url(
+            get("cache", "redis_connection_string"),
+            socket_connect_timeout=get("cache", "redis_connect_timeout"))
+        return client.pubsub(ignore_subscribe_messages=True)
+
+
+def get_bus(name=CONFIGURED):
+    """Return the process-wide bus of the given type, or None.
+
+    A bus instance is returned unchanged.
+    """
+    if isinstance(name, InvalidationBus):
+        return name
+    if name == CONFIGURED:
+        name = config.safe_get_config("cache", "invalidation_bus")
+    if not name:
+        return None
+    if name not in BUSES:
+        if name == LOCAL:
+            BUSES[name] = LocalBus()
+        elif name == REDIS:
+            BUSES[name] = RedisBus(config.safe_get_config(
+                "cache", "invalidation_channel"))
+        else:
+            logger.warn("Unknown cache invalidation bus %s", name)
+            return None
+    return BUSES[name]
@@ -0,0 +1,195 @@
+import calendar
+import collections
+import cPickle as pickle
+import sys
+import time
+
+from fusion.common import config
+from fusion.openstack.common import log as logging
+
+logger = logging.getLogger(__name__)
+
+LRU = "lru"
+TTL = "ttl"
+
+
+def estimate_size(value):
+    """Approximate the number of bytes held by a cache entry."""
+    try:
+        return len(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+    except (pickle.PicklingError, TypeError):
+        return sys.getsizeof(value)
+
+
+class MemoryStore(collections.MutableMapping):
+    """Bounded in-process store for Cache entries.
+
+    Entries are the (birthday, value) tuples written by Cache. The store
+    holds at most max_entries keys and max_bytes of (estimated) data and
+    evicts either the least recently used entry (LRU) or the entry with
+    the oldest birthday (TTL) when a limit is exceeded. Entries older than
+    ttl seconds are dropped by a sweep that runs at most once every
+    sweep_interval seconds, piggybacking on writes.
+    """
+
+    def __init__(self, max_entries=None, max_bytes=None, policy=LRU,
+                 ttl=None, sweep_interval=None, sizeof=estimate_size):
+        if policy not in (LRU, TTL):
+            raise ValueError("Unknown eviction policy %s" % policy)
+        self._max_entries = max_entries
+        self._max_bytes = max_bytes
+        self._policy = policy
+        self._ttl = ttl
+        self._sweep_interval = sweep_interval
+        self._sizeof = sizeof
+        self._entries = collections.OrderedDict()
+        self._sizes = {}
+        self._bytes = 0
+        self._last_sweep = self._now()
+        self.evictions = {'entries': 0, 'bytes': 0, 'expired': 0}
+
+    @classmethod
+    def from_config(cls, max_age=None, stale_grace=None, max_stale=None):
+        """Create a store bounded by the [cache] memory_* options.
+
+        Entries are kept for as long as a cache with the given max_age,
+        stale_grace and max_stale (by default the [cache] options) may
+        serve them; Cache widens this for its own settings via retain().
+        """
+        get = config.safe_get_config
+        if max_age is None:
+            max_age = get("cache", "default_timeout")
+        if stale_grace is None:
+            stale_grace = get("cache", "stale_grace")
+        if max_stale is None:
+            max_stale = get("cache", "max_stale")
+        # Expired entries are still served while stale, so keep them until
+        # they can no longer be served at all.
+        ttl = max((max_age or 0) + (stale_grace or 0), max_stale or 0)
+        return cls(max_entries=get("cache", "memory_max_entries"),
+                   max_bytes=get("cache", "memory_max_bytes"),
+                   policy=get("cache", "memory_eviction_policy") or LRU,
+                   ttl=ttl,
+                   sweep_interval=get("cache", "memory_sweep_interval"))
+
+    def retain(self, ttl):
+        """Keep entries for at least ttl seconds."""
+        if self._ttl and ttl > self._ttl:
+            self._ttl = ttl
+
+    def __getitem__(self, key):
+        entry = self._entries[key]
+        if self._policy == LRU:
+            del self._entries[key]
+            self._entries[key] = entry
+        return entry
+
+    def __setitem__(self, key, entry):
+        if key in self._entries:
+            self._remove(key)
+        size = self._sizeof(entry)
+        if self._max_bytes and size > self._max_bytes:
+            logger.warn("Not caching key %s in memory: %d bytes exceeds "
+                        "memory_max_bytes", key, size)
+            self.evictions['bytes'] += 1
+            return
+        self._entries[key] = entry
+        self._sizes[key] = size
+        self._bytes += size
+        self._maybe_sweep()
+        self._enforce_limits()
+
+    def __delitem__(self, key):
+        if key not in self._entries:
+            raise KeyError(key)
+        self._remove(key)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __iter__(self):
+        return iter(self._entries.keys())
+
+    def __len__(self):
+        return len(self._entries)
+
+    def peek(self, key):
+        """Return the entry for key without counting it as a use."""
+        return self._entries.get(key)
+
+    def size_of(self, key):
+        return self._sizes.get(key, 0)
+
+    @property
+    def size_bytes(self):
+        return self._bytes
+
+    def sweep(self):
+        """Drop every entry older than the store's ttl."""
+        self._last_sweep = self._now()
+        if not self._ttl:
+            return 0
+        cutoff = self._last_sweep - self._ttl
+        expired = [key for key, entry in self._entries.iteritems()
+                   if entry[0] <= cutoff]
+        for key in expired:
+            self._remove(key)
+        self.evictions['expired'] += len(expired)
+        return len(expired)
+
+    def snapshot(self):
+        """Return the entries as (key, entry) pairs, least recent first."""
+        return self._entries.items()
+
+    def restore(self, items):
+        """Load (key, entry) pairs produced by snapshot().
+
+        Entries keep their birthdays, so they expire as if they had never
+        left memory; entries past the store ttl and keys already present
+        are skipped. Returns the number of entries loaded.
+        """
+        cutoff = self._now() - self._ttl if self._ttl else None
+        loaded = 0
+        for key, entry in items:
+            if key in self._entries or (cutoff is not None and
+                                        entry[0] <= cutoff):
+                continue
+            self[key] = entry
+            loaded += 1
+        return loaded
+
+    def stats(self):
+        return {
+            'entries': len(self._entries),
+            'bytes': self._bytes,
+            'max_entries': self._max_entries,
+            'max_bytes': self._max_bytes,
+            'evictions': dict(self.evictions),
+        }
+
+    def _maybe_sweep(self):
+        if (self._sweep_interval is not None and
+                self._now() - self._last_sweep >= self._sweep_interval):
+            self.sweep()
+
+    def _enforce_limits(self):
+        while self._max_entries and len(self._entries) > self._max_entries:
+            self._remove(self._victim())
+            self.evictions['entries'] += 1
+        while self._max_bytes and self._bytes > self._max_bytes:
+            self._remove(self._victim())
+            self.evictions['bytes'] += 1
+
+    def _victim(self):
+        if self._policy == TTL:
+            return min(self._entries.iteritems(),
+                       key=lambda item: item[1][0])[0]
+        return next(iter(self._entries))
+
+    def _remove(self, key):
+        del self._entries[key]
+        self._bytes -= self._sizes.pop(key, 0)
+
+    @staticmethod
+    def _now():
+        return calendar.timegm(time.gmtime())
@@ -0,0 +1,191 @@
+from fusion.common.process import ProcessOwner
+
+COUNTER = "counter"
+HISTOGRAM = "histogram"
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+                   10.0, 30.0, 60.0)
+
+
+class MetricsRegistry(object):
+    """Hold the metric families of this process.
+
+    render() writes every family in the Prometheus text exposition format
+    for a metrics endpoint to serve. Each worker process keeps its own
+    values.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+
+    def register(self, metric):
+        self._metrics[metric.name] = metric
+
+    def get(self, name):
+        return self._metrics.get(name)
+
+    def collect(self):
+        """Return a list of (metric, samples) sorted by metric name.
+
+        Samples are (name, labels, value) tuples.
+        """
+        return [(metric, list(metric.samples()))
+                for _, metric in sorted(self._metrics.iteritems())]
+
+    def render(self):
+        lines = []
+        for metric, samples in self.collect():
+            lines.append("# HELP %s %s" % (metric.name, metric.doc))
+            lines.append("# TYPE %s %s" % (metric.name, metric.kind))
+            for name, labels, value in samples:
+                lines.append("%s%s %s" % (name, _format_labels(labels),
+                                          _format_value(value)))
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        for metric in self._metrics.itervalues():
+            metric.reset()
+
+
+REGISTRY = MetricsRegistry()
+
+
+class Metric(object):
+    """A metric family whose series are selected by label values."""
+
+    kind = None
+
+    def __init__(self, name, doc, labelnames=(), registry=None):
+        self.name = name
+        self.doc = doc
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._owner = ProcessOwner(claimed=True)
+        (registry or REGISTRY).register(self)
+
+    def labels(self, **labels):
+        self._check_fork()
+        key = tuple(_label_value(labels.get(name))
+                    for name in self.labelnames)
+        child = self._children.get(key)
+        if child is None:
+            child = self._children[key] = self._new_child()
+        return child
+
+    def samples(self):
+        self._check_fork()
+        for key, child in sorted(self._children.iteritems()):
+            labels = zip(self.labelnames, key)
+            for sample in self._child_samples(child, labels):
+                yield sample
+
+    def reset(self):
+        self._children = {}
+
+    def _check_fork(self):
+        # Values recorded by a parent, e.g. while warming up before the
+        # workers fork, would otherwise be reported by every worker.
+        if self._owner.claim():
+            self._children = {}
+
+    def _new_child(self):
+        raise NotImplementedError()
+
+    def _child_samples(self, child, labels):
+        raise NotImplementedError()
+
+
+class _CounterValue(object):
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+
+class Counter(Metric):
+    """A value that only goes up, like a number of hits or bytes."""
+
+    kind = COUNTER
+
+    def _new_child(self):
+        return _CounterValue()
+
+    def _child_samples(self, child, labels):
+        yield self.name, labels, child.value
+
+    def total(self, **labels):
+        """Sum the series whose labels have the given values."""
+        self._check_fork()
+        wanted = [(index, _label_value(labels[name]))
+                  for index, name in enumerate(self.labelnames)
+                  if name in labels]
+        return sum(child.value for key, child in self._children.iteritems()
+                   if all(key[index] == value for index, value in wanted))
+
+
+class _HistogramValue(object):
+    __slots__ = ('buckets', 'counts', 'count', 'sum')
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+                break
+
+
+class Histogram(Metric):
+    """Observations, like durations, counted into cumulative buckets."""
+
+    kind = HISTOGRAM
+
+    def __init__(self, name, doc, labelnames=(), buckets=DEFAULT_BUCKETS,
+                 registry=None):
+        self.buckets = tuple(sorted(buckets))
+        super(Histogram, self).__init__(name, doc, labelnames, registry)
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def _child_samples(self, child, labels):
+        cumulative = 0
+        for bound, count in zip(child.buckets, child.counts):
+            cumulative += count
+            yield (self.name + "_bucket",
+                   labels + [('le', _format_value(bound))], cumulative)
+        yield self.name + "_bucket", labels + [('le', "+Inf")], child.count
+        yield self.name + "_sum", labels, child.sum
+        yield self.name + "_count", labels, child.count
+
+
+def _label_value(value):
+    if value is None:
+        return ""
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    return str(value)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{%s}" % ",".join(
+        '%s="%s"' % (name, value.replace('\\', '\\\\').replace('"', '\\"')
+                     .replace('\n', '\\n'))
+        for name, value in labels)
+
+
+def _format_value(value):
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
@@ -0,0 +1,32 @@
+import webob
+
+from fusion.common import metrics
+from fusion.common import wsgi
+
+METRICS_PATH = "/metrics"
+CONTENT_TYPE = "text/plain; version=0.0.4"
+
+
+class MetricsMiddleware(wsgi.Middleware):
+    """Answer GET /metrics with the metrics of the worker serving it.
+
+    The body uses the Prometheus text exposition format.
+    """
+
+    def process_request(self, request):
+        if request.method != 'GET' or request.path_info != METRICS_PATH:
+            return None
+        response = webob.Response(status=200)
+        response.headers['Content-Type'] = CONTENT_TYPE
+        response.body = metrics.REGISTRY.render()
+        return response
+
+
+def MetricsMiddleware_filter_factory(global_conf, **local_conf):
+    """
+    Factory method for paste.deploy
+    """
+    def filter(app):
+        return MetricsMiddleware(app)
+
+    return filter
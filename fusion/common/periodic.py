@@ -0,0 +1,29 @@
+import eventlet
+
+from fusion.common.process import ProcessOwner
+
+
+class PeriodicTask(object):
+    """Call run_periodic() every interval seconds once started.
+
+    start() schedules the calls from a greenthread in the calling process.
+    A schedule started before a fork does not run in the child, so each
+    worker starts its own.
+    """
+
+    def __init__(self, interval=None):
+        self._interval = interval
+        self._schedule = ProcessOwner()
+
+    def run_periodic(self):
+        raise NotImplementedError()
+
+    def start(self):
+        if not self._interval or not self._schedule.claim():
+            return
+        eventlet.spawn_n(self._run_schedule, self._schedule.pid)
+
+    def _run_schedule(self, pid):
+        while self._schedule.pid == pid:
+            eventlet.sleep(self._interval)
+            self.run_periodic()
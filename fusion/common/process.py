@@ -0,0 +1,24 @@
+import os
+
+
+class ProcessOwner(object):
+    """Track the process that owns some per-process state.
+
+    Greenthreads, connections and queues created before a fork do not
+    work in the child, and values inherited from the parent belong to it.
+    claim() makes the calling process the owner and returns True when it
+    was not already, so each process sets up its own state exactly once.
+    """
+
+    def __init__(self, claimed=False):
+        self.pid = os.getpid() if claimed else None
+
+    def claim(self):
+        pid = os.getpid()
+        if self.pid == pid:
+            return False
+        self.pid = pid
+        return True
+
+    def release(self):
+        self.pid = None
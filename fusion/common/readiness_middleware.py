@@ -0,0 +1,36 @@
+import json
+
+import webob
+
+from fusion.common import cache_warmer
+from fusion.common import wsgi
+
+READY_PATH = "/ready"
+
+
+class ReadinessMiddleware(wsgi.Middleware):
+    """Answer GET /ready with 200 once cache warm-up has finished.
+
+    Until then the worker answers 503 so load balancers keep traffic
+    away from it.
+    """
+
+    def process_request(self, request):
+        if request.method != 'GET' or request.path_info != READY_PATH:
+            return None
+        ready = cache_warmer.is_ready()
+        response = webob.Response(status=200 if ready else 503,
+                                  content_type='application/json')
+        response.body = json.dumps({'ready': ready,
+                                    'warmers': cache_warmer.stats()})
+        return response
+
+
+def ReadinessMiddleware_filter_factory(global_conf, **local_conf):
+    """
+    Factory method for paste.deploy
+    """
+    def filter(app):
+        return ReadinessMiddleware(app)
+
+    return filter
@@ -0,0 +1,160 @@
+import heapq
+import itertools
+from timeit import default_timer
+
+import eventlet
+
+from fusion.common import config
+from fusion.common.process import ProcessOwner
+from fusion.openstack.common import log as logging
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+
+class RefreshExecutor(object):
+    """Run background cache refreshes on a bounded set of greenthreads.
+
+    At most concurrency refreshes run at once. Further keys wait in a
+    priority queue of at most max_queue keys, most requested first: a key
+    submitted again while it waits gains a hit, and a key submitted while
+    it is queued or running is never queued twice. Keys arriving at a full
+    queue are dropped and picked up again by a later stale read.
+    """
+
+    def __init__(self, concurrency=4, max_queue=1000):
+        self._concurrency = max(concurrency or 1, 1)
+        self._max_queue = max_queue
+        self._heap = []
+        self._queued = {}
+        self._running = set()
+        self._owner = ProcessOwner(claimed=True)
+        self._seq = itertools.count()
+        self.stats = {'submitted': 0, 'deduplicated': 0, 'dropped': 0,
+                      'completed': 0, 'failed': 0}
+        self.latency = {'count': 0, 'total': 0.0, 'max': 0.0}
+        self.wait = {'count': 0, 'total': 0.0, 'max': 0.0}
+
+    @classmethod
+    def from_config(cls):
+        get = config.safe_get_config
+        return cls(concurrency=get("cache", "refresh_concurrency"),
+                   max_queue=get("cache", "refresh_queue_size"))
+
+    @property
+    def depth(self):
+        return len(self._queued)
+
+    @property
+    def running(self):
+        self._check_fork()
+        return len(self._running)
+
+    def is_pending(self, key):
+        self._check_fork()
+        return key in self._queued or key in self._running
+
+    def submit(self, key, func, *args):
+        """Queue func(*args) as the refresh of key.
+
+        Returns True when it was queued, False when the key is already
+        pending or the queue is full.
+        """
+        self._check_fork()
+        queued = self._queued.get(key)
+        if queued is not None:
+            queued['hits'] += 1
+            self._push(key, queued['hits'])
+            self.stats['deduplicated'] += 1
+            return False
+        if key in self._running:
+            self.stats['deduplicated'] += 1
+            return False
+        if self._max_queue and len(self._queued) >= self._max_queue:
+            self.stats['dropped'] += 1
+            logger.warn("Refresh queue is full; dropping refresh of key %s",
+                        key)
+            return False
+        self._queued[key] = {'hits': 1, 'job': (func, args),
+                             'queued_at': default_timer()}
+        self._push(key, 1)
+        self.stats['submitted'] += 1
+        self._dispatch()
+        return True
+
+    def metrics(self):
+        return dict(self.stats,
+                    depth=self.depth,
+                    running=self.running,
+                    latency=self._summary(self.latency),
+                    wait=self._summary(self.wait))
+
+    def _push(self, key, hits):
+        heapq.heappush(self._heap, (-hits, next(self._seq), key))
+        # Re-prioritised keys leave stale heap items behind.
+        if len(self._heap) > 2 * len(self._queued) + 64:
+            self._heap = [(-item['hits'], next(self._seq), queued_key)
+                          for queued_key, item in self._queued.iteritems()]
+            heapq.heapify(self._heap)
+
+    def _pop(self):
+        while self._heap:
+            hits, _, key = heapq.heappop(self._heap)
+            item = self._queued.get(key)
+            if item is not None and item['hits'] == -hits:
+                del self._queued[key]
+                return key, item
+        return None, None
+
+    def _dispatch(self):
+        while len(self._running) < self._concurrency:
+            key, item = self._pop()
+            if key is None:
+                return
+            self._running.add(key)
+            self._record(self.wait, default_timer() - item['queued_at'])
+            eventlet.spawn_n(self._run, self._owner.pid, key, item['job'])
+
+    def _run(self, pid, key, job):
+        func, args = job
+        started = default_timer()
+        try:
+            func(*args)
+            self.stats['completed'] += 1
+        except Exception:
+            self.stats['failed'] += 1
+            logger.warn("Refresh of key %s failed", key, exc_info=True)
+        finally:
+            self._record(self.latency, default_timer() - started)
+            if pid == self._owner.pid:
+                self._running.discard(key)
+                self._dispatch()
+
+    def _check_fork(self):
+        # Refreshes queued or running in a parent do not exist in a child.
+        if self._owner.claim():
+            self._heap = []
+            self._queued = {}
+            self._running = set()
+
+    @staticmethod
+    def _record(summary, seconds):
+        summary['count'] += 1
+        summary['total'] += seconds
+        summary['max'] = max(summary['max'], seconds)
+
+    @staticmethod
+    def _summary(summary):
+        count = summary['count']
+        return {'count': count,
+                'avg': summary['total'] / count if count else 0.0,
+                'max': summary['max']}
+
+
+def get_executor():
+    """Return the process-wide refresh executor."""
+    global _executor
+    if _executor is None:
+        _executor = RefreshExecutor.from_config()
+    return _executor
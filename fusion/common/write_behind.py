@@ -0,0 +1,99 @@
+import atexit
+import collections
+import weakref
+
+import eventlet
+
+from fusion.common.process import ProcessOwner
+from fusion.openstack.common import log as logging
+
+logger = logging.getLogger(__name__)
+
+QUEUES = weakref.WeakSet()
+
+
+class WriteBehindQueue(object):
+    """Write cache entries to a backing store from a background greenthread.
+
+    Writes are queued per key, so a key written again before the worker
+    gets to it is stored only once with its latest value. At most max_size
+    keys are pending; writes for new keys beyond that are dropped and
+    counted. A single worker greenthread drains the queue, keeping slow
+    backing stores and serialisation off the request path. on_write, if
+    given, is called with each key once it has been written.
+    """
+
+    def __init__(self, backing_store, max_size=1000, on_write=None):
+        self._backing_store = backing_store
+        self._max_size = max_size
+        self._on_write = on_write
+        self._pending = collections.OrderedDict()
+        self._worker = ProcessOwner()
+        self.stats = {'written': 0, 'coalesced': 0, 'dropped': 0,
+                      'failed': 0}
+        QUEUES.add(self)
+
+    @property
+    def depth(self):
+        return len(self._pending)
+
+    def put(self, key, data):
+        if key in self._pending:
+            self.stats['coalesced'] += 1
+        elif self._max_size and len(self._pending) >= self._max_size:
+            self.stats['dropped'] += 1
+            logger.warn("Write-behind queue for %s is full; dropping write "
+                        "for key %s", self._backing_store.__class__.__name__,
+                        key)
+            return False
+        self._pending[key] = data
+        self._ensure_worker()
+        return True
+
+    def discard(self, key):
+        """Drop a pending write of key."""
+        self._pending.pop(key, None)
+
+    def flush(self):
+        """Write every pending entry from the calling thread."""
+        while self._pending:
+            self._write_next()
+
+    def _ensure_worker(self):
+        if self._worker.claim():
+            eventlet.spawn_n(self._run)
+
+    def _run(self):
+        try:
+            while self._pending:
+                self._write_next()
+                eventlet.sleep(0)
+        finally:
+            self._worker.release()
+
+    def _write_next(self):
+        key, data = self._pending.popitem(last=False)
+        try:
+            written = self._backing_store.cache(key, data)
+        except Exception:
+            written = False
+            logger.warn("Write-behind of key %s failed", key, exc_info=True)
+        if not written:
+            self.stats['failed'] += 1
+            return
+        self.stats['written'] += 1
+        if self._on_write:
+            self._on_write([key])
+
+
+def flush_all():
+    """Write the pending entries of every queue in this process.
+
+    Forked workers do not run atexit hooks when they are terminated, so
+    servers call this when a worker is stopped as well.
+    """
+    for queue in list(QUEUES):
+        queue.flush()
+
+
+atexit.register(flush_all)
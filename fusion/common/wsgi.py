@@ -166,10 +166,13 @@ def get_socket(conf, default_port):
 class Server(object):
     """Server class to manage multiple WSGI sockets and applications."""
 
-    def __init__(self, threads=1000):
+    def __init__(self, threads=1000, on_worker_start=None,
+                 on_worker_stop=None):
         self.threads = threads
         self.children = []
         self.running = True
+        self.on_worker_start = on_worker_start
+        self.on_worker_stop = on_worker_stop
 
     def start(self, application, conf, default_port):
         """
@@ -202,6 +205,8 @@ class Server(object):
         if conf.workers == 0:
             # Useful for profiling, test, debug etc.
             self.pool = eventlet.GreenPool(size=self.threads)
+            self._handle_worker_stop()
+            self._worker_started()
             self.pool.spawn_n(self._single_run, application, self.sock)
             return
 
@@ -244,6 +249,7 @@ class Server(object):
         if pid == 0:
             signal.signal(signal.SIGHUP, signal.SIG_DFL)
             signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            self._handle_worker_stop()
             self.run_server()
             self.logger.info(_('Child %d exiting normally') % os.getpid())
             return
@@ -257,6 +263,7 @@ class Server(object):
         eventlet.hubs.use_hub('poll')
         eventlet.patcher.monkey_patch(all=False, socket=True)
         self.pool = eventlet.GreenPool(size=self.threads)
+        self._worker_started()
         try:
             eventlet.wsgi.server(self.sock,
                                  self.application,
@@ -269,6 +276,34 @@ class Server(object):
                 raise
         self.pool.waitall()
 
+    def _worker_started(self):
+        """Run the on_worker_start hook in a worker about to serve."""
+        if self.on_worker_start:
+            self.on_worker_start()
+
+    def _handle_worker_stop(self):
+        """Run the on_worker_stop hook before SIGTERM ends this worker."""
+        if self.on_worker_stop:
+            signal.signal(signal.SIGTERM, self._worker_terminated)
+
+    def _worker_terminated(self, *args):
+        # The hook may do green I/O, which cannot run from the hub the
+        # signal may have interrupted; run it from a greenthread instead.
+        # A second SIGTERM ends the worker at once.
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        eventlet.spawn_n(self._worker_stopped)
+
+    def _worker_stopped(self):
+        try:
+            self.on_worker_stop()
+        except Exception:
+            self.logger.exception(_('Error stopping worker %d') %
+                                  os.getpid())
+        finally:
+            # Die from the signal as the worker would have without the
+            # hook.
+            os.kill(os.getpid(), signal.SIGTERM)
+
     def _single_run(self, application, sock):
         """Start a WSGI server in a new green thread."""
         self.logger.info(_("Starting single process server"))
@@ -1,12 +1,19 @@
 import calendar
 
+import eventlet
 import mock
-from eventlet.green import threading
 import unittest
 
 from fusion.common import cache
-from fusion.common.cache import BACKGROUND_REFRESH
+from fusion.common.cache import GENERATIONS
+from fusion.common.cache import IN_FLIGHT
+from fusion.common.cache import REFRESH_BACKOFF
 from fusion.common.cache_backing_store import BackingStore, MEMCACHE
+from fusion.common.cache_backing_store import CacheEntry, MISSING
+from fusion.common.invalidation import LocalBus
+from fusion.common.memory_store import MemoryStore
+from fusion.common import metrics
+from fusion.common.write_behind import WriteBehindQueue
 from oslo.config import cfg
 
 
@@ -14,7 +21,13 @@ class CacheTests(unittest.TestCase):
 
     def setUp(self):
         cfg.CONF.__contains__ = mock.MagicMock(return_value=True)
-        BACKGROUND_REFRESH.clear()
+        REFRESH_BACKOFF.clear()
+        IN_FLIGHT.clear()
+        GENERATIONS.clear()
+        metrics.REGISTRY.reset()
+        timer = mock.patch.object(cache, "default_timer", return_value=0)
+        timer.start()
+        self.addCleanup(timer.stop)
 
     @mock.patch.object(calendar, "timegm")
     def test_in_memory_cache_hit(self, mock_timegm):
@@ -33,8 +46,7 @@ class CacheTests(unittest.TestCase):
     @mock.patch.object(calendar, "timegm")
     def test_backend_store_cache_hit(self, mock_timegm, mock_create):
         mock_backing_store = mock_create.return_value
-        mock_backing_store.exists.return_value = True
-        mock_backing_store.retrieve.side_effect = [(10, "data"), (10, "data")]
+        mock_backing_store.lookup.return_value = CacheEntry("data", 10, True)
         _func = mock.Mock(__name__="key")
         mock_timegm.return_value = 20
 
@@ -49,18 +61,18 @@ class CacheTests(unittest.TestCase):
         self.assertEqual((10, "data"), in_memory_store["key"])
         self.assertTrue(mock_timegm.called)
         self.assertFalse(_func.called)
-        mock_create.assert_called_once_with(MEMCACHE, 120)
-        mock_backing_store.exists.assert_called_once_with("key")
-        mock_backing_store.retrieve.assert_has_calls([
-            mock.call('key'),
-            mock.call('key')
-        ])
+        mock_create.assert_called_once_with(MEMCACHE, 120,
+                                            stale_grace=mock.ANY,
+                                            max_stale=mock.ANY)
+        mock_backing_store.lookup.assert_called_once_with("key")
+        self.assertFalse(mock_backing_store.exists.called)
+        self.assertFalse(mock_backing_store.retrieve.called)
 
     @mock.patch.object(BackingStore, 'create')
     @mock.patch.object(calendar, "timegm")
     def test_cache_miss(self, mock_timegm, mock_create):
         mock_backing_store = mock_create.return_value
-        mock_backing_store.exists.return_value = False
+        mock_backing_store.lookup.return_value = MISSING
         _func = mock.Mock(__name__="key", return_value="data")
         mock_timegm.return_value = 20
 
@@ -74,8 +86,10 @@ class CacheTests(unittest.TestCase):
         self.assertEquals(result, "data")
         self.assertEqual((20, "data"), in_memory_store["key"])
         self.assertTrue(mock_timegm.called)
-        mock_create.assert_called_once_with(MEMCACHE, 120)
-        mock_backing_store.exists.assert_called_once_with("key")
+        mock_create.assert_called_once_with(MEMCACHE, 120,
+                                            stale_grace=mock.ANY,
+                                            max_stale=mock.ANY)
+        mock_backing_store.lookup.assert_called_once_with("key")
         mock_backing_store.cache.assert_called_once_with("key", (20, "data"))
 
     @mock.patch.object(calendar, "timegm")
@@ -101,6 +115,7 @@ class CacheTests(unittest.TestCase):
             return False if args[0] == "cache" else True
 
         cfg.CONF.reset()
+        self.addCleanup(setattr, cfg, 'CONF', cfg.CONF)
         cfg.CONF = mock.Mock()
         cfg.CONF.__contains__ = mock.Mock(side_effect=look_for_cache_conf)
         unwrapped_function = mock.Mock()
@@ -108,42 +123,680 @@ class CacheTests(unittest.TestCase):
         returned_function = _cache(unwrapped_function)
         self.assertEqual(returned_function, unwrapped_function)
 
-    @mock.patch('eventlet.spawn_n')
-    @mock.patch.object(threading, 'Lock')
-    def test_start_background_refresh(self, mock_lock, mock_spawn):
-        lock = mock_lock.return_value
+    def test_start_background_refresh(self):
+        executor = mock.Mock()
         _func = mock.Mock(__name__="key")
 
-        _cache = cache.Cache(timeout=120, store={})
+        _cache = cache.Cache(timeout=120, store={}, executor=executor)
         _cache.start_background_refresh("key", _func, (), {})
 
-        self.assertDictEqual(BACKGROUND_REFRESH, {
-            'key': {
-                'background_thread': mock_spawn.return_value,
-                'refresh_lock': lock
-            }
-        })
-        lock.acquire.assert_called_once_with(False)
-        mock_spawn.assert_called_once_with(_cache.refresh_cache, "key",
-                                           _func, (), {})
-        self.assertTrue(lock.release.called)
+        executor.submit.assert_called_once_with(
+            "key", _cache.background_refresh, "key", _func, (), {})
 
-    @mock.patch('eventlet.spawn_n')
-    @mock.patch.object(threading, 'Lock')
-    def test_start_background_refresh_exc_handling(self, mock_lock,
-                                                   mock_spawn):
-        lock = mock_lock.return_value
+    @mock.patch('fusion.common.refresh_executor.get_executor')
+    def test_start_background_refresh_uses_shared_executor(self,
+                                                           mock_executor):
+        _cache = cache.Cache(timeout=120, store={})
+        _cache.start_background_refresh("key", mock.Mock(), (), {})
+
+        self.assertTrue(mock_executor.return_value.submit.called)
+
+    @mock.patch.object(calendar, "timegm")
+    def test_concurrent_misses_share_one_load(self, mock_timegm):
+        mock_timegm.return_value = 20
+        calls = []
+
+        def _func():
+            calls.append(1)
+            eventlet.sleep(0.01)
+            return "data"
+
+        _cache = cache.Cache(timeout=120, store={}, wait_timeout=5)
+        _cache.get_hash = mock.Mock(return_value="key")
+        _wrapped_func = _cache(_func)
+        pool = eventlet.GreenPool()
+        results = list(pool.imap(lambda _: _wrapped_func(), range(5)))
+
+        self.assertEqual(["data"] * 5, results)
+        self.assertEqual(1, len(calls))
+        self.assertEqual({}, IN_FLIGHT)
+
+    @mock.patch.object(calendar, "timegm")
+    def test_concurrent_misses_share_exception(self, mock_timegm):
+        mock_timegm.return_value = 20
+        calls = []
+
+        def _func():
+            calls.append(1)
+            eventlet.sleep(0.01)
+            raise ValueError("boom")
+
+        _cache = cache.Cache(timeout=120, store={}, wait_timeout=5)
+        _cache.get_hash = mock.Mock(return_value="key")
+        _wrapped_func = _cache(_func)
+        first = eventlet.spawn(_wrapped_func)
+        second = eventlet.spawn(_wrapped_func)
+
+        self.assertRaises(ValueError, first.wait)
+        self.assertRaises(ValueError, second.wait)
+        self.assertEqual(1, len(calls))
+        self.assertEqual({}, IN_FLIGHT)
+
+    @mock.patch.object(calendar, "timegm")
+    def test_in_flight_wait_timeout(self, mock_timegm):
+        mock_timegm.return_value = 20
+        calls = []
+
+        def _func():
+            calls.append(1)
+            if len(calls) == 1:
+                eventlet.sleep(0.1)
+            return "data"
+
+        _cache = cache.Cache(timeout=120, store={}, wait_timeout=0.01)
+        _cache.get_hash = mock.Mock(return_value="key")
+        _wrapped_func = _cache(_func)
+        first = eventlet.spawn(_wrapped_func)
+        eventlet.sleep(0)
+        second = eventlet.spawn(_wrapped_func)
+
+        self.assertEqual("data", second.wait())
+        self.assertEqual("data", first.wait())
+        self.assertEqual(2, len(calls))
+
+    @mock.patch.object(calendar, "timegm")
+    def test_refresh_failure_backs_off(self, mock_timegm):
+        mock_timegm.return_value = 200
+        _func = mock.Mock(__name__="key", side_effect=ValueError())
+
+        _cache = cache.Cache(timeout=120, store={"key": (10, "data")})
+        _cache.background_refresh("key", _func, (), {})
+        _cache.background_refresh("key", _func, (), {})
+
+        self.assertEqual(2, REFRESH_BACKOFF["key"]['failures'])
+        self.assertEqual(210, REFRESH_BACKOFF["key"]['retry_at'])
+        self.assertTrue(_cache.in_backoff("key"))
+        self.assertEqual((10, "data"), _cache._store["key"])
+
+    @mock.patch.object(calendar, "timegm")
+    def test_refresh_success_clears_backoff(self, mock_timegm):
+        mock_timegm.return_value = 200
+        _func = mock.Mock(__name__="key", return_value="new")
+        REFRESH_BACKOFF["key"] = {'failures': 3, 'retry_at': 100}
+
+        _cache = cache.Cache(timeout=120, store={})
+        _cache.refresh_cache("key", _func, (), {})
+
+        self.assertEqual({}, REFRESH_BACKOFF)
+        self.assertEqual((200, "new"), _cache._store["key"])
+
+    @mock.patch.object(calendar, "timegm")
+    def test_background_refresh_holds_lease(self, mock_timegm):
+        mock_timegm.return_value = 200
+        _func = mock.Mock(__name__="key", return_value="new")
+        backing_store = mock.Mock()
+        backing_store.acquire_lease.return_value = 7
+        backing_store.cache_fenced.return_value = True
+
+        _cache = cache.Cache(timeout=120, store={})
+        _cache._backing_store = backing_store
+        _cache._write_behind = mock.Mock()
+        _cache.background_refresh("key", _func, (), {})
+
+        backing_store.acquire_lease.assert_called_once_with("key", 60)
+        backing_store.cache_fenced.assert_called_once_with(
+            "key", (200, "new"), 7)
+        self.assertFalse(_cache._write_behind.put.called)
+        backing_store.release_lease.assert_called_once_with("key", 7)
+
+    @mock.patch.object(calendar, "timegm")
+    def test_background_refresh_defers_to_lease_holder(self, mock_timegm):
+        mock_timegm.return_value = 200
         _func = mock.Mock(__name__="key")
-        mock_spawn.side_effect = StandardError()
+        backing_store = mock.Mock()
+        backing_store.acquire_lease.return_value = None
+        backing_store.lookup.return_value = CacheEntry("old", 10, True)
+
+        _cache = cache.Cache(timeout=120, store={"key": (10, "old")})
+        _cache._backing_store = backing_store
+        _cache.background_refresh("key", _func, (), {})
+
+        self.assertFalse(_func.called)
+        self.assertEqual(205, REFRESH_BACKOFF["key"]['retry_at'])
+        self.assertFalse(backing_store.release_lease.called)
+
+    @mock.patch.object(calendar, "timegm")
+    def test_background_refresh_picks_up_fresh_value(self, mock_timegm):
+        mock_timegm.return_value = 200
+        backing_store = mock.Mock()
+        backing_store.acquire_lease.return_value = None
+        backing_store.lookup.return_value = CacheEntry("new", 190, True)
+
+        _cache = cache.Cache(timeout=120, store={"key": (10, "old")})
+        _cache._backing_store = backing_store
+        _cache.background_refresh("key", mock.Mock(), (), {})
+
+        self.assertEqual((190, "new"), _cache._store["key"])
+        self.assertEqual({}, REFRESH_BACKOFF)
+
+    @mock.patch.object(calendar, "timegm")
+    def test_lost_lease_keeps_value_local(self, mock_timegm):
+        mock_timegm.return_value = 200
+        _func = mock.Mock(__name__="key", return_value="new")
+        backing_store = mock.Mock()
+        backing_store.acquire_lease.return_value = 7
+        backing_store.cache_fenced.return_value = False
 
         _cache = cache.Cache(timeout=120, store={})
-        _cache.start_background_refresh("key", _func, (), {})
+        _cache._backing_store = backing_store
+        _cache._bus = mock.Mock()
+        _cache.background_refresh("key", _func, (), {})
+
+        self.assertEqual((200, "new"), _cache._store["key"])
+        self.assertFalse(backing_store.cache.called)
+        self.assertFalse(_cache._bus.publish.called)
+        backing_store.release_lease.assert_called_once_with("key", 7)
+
+    @mock.patch.object(calendar, "timegm")
+    def test_background_refresh_skipped_during_backoff(self, mock_timegm):
+        mock_timegm.return_value = 200
+        REFRESH_BACKOFF["key"] = {'failures': 1, 'retry_at': 205}
+        executor = mock.Mock()
+
+        _cache = cache.Cache(timeout=120, store={}, executor=executor)
+        _cache.start_background_refresh("key", mock.Mock(), (), {})
+
+        self.assertFalse(executor.submit.called)
+
+    @mock.patch.object(calendar, "timegm")
+    def test_stale_value_served_when_refresh_fails(self, mock_timegm):
+        mock_timegm.return_value = 300
+        _func = mock.Mock(__name__="key", side_effect=ValueError())
+
+        _cache = cache.Cache(timeout=120, store={"key": (10, "data")},
+                             stale_grace=60, max_stale=1000)
+        _cache.get_hash = mock.Mock(return_value="key")
+        result = _cache(_func)()
+
+        self.assertEqual("data", result)
+        self.assertEqual(1, _func.call_count)
+        self.assertTrue(_cache.in_backoff("key"))
+
+    @mock.patch.object(calendar, "timegm")
+    def test_stale_value_served_without_refresh_during_backoff(
+            self, mock_timegm):
+        mock_timegm.return_value = 300
+        _func = mock.Mock(__name__="key")
+        REFRESH_BACKOFF["key"] = {'failures': 1, 'retry_at': 305}
+
+        _cache = cache.Cache(timeout=120, store={"key": (10, "data")},
+                             stale_grace=60, max_stale=1000)
+        _cache.get_hash = mock.Mock(return_value="key")
+        result = _cache(_func)()
+
+        self.assertEqual("data", result)
+        self.assertFalse(_func.called)
+
+    @mock.patch.object(calendar, "timegm")
+    def test_refresh_error_raised_past_max_stale(self, mock_timegm):
+        mock_timegm.return_value = 2000
+        _func = mock.Mock(__name__="key", side_effect=ValueError())
+
+        _cache = cache.Cache(timeout=120, store={"key": (10, "data")},
+                             stale_grace=60, max_stale=1000)
+        _cache.get_hash = mock.Mock(return_value="key")
+
+        self.assertRaises(ValueError, _cache(_func))
+
+    @mock.patch.object(calendar, "timegm")
+    def test_refresh_past_grace_is_synchronous(self, mock_timegm):
+        mock_timegm.return_value = 300
+        _func = mock.Mock(__name__="key", return_value="new")
+
+        _cache = cache.Cache(timeout=120, store={"key": (10, "data")},
+                             stale_grace=60, max_stale=1000)
+        _cache.get_hash = mock.Mock(return_value="key")
+        result = _cache(_func)()
+
+        self.assertEqual("new", result)
+        self.assertEqual((300, "new"), _cache._store["key"])
+
+    @mock.patch.object(BackingStore, 'create')
+    @mock.patch.object(calendar, "timegm")
+    def test_update_cache_write_behind(self, mock_timegm, mock_create):
+        mock_timegm.return_value = 20
+        mock_backing_store = mock_create.return_value
+
+        _cache = cache.Cache(timeout=120, store={}, backing_store=MEMCACHE,
+                             write_behind=True)
+        _cache.update_cache("key", "data")
+
+        self.assertFalse(mock_backing_store.cache.called)
+        eventlet.sleep(0)
+        mock_backing_store.cache.assert_called_once_with("key", (20, "data"))
+
+    @mock.patch.object(BackingStore, 'create')
+    @mock.patch.object(calendar, "timegm")
+    def test_get_many(self, mock_timegm, mock_create):
+        mock_timegm.return_value = 20
+        mock_backing_store = mock_create.return_value
+        mock_backing_store.get_many.return_value = {
+            "b": CacheEntry("data-b", 10, True),
+            "c": MISSING,
+        }
+        _func = mock.Mock(__name__="key", return_value="data-c")
+
+        in_memory_store = {"a": (10, "data-a")}
+        _cache = cache.Cache(timeout=120, store=in_memory_store,
+                             backing_store=MEMCACHE)
+        _cache.get_hash = mock.Mock(side_effect=lambda name, arg: arg)
+        _wrapped_func = _cache(_func)
+        results = _wrapped_func.get_many([("a",), ("b",), ("c",)])
+
+        self.assertEqual(["data-a", "data-b", "data-c"], results)
+        mock_backing_store.get_many.assert_called_once_with(["b", "c"])
+        _func.assert_called_once_with("c")
+        self.assertEqual((10, "data-b"), in_memory_store["b"])
+        self.assertEqual((20, "data-c"), in_memory_store["c"])
+
+    @mock.patch.object(BackingStore, 'create')
+    @mock.patch.object(calendar, "timegm")
+    def test_set_many(self, mock_timegm, mock_create):
+        mock_timegm.return_value = 20
+        mock_backing_store = mock_create.return_value
+
+        in_memory_store = {}
+        _cache = cache.Cache(timeout=120, store=in_memory_store,
+                             backing_store=MEMCACHE)
+        _cache.set_many({"a": "data-a", "b": "data-b"})
+
+        self.assertEqual({"a": (20, "data-a"), "b": (20, "data-b")},
+                         in_memory_store)
+        mock_backing_store.set_many.assert_called_once_with(
+            {"a": (20, "data-a"), "b": (20, "data-b")})
+
+    @mock.patch.object(calendar, "timegm")
+    def test_refresh_invalidates_other_workers(self, mock_timegm):
+        mock_timegm.return_value = 200
+        peers = []
+        worker = cache.Cache(timeout=120, store={"key": (10, "old")},
+                             backing_store=MEMCACHE,
+                             invalidation_bus=LocalBus(peers))
+        other = cache.Cache(timeout=120, store={"key": (10, "old")},
+                            backing_store=MEMCACHE,
+                            invalidation_bus=LocalBus(peers))
+        worker._backing_store = mock.Mock()
+        other._backing_store = mock.Mock()
+        other._backing_store.lookup.return_value = CacheEntry("new", 200,
+                                                              True)
+
+        worker.update_cache("key", "new")
+
+        self.assertEqual((200, "new"), worker._store["key"])
+        self.assertNotIn("key", other._store)
+        self.assertEqual("new", other.get("key"))
+
+    @mock.patch.object(calendar, "timegm")
+    def test_failed_write_is_not_broadcast(self, mock_timegm):
+        mock_timegm.return_value = 200
+        peers = []
+        worker = cache.Cache(timeout=120, store={}, backing_store=MEMCACHE,
+                             invalidation_bus=LocalBus(peers))
+        other = cache.Cache(timeout=120, store={"key": (10, "old")},
+                            backing_store=MEMCACHE,
+                            invalidation_bus=LocalBus(peers))
+        worker._backing_store = mock.Mock()
+        worker._backing_store.cache.return_value = False
+        worker._backing_store.set_many.return_value = False
+
+        worker.update_cache("key", "new")
+        worker.set_many({"key": "new"})
+
+        self.assertEqual((10, "old"), other._store["key"])
+
+    def test_purge_drops_namespace_in_every_worker(self):
+        peers = []
+        worker = cache.Cache(timeout=120, store={}, backing_store=MEMCACHE,
+                             namespace="templates",
+                             invalidation_bus=LocalBus(peers))
+        store = {"fusion:templates:v1:a": (10, "a"),
+                 "fusion:other:v1:b": (10, "b")}
+        other = cache.Cache(timeout=120, store=store, backing_store=MEMCACHE,
+                            namespace="templates",
+                            invalidation_bus=LocalBus(peers))
+
+        worker.purge()
+
+        self.assertEqual(["fusion:other:v1:b"], list(other._store))
+
+    @mock.patch.object(calendar, "timegm")
+    def test_refresh_records_compute_time(self, mock_timegm):
+        mock_timegm.return_value = 200
+        cache.default_timer.side_effect = [10.0, 12.5]
+        _func = mock.Mock(__name__="key", return_value="new")
+
+        _cache = cache.Cache(timeout=120, store={})
+        _cache.refresh_cache("key", _func, (), {})
+
+        self.assertEqual((200, "new", 2.5), _cache._store["key"])
+        self.assertEqual(2.5, _cache.lookup("key").delta)
+
+    @mock.patch('random.random')
+    def test_refresh_early_near_expiry(self, mock_random):
+        mock_random.return_value = 0.9
+        _cache = cache.Cache(timeout=120, store={}, early_refresh_beta=1.0)
+        entry = CacheEntry("data", 0, True, delta=10)
+
+        # -ln(0.1) * 10 is about 23 seconds of lead time.
+        self.assertFalse(_cache.refresh_early(entry, 90))
+        self.assertTrue(_cache.refresh_early(entry, 100))
+        self.assertFalse(_cache.refresh_early(CacheEntry("data", 0, True),
+                                              119))
+
+    def test_refresh_early_disabled(self):
+        _cache = cache.Cache(timeout=120, store={}, early_refresh_beta=0)
+        entry = CacheEntry("data", 0, True, delta=10)
+
+        self.assertFalse(_cache.refresh_early(entry, 119))
+
+    @mock.patch('random.random')
+    @mock.patch.object(calendar, "timegm")
+    def test_early_refresh_serves_current_value(self, mock_timegm,
+                                                mock_random):
+        mock_timegm.return_value = 110
+        mock_random.return_value = 0.9
+        _func = mock.Mock(__name__="key")
+        _cache = cache.Cache(timeout=120, store={"key": (0, "data", 10)},
+                             early_refresh_beta=1.0)
+        _cache.get_hash = mock.Mock(return_value="key")
+        _cache.start_background_refresh = mock.Mock()
+
+        self.assertEqual("data", _cache(_func)())
+        _cache.start_background_refresh.assert_called_once_with(
+            "key", _func, (), {})
+
+    @mock.patch.object(calendar, "timegm")
+    def test_none_result_cached_briefly(self, mock_timegm):
+        mock_timegm.return_value = 200
+        _func = mock.Mock(__name__="key", return_value=None)
+        backing_store = mock.Mock()
+        backing_store.lookup.return_value = MISSING
+        _cache = cache.Cache(timeout=120, store={}, negative_timeout=30)
+        _cache._backing_store = backing_store
+        _cache.get_hash = mock.Mock(return_value="key")
+        _wrapped_func = _cache(_func)
+
+        self.assertIsNone(_wrapped_func())
+        mock_timegm.return_value = 229
+        self.assertIsNone(_wrapped_func())
+        self.assertEqual(1, _func.call_count)
+        self.assertNotIn("key", _cache._store)
+        self.assertFalse(backing_store.cache.called)
+
+        mock_timegm.return_value = 230
+        _func.return_value = "data"
+        self.assertEqual("data", _wrapped_func())
+        self.assertEqual(2, _func.call_count)
+        self.assertFalse(_cache.negative_hit("key"))
+
+    @mock.patch.object(calendar, "timegm")
+    def test_negative_entries_are_capped(self, mock_timegm):
+        mock_timegm.return_value = 200
+        _cache = cache.Cache(timeout=120, store={}, negative_timeout=30,
+                             negative_max_entries=2)
+
+        for key in ("a", "b", "c"):
+            _cache.cache_negative(key)
+
+        self.assertEqual(2, len(_cache._negative))
+        self.assertFalse(_cache.negative_hit("a"))
+
+    @mock.patch.object(calendar, "timegm")
+    def test_none_result_drops_stale_value(self, mock_timegm):
+        mock_timegm.return_value = 200
+        _func = mock.Mock(__name__="key", return_value=None)
+        _cache = cache.Cache(timeout=120, store={"key": (10, "old")},
+                             negative_timeout=30)
+
+        _cache.refresh_cache("key", _func, (), {})
+
+        self.assertNotIn("key", _cache._store)
+        self.assertTrue(_cache.negative_hit("key"))
+
+    @mock.patch.object(calendar, "timegm")
+    def test_none_result_deleted_from_backing_store(self, mock_timegm):
+        mock_timegm.return_value = 200
+        _func = mock.Mock(__name__="key", return_value=None)
+        _cache = cache.Cache(timeout=120, store={"key": (10, "old")},
+                             negative_timeout=30)
+        _cache._backing_store = mock.Mock()
+        _cache._write_behind = mock.Mock()
+        _cache._bus = mock.Mock()
+
+        _cache.refresh_cache("key", _func, (), {})
+
+        _cache._write_behind.discard.assert_called_once_with("key")
+        _cache._backing_store.delete.assert_called_once_with("key")
+        _cache._bus.publish.assert_called_once_with({'keys': ["key"]})
+
+    @mock.patch.object(calendar, "timegm")
+    def test_none_result_for_unknown_key_stays_local(self, mock_timegm):
+        mock_timegm.return_value = 200
+        _func = mock.Mock(__name__="key", return_value=None)
+        _cache = cache.Cache(timeout=120, store={}, negative_timeout=30)
+        _cache._backing_store = mock.Mock()
+        _cache._bus = mock.Mock()
+
+        _cache.refresh_cache("key", _func, (), {})
+
+        self.assertTrue(_cache.negative_hit("key"))
+        self.assertFalse(_cache._backing_store.delete.called)
+        self.assertFalse(_cache._bus.publish.called)
+
+    @mock.patch.object(calendar, "timegm")
+    def test_negative_caching_disabled(self, mock_timegm):
+        mock_timegm.return_value = 200
+        _func = mock.Mock(__name__="key", return_value=None)
+        _cache = cache.Cache(timeout=120, store={}, negative_timeout=0)
+
+        _cache.refresh_cache("key", _func, (), {})
+
+        self.assertEqual((200, None), _cache._store["key"])
+
+    @mock.patch.object(calendar, "timegm")
+    def test_get_many_skips_negative_keys(self, mock_timegm):
+        mock_timegm.return_value = 200
+        _func = mock.Mock(__name__="key")
+        _cache = cache.Cache(timeout=120, store={"b": (190, "b")},
+                             negative_timeout=30)
+        _cache.get_hash = mock.Mock(side_effect=lambda name, key: key)
+        _cache.cache_negative("a")
+
+        self.assertEqual([None, "b"], _cache.get_many(_func, [("a",),
+                                                              ("b",)]))
+        self.assertFalse(_func.called)
+
+    @mock.patch.object(calendar, "timegm")
+    def test_delete_removes_key_from_every_tier(self, mock_timegm):
+        mock_timegm.return_value = 200
+        peers = []
+        worker = cache.Cache(timeout=120, store={"key": (10, "a")},
+                             backing_store=MEMCACHE,
+                             invalidation_bus=LocalBus(peers))
+        other = cache.Cache(timeout=120, store={"key": (10, "a")},
+                            backing_store=MEMCACHE,
+                            invalidation_bus=LocalBus(peers))
+        worker._backing_store = mock.Mock()
+
+        worker.delete("key")
+
+        worker._backing_store.delete.assert_called_once_with("key")
+        self.assertNotIn("key", worker._store)
+        self.assertNotIn("key", other._store)
+
+    @mock.patch.object(calendar, "timegm")
+    def test_purge_bumps_generation(self, mock_timegm):
+        mock_timegm.return_value = 200
+        peers = []
+        worker = cache.Cache(timeout=120, store={}, backing_store=MEMCACHE,
+                             namespace="templates",
+                             invalidation_bus=LocalBus(peers))
+        other = cache.Cache(timeout=120, store={}, backing_store=MEMCACHE,
+                            namespace="templates",
+                            invalidation_bus=LocalBus(peers))
+        worker._backing_store = mock.Mock()
+        worker._backing_store.get_counter.return_value = None
+        old_key = worker.get_hash("f")
+
+        worker.purge()
+
+        worker._backing_store.set_counter.assert_called_once_with(
+            "fusion:templates:v1:generation", 1)
+        self.assertEqual(1, other.generation)
+        self.assertNotEqual(old_key, worker.get_hash("f"))
+        self.assertTrue(worker.get_hash("f").startswith(
+            "fusion:templates:v1:g1:"))
+
+    @mock.patch.object(calendar, "timegm")
+    def test_generation_read_from_backing_store(self, mock_timegm):
+        mock_timegm.return_value = 200
+        _cache = cache.Cache(timeout=120, store={}, backing_store=MEMCACHE,
+                             namespace="templates")
+        _cache._backing_store = mock.Mock()
+        _cache._backing_store.get_counter.return_value = 4
+
+        self.assertEqual(4, _cache.generation)
+        _cache._backing_store.get_counter.return_value = 5
+        mock_timegm.return_value = 200 + cache.GENERATION_CHECK_INTERVAL - 1
+        self.assertEqual(4, _cache.generation)
+        mock_timegm.return_value = 200 + cache.GENERATION_CHECK_INTERVAL
+        self.assertEqual(5, _cache.generation)
+        self.assertEqual(2, _cache._backing_store.get_counter.call_count)
+
+    @mock.patch.object(calendar, "timegm")
+    def test_entries_and_report(self, mock_timegm):
+        mock_timegm.return_value = 200
+        store = {"fusion:templates:v1:a": (190, "data"),
+                 "fusion:other:v1:b": (190, "data")}
+        _cache = cache.Cache(timeout=120, store=store, namespace="templates",
+                             negative_timeout=30)
+        _cache.cache_negative("fusion:templates:v1:c")
+        _func = mock.Mock(__name__="get_templates", return_value="data")
+        _wrapped_func = _cache(_func)
+        _cache.get_hash = mock.Mock(return_value="fusion:templates:v1:a")
+        _wrapped_func()
+
+        entries = sorted(_cache.entries(), key=lambda entry: entry['key'])
+        self.assertEqual(
+            [("fusion:templates:v1:a", "memory", 10),
+             ("fusion:templates:v1:c", "negative", 0)],
+            [(entry['key'], entry['tier'], entry['age'])
+             for entry in entries])
+        report = _cache.report()
+        self.assertEqual("get_templates", report['name'])
+        self.assertEqual(1, report['hits'])
+        self.assertEqual(1.0, report['hits_ratio'])
+        self.assertEqual(0.0, report['misses_ratio'])
+        self.assertNotIn('write_behind', report)
+        self.assertNotIn('store', report)
+        self.assertIn(_cache, cache.CACHES)
+
+    def test_shared_store_kept_for_longest_max_stale(self):
+        store = MemoryStore(ttl=60)
+
+        cache.Cache(timeout=120, store=store, stale_grace=0, max_stale=0)
+        self.assertEqual(120, store._ttl)
+        cache.Cache(timeout=120, store=store, stale_grace=0, max_stale=900)
+        self.assertEqual(900, store._ttl)
+
+    @mock.patch.object(BackingStore, "create")
+    def test_backing_store_kept_for_max_stale(self, mock_create):
+        cache.Cache(timeout=120, backing_store=MEMCACHE, stale_grace=10,
+                    max_stale=900)
+
+        mock_create.assert_called_once_with(MEMCACHE, 120, stale_grace=10,
+                                            max_stale=900)
+
+    def test_report_includes_store_evictions(self):
+        _cache = cache.Cache(timeout=120,
+                             store=MemoryStore(max_entries=1))
+        _cache.remember("a", (10, "a"))
+        _cache.remember("b", (10, "b"))
+
+        report = _cache.report()['store']
+
+        self.assertEqual(1, report['entries'])
+        self.assertEqual(1, report['evictions']['entries'])
+
+    @mock.patch('eventlet.spawn_n')
+    def test_report_includes_write_behind(self, mock_spawn):
+        _cache = cache.Cache(timeout=120, store={})
+        _cache._write_behind = WriteBehindQueue(mock.Mock(), max_size=1)
+        _cache._write_behind.put("a", "data")
+        _cache._write_behind.put("b", "data")
+
+        report = _cache.report()['write_behind']
+
+        self.assertEqual(1, report['depth'])
+        self.assertEqual(1, report['dropped'])
+
+    @mock.patch.object(calendar, "timegm")
+    def test_hits_counted_by_tier(self, mock_timegm):
+        mock_timegm.return_value = 200
+        _func = mock.Mock(__name__="get_templates")
+        backing_store = mock.Mock()
+        backing_store.lookup.return_value = CacheEntry("data", 190, True,
+                                                       tier="redis")
+        _cache = cache.Cache(timeout=120, store={})
+        _cache._backing_store = backing_store
+        _cache.get_hash = mock.Mock(return_value="key")
+        _wrapped_func = _cache(_func)
+
+        _wrapped_func()
+        _wrapped_func()
+
+        for tier in ("redis", "memory"):
+            self.assertEqual(1, cache.HITS.labels(function="get_templates",
+                                                  tier=tier).value)
+        backing_store.bind.assert_called_once_with("get_templates")
+        self.assertEqual(1, cache.LOOKUP_SECONDS.labels(
+            function="get_templates", tier="redis").count)
+        self.assertTrue(cache.STORED_BYTES.labels(function="get_templates",
+                                                  tier="memory").value)
+
+    @mock.patch.object(calendar, "timegm")
+    def test_misses_and_stale_serves_counted(self, mock_timegm):
+        mock_timegm.return_value = 200
+        _func = mock.Mock(__name__="get_templates", return_value="data")
+        _cache = cache.Cache(timeout=120, store={"old": (10, "old")},
+                             stale_grace=300)
+        _cache.start_background_refresh = mock.Mock()
+        _wrapped_func = _cache(_func)
+
+        _cache.get_hash = mock.Mock(return_value="new")
+        _wrapped_func()
+        _cache.get_hash = mock.Mock(return_value="old")
+        _wrapped_func()
+
+        self.assertEqual(1, cache.MISSES.labels(
+            function="get_templates").value)
+        self.assertEqual(1, cache.STALE.labels(function="get_templates",
+                                               tier="memory").value)
+
+    @mock.patch.object(calendar, "timegm")
+    def test_refresh_duration_and_failures_recorded(self, mock_timegm):
+        mock_timegm.return_value = 200
+        cache.default_timer.side_effect = [10.0, 12.5, 20.0]
+        _func = mock.Mock(__name__="get_templates", return_value="data")
+        _cache = cache.Cache(timeout=120, store={})
+        _cache(_func)
+
+        _cache.refresh_cache("key", _func, (), {})
+        _func.side_effect = IOError()
+        self.assertRaises(IOError, _cache.refresh_cache, "key", _func, (),
+                          {})
 
-        self.assertDictEqual(BACKGROUND_REFRESH, {
-            'key': {
-                'background_thread': None,
-                'refresh_lock': lock
-            }
-        })
-        lock.acquire.assert_called_once_with(False)
-        self.assertTrue(lock.release.called)
+        refreshes = cache.REFRESH_SECONDS.labels(function="get_templates")
+        self.assertEqual((1, 2.5), (refreshes.count, refreshes.sum))
+        self.assertEqual(1, cache.REFRESH_FAILURES.labels(
+            function="get_templates").value)
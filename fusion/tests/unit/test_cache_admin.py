@@ -0,0 +1,118 @@
+import urllib
+
+import mock
+import unittest
+import webob
+
+from fusion.api.v1.cache_admin import CacheAdminController
+from fusion.common import cache
+from fusion.common import circuit_breaker
+from fusion.common.circuit_breaker import CircuitBreaker
+from fusion.common.cache_backing_store import MISSING
+
+
+class CacheAdminControllerTest(unittest.TestCase):
+    def setUp(self):
+        cache.GENERATIONS.clear()
+        self.config = {"admin_token": "secret", "key_prefix": "fusion"}
+        get_config = mock.patch(
+            'fusion.common.config.safe_get_config',
+            side_effect=lambda group, name: self.config.get(name))
+        get_config.start()
+        self.addCleanup(get_config.stop)
+        self.templates = cache.Cache(
+            timeout=120, store={"fusion:templates:v1:a": (10, "a")},
+            namespace="templates")
+        self.other = cache.Cache(
+            timeout=120, store={"fusion:other:v1:b": (10, "b")},
+            namespace="other")
+        caches = mock.patch.object(cache, "CACHES",
+                                   set([self.templates, self.other]))
+        caches.start()
+        self.addCleanup(caches.stop)
+        self.controller = CacheAdminController({})
+
+    @staticmethod
+    def _request(token="secret", **params):
+        req = webob.Request.blank("/cache/keys?" + urllib.urlencode(params))
+        if token:
+            req.headers["X-Cache-Admin-Token"] = token
+        return req
+
+    def test_wrong_token_is_unauthorized(self):
+        response = self.controller.get_keys(self._request(token="wrong"))
+
+        self.assertEqual(401, response.status_int)
+
+    def test_disabled_without_admin_token(self):
+        self.config["admin_token"] = None
+
+        response = self.controller.get_stats(self._request())
+
+        self.assertEqual(403, response.status_int)
+
+    def test_get_keys(self):
+        result = self.controller.get_keys(self._request())
+
+        self.assertEqual(["fusion:other:v1:b", "fusion:templates:v1:a"],
+                         [entry['key'] for entry in result['keys']])
+
+    def test_get_keys_for_namespace(self):
+        result = self.controller.get_keys(self._request(namespace="other"))
+
+        self.assertEqual(["fusion:other:v1:b"],
+                         [entry['key'] for entry in result['keys']])
+
+    def test_get_key(self):
+        self.templates._backing_store = mock.Mock()
+        self.templates._backing_store.lookup.return_value = MISSING
+
+        result = self.controller.get_key(self._request(),
+                                         "fusion:templates:v1:a")
+
+        self.assertEqual(["memory"], result['tiers'])
+
+    def test_delete_key(self):
+        self.controller.delete_key(self._request(), "fusion:templates:v1:a")
+
+        self.assertEqual({}, self.templates._store)
+        self.assertIn("fusion:other:v1:b", self.other._store)
+
+    def test_delete_unknown_key(self):
+        response = self.controller.delete_key(self._request(),
+                                              "fusion:missing:v1:a")
+
+        self.assertEqual(404, response.status_int)
+
+    def test_delete_namespace(self):
+        self.controller.delete_namespace(self._request(), "templates")
+
+        self.assertEqual({}, self.templates._store)
+        self.assertEqual(1, self.templates.generation)
+        self.assertIn("fusion:other:v1:b", self.other._store)
+
+    @mock.patch('eventlet.spawn_n')
+    def test_warm(self, mock_spawn):
+        response = self.controller.warm(self._request())
+
+        self.assertEqual(202, response.status_int)
+        self.assertTrue(mock_spawn.called)
+
+    def test_get_stats(self):
+        result = self.controller.get_stats(self._request())
+
+        self.assertEqual(["other", "templates"],
+                         sorted(report['namespace']
+                                for report in result['stats']['functions']))
+        self.assertIn("refresh", result['stats'])
+
+    def test_get_stats_reports_breakers(self):
+        breaker = CircuitBreaker("redis")
+        breaker.trip()
+
+        with mock.patch.dict(circuit_breaker.BREAKERS, {"redis": breaker}):
+            result = self.controller.get_stats(self._request())
+
+        self.assertEqual("open",
+                         result['stats']['breakers']['redis']['state'])
+        self.assertEqual(1, result['stats']['breakers']['redis']['trips'])
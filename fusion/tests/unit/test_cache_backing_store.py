@@ -1,122 +1,234 @@
+import errno
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+
 import mock
 import unittest
 import pylibmc
 
+from fusion.common import cache_backing_store
 from fusion.common.cache_backing_store import (
     FileSystemBackingStore,
     RedisBackingStore,
-    MemcacheBackingStore)
+    BackingStore,
+    CacheEntry,
+    MemcacheBackingStore,
+    TieredBackingStore,
+    MISSING)
+from fusion.common import cache_codec
+from fusion.common.cache_codec import Codec
+from fusion.common.circuit_breaker import CircuitBreaker
+from fusion.common import metrics
 from redis.exceptions import ConnectionError
 from oslo.config import cfg
 
 
+class CacheEntryTest(unittest.TestCase):
+    def test_stored_round_trip(self):
+        entry = CacheEntry.from_stored((10, "data", 2.5))
+
+        self.assertEqual((10, "data", 2.5), entry.stored())
+        self.assertEqual(2.5, entry.delta)
+
+    def test_stored_without_delta_keeps_pair(self):
+        entry = CacheEntry.from_stored((10, "data"))
+
+        self.assertEqual(0, entry.delta)
+        self.assertEqual((10, "data"), entry.stored())
+
+
 class FileSystemBackingStoreTest(unittest.TestCase):
     def setUp(self):
         cfg.CONF.reset()
-        self.cache_root = "/cache"
+        self.addCleanup(setattr, cfg, 'CONF', cfg.CONF)
+        self.cache_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cache_root, True)
         cfg.CONF = mock.Mock(cache=mock.Mock(cache_root=self.cache_root))
-        self.cache_file_path = "%s/.get_templates_cache" % self.cache_root
+        digest = hashlib.sha1("get_templates").hexdigest()
+        self.cache_file_path = os.path.join(self.cache_root, digest[:2],
+                                            digest[2:4], digest)
 
-    @mock.patch('__builtin__.open')
-    @mock.patch('os.path.exists')
-    def test_retrieve_for_existing_key(self, mock_path_exists, mock_open):
-        mock_path_exists.return_value = True
-        mock_file_handle = mock_open.return_value.__enter__.return_value
-        mock_file_handle.read.return_value = \
-            "\x80\x02}q\x01U\x03fooq\x02U\x03barq\x03s."
+    def _write_cache_file(self, contents, path=None):
+        path = path or self.cache_file_path
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'wb') as cache_file:
+            cache_file.write(contents)
+
+    def test_retrieve_for_existing_key(self):
+        self._write_cache_file("\x80\x02K\n}q\x01U\x03fooq\x02U\x03barq"
+                               "\x03s\x86q\x04.")
 
         store = FileSystemBackingStore(60)
         result = store.retrieve("get_templates")
-        self.assertDictEqual(result, {"foo": "bar"})
-
-        mock_path_exists.assert_called_once_with(self.cache_file_path)
-        self.assertTrue(mock_file_handle.read.called)
-        mock_open.assert_called_once_with("/cache/.get_templates_cache", "r")
-
-    @mock.patch('os.path.exists')
-    def test_retrieve_for_invalid_key(self, mock_path_exists):
-        mock_path_exists.return_value = False
+        self.assertEqual((10, {"foo": "bar"}), result)
 
+    def test_retrieve_for_invalid_key(self):
         store = FileSystemBackingStore(60)
         self.assertRaises(KeyError, store.retrieve, "get_templates")
 
-        mock_path_exists.assert_called_once_with(self.cache_file_path)
-
     @mock.patch('__builtin__.open')
-    @mock.patch('os.path.exists')
-    def test_retrieve_io_exc_handling(self, mock_path_exists, mock_open):
-        mock_path_exists.return_value = True
-        mock_open.side_effect = IOError()
+    def test_lookup_io_exc_handling(self, mock_open):
+        mock_open.side_effect = IOError(errno.EACCES, "denied")
 
         store = FileSystemBackingStore(60)
-        store.retrieve("get_templates")
+        self.assertIs(MISSING, store.lookup("get_templates"))
 
-        mock_path_exists.assert_called_once_with(self.cache_file_path)
+    def test_lookup_for_missing_file(self):
+        store = FileSystemBackingStore(60)
+        self.assertIs(MISSING, store.lookup("get_templates"))
 
-    @mock.patch('__builtin__.open')
-    @mock.patch('os.makedirs')
-    @mock.patch('os.path.exists')
-    def test_cache_for_no_root(self, mock_path_exists, mock_makedirs,
-                               mock_open):
-        mock_path_exists.return_value = False
-        mock_file_handle = mock_open.return_value.__enter__.return_value
+    def test_lookup_for_corrupt_file(self):
+        self._write_cache_file("garbage")
 
         store = FileSystemBackingStore(60)
-        store.cache("get_templates", {"foo": "bar"})
+        self.assertIs(MISSING, store.lookup("get_templates"))
+
+    def test_cache_and_lookup(self):
+        store = FileSystemBackingStore(60)
+        store.cache("get_templates", (10, {"foo": "bar"}))
 
-        mock_makedirs.assert_called_once_with(self.cache_root, 0o766)
-        mock_file_handle.write.assert_called_once_with(
-            '\x80\x02}q\x01U\x03fooq\x02U\x03barq\x03s.')
+        with open(self.cache_file_path, 'rb') as cache_file:
+            self.assertEqual(
+                '\xfa\x01\x00\x80\x02K\n}q\x01U\x03fooq\x02U\x03barq'
+                '\x03s\x86q\x04.', cache_file.read())
+        entry = store.lookup("get_templates")
+        self.assertEqual((10, {"foo": "bar"}), (entry.birthday, entry.value))
 
-    @mock.patch('__builtin__.open')
-    @mock.patch('os.makedirs')
-    @mock.patch('os.path.exists')
-    def test_cache_for_existing_root(self, mock_path_exists, mock_makedirs,
-                                     mock_open):
-        mock_path_exists.return_value = True
-        mock_file_handle = mock_open.return_value.__enter__.return_value
+    def test_cache_leaves_no_temp_files(self):
+        store = FileSystemBackingStore(60)
+        store.cache("get_templates", (10, "one"))
+        store.cache("get_templates", (20, "two"))
+
+        self.assertEqual([os.path.basename(self.cache_file_path)],
+                         os.listdir(os.path.dirname(self.cache_file_path)))
 
+    def test_cache_handles_long_keys(self):
         store = FileSystemBackingStore(60)
-        store.cache("get_templates", {"foo": "bar"})
+        store.cache("k" * 1000, (10, "data"))
 
-        self.assertFalse(mock_makedirs.called)
-        mock_file_handle.write.assert_called_once_with(
-            '\x80\x02}q\x01U\x03fooq\x02U\x03barq\x03s.')
+        self.assertEqual("data", store.lookup("k" * 1000).value)
 
     @mock.patch('os.makedirs')
-    @mock.patch('os.path.exists')
-    def test_cache_create_root_exc_handling(self, mock_path_exists,
-                                            mock_makedirs):
-        mock_path_exists.return_value = False
-        mock_makedirs.side_effect = IOError()
+    def test_cache_create_root_exc_handling(self, mock_makedirs):
+        mock_makedirs.side_effect = OSError()
 
         store = FileSystemBackingStore(60)
         store.cache("get_templates", {"foo": "bar"})
 
-    @mock.patch('__builtin__.open')
-    @mock.patch('os.path.exists')
-    def test_cache_file_open_exc_handling(self, mock_path_exists, mock_open):
-        mock_path_exists.return_value = True
-        mock_open.side_effect = IOError()
+        self.assertFalse(store.exists("get_templates"))
+
+    @mock.patch('os.rename')
+    def test_cache_rename_exc_handling(self, mock_rename):
+        mock_rename.side_effect = OSError()
 
         store = FileSystemBackingStore(60)
         store.cache("get_templates", {"foo": "bar"})
 
-    @mock.patch('os.path.exists')
-    def test_exists(self, mock_path_exists):
-        mock_path_exists.return_value = True
+        self.assertEqual([], os.listdir(
+            os.path.dirname(self.cache_file_path)))
+
+    def test_cache_encode_exc_handling(self):
+        store = FileSystemBackingStore(
+            60, codec=Codec(serializer=cache_codec.MARSHAL))
+        store.cache("get_templates", (10, object()))
+
+        self.assertFalse(store.exists("get_templates"))
+        self.assertEqual([], os.listdir(
+            os.path.dirname(self.cache_file_path)))
+
+    def test_exists(self):
+        self._write_cache_file("data")
         store = FileSystemBackingStore(60)
 
         self.assertTrue(store.exists("get_templates"))
-        self.assertTrue(mock_path_exists.called)
+        self.assertFalse(store.exists("get_template"))
 
-    @mock.patch('os.path.exists')
-    def test_exists_for_invalid_path(self, mock_path_exists):
-        mock_path_exists.return_value = False
+    def test_delete(self):
         store = FileSystemBackingStore(60)
+        store.cache("get_templates", (10, "data"))
+
+        store.delete("get_templates")
+        store.delete("get_templates")
 
         self.assertFalse(store.exists("get_templates"))
-        self.assertTrue(mock_path_exists.called)
+
+    def test_gc_removes_expired_files(self):
+        store = FileSystemBackingStore(60, ttl=100)
+        store.cache("old", (10, "old"))
+        store.cache("new", (10, "new"))
+        old_path = store._cache_file("old")
+        os.utime(old_path, (time.time() - 200, time.time() - 200))
+
+        self.assertEqual(1, store.gc())
+        self.assertFalse(store.exists("old"))
+        self.assertTrue(store.exists("new"))
+
+    def test_gc_removes_least_recently_read_over_size(self):
+        store = FileSystemBackingStore(60, max_bytes=60)
+        now = time.time()
+        for age, key in enumerate(["c", "b", "a"]):
+            store.cache(key, (10, "x" * 10))
+            os.utime(store._cache_file(key), (now - age * 10, now))
+        store.lookup("a")
+
+        self.assertEqual(1, store.gc())
+        self.assertTrue(store.exists("a"))
+        self.assertFalse(store.exists("b"))
+        self.assertTrue(store.exists("c"))
+
+    @mock.patch('eventlet.spawn_n')
+    def test_one_collector_per_cache_root(self, mock_spawn):
+        collectors = mock.patch.dict(cache_backing_store.COLLECTORS,
+                                     clear=True)
+        collectors.start()
+        self.addCleanup(collectors.stop)
+
+        FileSystemBackingStore(60, gc_interval=30).cache("a", (10, "a"))
+        FileSystemBackingStore(90, gc_interval=30).cache("b", (10, "b"))
+
+        self.assertEqual([self.cache_root],
+                         cache_backing_store.COLLECTORS.keys())
+        self.assertEqual(1, mock_spawn.call_count)
+
+    @mock.patch('eventlet.spawn_n')
+    def test_collector_keeps_files_for_longest_expiry(self, mock_spawn):
+        short = FileSystemBackingStore(60)
+        long = FileSystemBackingStore(300)
+        short.cache("a", (10, "a"))
+        os.utime(short._cache_file("a"), (time.time() - 200,
+                                          time.time() - 200))
+        collector = cache_backing_store.DiskCacheCollector(self.cache_root,
+                                                           30)
+
+        collector.add(short)
+        collector.add(long)
+        collector.run_periodic()
+
+        self.assertTrue(short.exists("a"))
+
+    @mock.patch('eventlet.sleep')
+    def test_collect_yields_between_directories(self, mock_sleep):
+        store = FileSystemBackingStore(60)
+        store.cache("a", (10, "a"))
+
+        store.gc()
+
+        self.assertTrue(mock_sleep.called)
+        mock_sleep.assert_called_with(0)
+
+    def test_counter_is_never_collected(self):
+        store = FileSystemBackingStore(60, ttl=100, max_bytes=1)
+        store.set_counter("generation", 3)
+        path = store._cache_file("generation") + store.COUNTER_SUFFIX
+        os.utime(path, (time.time() - 200, time.time() - 200))
+
+        self.assertEqual(0, store.gc())
+        self.assertEqual(3, store.get_counter("generation"))
+        self.assertIsNone(store.get_counter("other"))
 
 
 class RedisBackingStoreTest(unittest.TestCase):
@@ -152,13 +264,141 @@ class RedisBackingStoreTest(unittest.TestCase):
         store = RedisBackingStore(60, client)
         self.assertEqual(None, store.retrieve("get_templates"))
 
+    def test_undecodable_values_are_misses(self):
+        client = mock.Mock()
+        client.get.return_value = "\xfa\x09\x00unknown codec"
+        client.mget.return_value = ["\x80\x02corrupt"]
+
+        store = RedisBackingStore(60, client)
+
+        self.assertIs(MISSING, store.lookup("a"))
+        self.assertIs(MISSING, store.get_many(["b"])["b"])
+
+    def test_open_circuit_skips_client(self):
+        client = mock.Mock()
+        client.get.side_effect = ConnectionError()
+        breaker = CircuitBreaker("redis", failure_threshold=2,
+                                 reset_timeout=60)
+
+        store = RedisBackingStore(60, client, breaker=breaker)
+        for _ in range(5):
+            self.assertIs(MISSING, store.lookup("get_templates"))
+        store.cache("get_templates", "content")
+
+        self.assertEqual(2, client.get.call_count)
+        self.assertFalse(client.set.called)
+        self.assertEqual(1, breaker.trips)
+
+    def test_acquire_lease(self):
+        client = mock.Mock()
+        client.incr.return_value = 7
+        client.set.return_value = True
+
+        store = RedisBackingStore(60, client)
+
+        self.assertEqual(7, store.acquire_lease("key", 30))
+        client.incr.assert_called_once_with("fence:key")
+        client.expire.assert_called_once_with(
+            "fence:key", cache_backing_store.FENCE_TTL)
+        client.set.assert_called_once_with("lease:key", 7, nx=True,
+                                           px=30000)
+
+    def test_acquire_lease_held_elsewhere(self):
+        client = mock.Mock()
+        client.incr.return_value = 8
+        client.set.return_value = None
+
+        store = RedisBackingStore(60, client)
+
+        self.assertIsNone(store.acquire_lease("key", 30))
+
+    def test_acquire_lease_without_redis(self):
+        client = mock.Mock()
+        client.incr.side_effect = ConnectionError()
+
+        store = RedisBackingStore(60, client)
+
+        self.assertIsNotNone(store.acquire_lease("key", 30))
+
+    def test_lease_valid(self):
+        client = mock.Mock()
+        client.get.return_value = "7"
+
+        store = RedisBackingStore(60, client)
+
+        self.assertTrue(store.lease_valid("key", 7))
+        self.assertFalse(store.lease_valid("key", 6))
+        client.get.assert_called_with("lease:key")
+
+    def test_cache_fenced(self):
+        client = mock.Mock()
+        client.eval.return_value = 1
+
+        store = RedisBackingStore(60, client)
+
+        self.assertTrue(store.cache_fenced("key", "content", 7))
+        client.eval.assert_called_once_with(
+            cache_backing_store.FENCED_SET_SCRIPT, 2, "lease:key", "key", 7,
+            "\xfa\x01\x00\x80\x02U\x07contentq\x01.", 0)
+        client.eval.return_value = 0
+        self.assertFalse(store.cache_fenced("key", "content", 6))
+
+    def test_release_lease(self):
+        client = mock.Mock()
+
+        store = RedisBackingStore(60, client)
+        store.release_lease("key", 7)
+
+        client.eval.assert_called_once_with(
+            cache_backing_store.RELEASE_LEASE_SCRIPT, 1, "lease:key", 7)
+
     def test_cache(self):
         mock_client = mock.Mock()
         store = RedisBackingStore(60, mock_client)
         store.cache("get_templates", "content")
 
         mock_client.set.assert_called_once_with(
-            "get_templates", "\x80\x02U\x07contentq\x01.")
+            "get_templates", "\xfa\x01\x00\x80\x02U\x07contentq\x01.")
+
+    def test_counter_has_no_ttl(self):
+        client = mock.Mock()
+        client.get.return_value = "3"
+        store = RedisBackingStore(60, client, ttl=90)
+
+        store.set_counter("generation", 3)
+
+        client.set.assert_called_once_with("generation", 3)
+        self.assertEqual(3, store.get_counter("generation"))
+
+    def test_get_counter_ignores_other_values(self):
+        client = mock.Mock()
+        client.get.return_value = "\xfa\x01\x00data"
+
+        self.assertIsNone(RedisBackingStore(60, client).get_counter("key"))
+
+    @mock.patch('random.randint')
+    def test_cache_with_ttl(self, mock_randint):
+        mock_randint.return_value = 7
+        mock_client = mock.Mock()
+        store = RedisBackingStore(60, mock_client, ttl=90, ttl_jitter=10)
+        store.cache("get_templates", "content")
+
+        mock_randint.assert_called_once_with(0, 10)
+        mock_client.set.assert_called_once_with(
+            "get_templates", "\xfa\x01\x00\x80\x02U\x07contentq\x01.",
+            ex=97)
+
+    def test_cache_reports_skipped_write(self):
+        client = mock.Mock()
+        client.set.side_effect = ConnectionError()
+        client.pipeline.return_value.execute.side_effect = ConnectionError()
+
+        store = RedisBackingStore(60, client)
+
+        self.assertFalse(store.cache("get_templates", "content"))
+        self.assertFalse(store.set_many({"get_templates": "content"}))
+        client.set.side_effect = None
+        self.assertTrue(store.cache("get_templates", "content"))
 
     def test_cache_exc_handling(self):
         mock_client = mock.Mock()
@@ -166,6 +406,64 @@ class RedisBackingStoreTest(unittest.TestCase):
         store = RedisBackingStore(60, mock_client)
         store.cache("get_templates", "content")
 
+    def test_lookup(self):
+        client = mock.Mock()
+        client.get.return_value = "\x80\x02K\nU\rget_templatesq\x01\x86q\x02."
+
+        store = RedisBackingStore(60, client)
+        entry = store.lookup("get_templates")
+
+        self.assertTrue(entry.found)
+        self.assertEqual((10, "get_templates"), (entry.birthday, entry.value))
+        client.get.assert_called_once_with("get_templates")
+        self.assertFalse(client.exists.called)
+
+    def test_lookup_for_invalid_key(self):
+        client = mock.Mock()
+        client.get.return_value = None
+
+        store = RedisBackingStore(60, client)
+        self.assertIs(MISSING, store.lookup("get_templates"))
+
+    def test_lookup_conn_exc_handling(self):
+        client = mock.Mock()
+        client.get.side_effect = ConnectionError()
+
+        store = RedisBackingStore(60, client)
+        self.assertIs(MISSING, store.lookup("get_templates"))
+
+    def test_get_many(self):
+        client = mock.Mock()
+        client.mget.return_value = [
+            "\x80\x02K\nU\rget_templatesq\x01\x86q\x02.", None]
+
+        store = RedisBackingStore(60, client)
+        entries = store.get_many(["a", "b"])
+
+        client.mget.assert_called_once_with(["a", "b"])
+        self.assertEqual("get_templates", entries["a"].value)
+        self.assertIs(MISSING, entries["b"])
+
+    def test_get_many_conn_exc_handling(self):
+        client = mock.Mock()
+        client.mget.side_effect = ConnectionError()
+
+        store = RedisBackingStore(60, client)
+
+        self.assertEqual({"a": MISSING}, store.get_many(["a"]))
+
+    def test_set_many(self):
+        client = mock.Mock()
+        pipeline = client.pipeline.return_value
+
+        store = RedisBackingStore(60, client, ttl=90)
+        store.set_many({"a": "content"})
+
+        client.pipeline.assert_called_once_with(transaction=False)
+        pipeline.set.assert_called_once_with(
+            "a", "\xfa\x01\x00\x80\x02U\x07contentq\x01.", ex=90)
+        pipeline.execute.assert_called_once_with()
+
     def test_exists(self):
         client = mock.Mock()
         client.exists.return_value = True
@@ -175,6 +473,44 @@ class RedisBackingStoreTest(unittest.TestCase):
         self.assertTrue(store.exists("get_templates"))
         client.exists.assert_called_once_with("get_templates")
 
+    def test_delete(self):
+        client = mock.Mock()
+
+        RedisBackingStore(60, client).delete("get_templates")
+
+        client.delete.assert_called_once_with("get_templates")
+
+    def test_delete_conn_exc_handling(self):
+        client = mock.Mock()
+        client.delete.side_effect = ConnectionError()
+
+        RedisBackingStore(60, client).delete("get_templates")
+
+    def test_errors_and_bytes_counted(self):
+        metrics.REGISTRY.reset()
+        client = mock.Mock()
+        client.get.side_effect = ConnectionError()
+        store = RedisBackingStore(60, client)
+        store.bind("get_templates")
+
+        store.lookup("get_templates")
+        store.cache("get_templates", (10, "data"))
+
+        self.assertEqual(1, cache_backing_store.STORE_ERRORS.labels(
+            function="get_templates", tier="redis").value)
+        self.assertEqual(
+            len(client.set.call_args[0][1]),
+            cache_backing_store.STORED_BYTES.labels(
+                function="get_templates", tier="redis").value)
+
+    def test_lookup_tags_entry_with_tier(self):
+        client = mock.Mock()
+        client.get.return_value = RedisBackingStore(60).encode((10, "data"))
+
+        entry = RedisBackingStore(60, client).lookup("get_templates")
+
+        self.assertEqual("redis", entry.tier)
+
 
 class MemcacheBackingStoreTest(unittest.TestCase):
     def test_retrieve(self):
@@ -214,13 +550,52 @@ class MemcacheBackingStoreTest(unittest.TestCase):
 
         self.assertIsNone(result)
 
+    def test_undecodable_values_are_misses(self):
+        client = mock.Mock()
+        client.get.return_value = "\xfa\x09\x00unknown codec"
+        client.get_multi.return_value = {"b": "\x80\x02corrupt"}
+
+        store = MemcacheBackingStore(5, client)
+
+        self.assertIs(MISSING, store.lookup("a"))
+        self.assertIs(MISSING, store.get_many(["b"])["b"])
+
     def test_cache(self):
         client = mock.Mock()
 
         store = MemcacheBackingStore(60, client)
         store.cache("get_templates", "content")
 
-        client.set.assert_called_with("get_templates", "content")
+        client.set.assert_called_with(
+            "get_templates", "\xfa\x01\x00\x80\x02U\x07contentq\x01.")
+
+    def test_cache_with_ttl(self):
+        client = mock.Mock()
+
+        store = MemcacheBackingStore(60, client, ttl=90)
+        store.cache("get_templates", "content")
+
+        client.set.assert_called_with(
+            "get_templates", "\xfa\x01\x00\x80\x02U\x07contentq\x01.",
+            time=90)
+
+    def test_counter_has_no_ttl(self):
+        client = mock.Mock()
+        client.get.return_value = 3
+        store = MemcacheBackingStore(60, client, ttl=90)
+
+        store.set_counter("generation", 3)
+
+        client.set.assert_called_once_with("generation", 3, time=0)
+        self.assertEqual(3, store.get_counter("generation"))
+
+    def test_cache_ttl_capped_for_memcache(self):
+        client = mock.Mock()
+
+        store = MemcacheBackingStore(60, client, ttl=10 ** 8)
+        store.cache("get_templates", "content")
+
+        self.assertEqual(60 * 60 * 24 * 30, client.set.call_args[1]['time'])
 
     def test_cache_pylibmc_exc_handling(self):
         client = mock.Mock()
@@ -253,3 +628,329 @@ class MemcacheBackingStoreTest(unittest.TestCase):
         self.assertFalse(store.exists("get_templates"))
 
         client.get.assert_called_once_with("get_templates")
+
+    def test_delete(self):
+        client = mock.Mock()
+
+        MemcacheBackingStore(60, client).delete("get_templates")
+
+        client.delete.assert_called_once_with("get_templates")
+
+    def test_delete_pylibmc_exc_handling(self):
+        client = mock.Mock()
+        client.delete.side_effect = pylibmc.Error()
+
+        MemcacheBackingStore(60, client).delete("get_templates")
+
+    def test_lookup(self):
+        client = mock.Mock()
+        client.get.return_value = (10, "value")
+
+        store = MemcacheBackingStore(60, client)
+        entry = store.lookup("get_templates")
+
+        self.assertTrue(entry.found)
+        self.assertEqual((10, "value"), (entry.birthday, entry.value))
+        client.get.assert_called_once_with("get_templates")
+
+    def test_lookup_for_invalid_key(self):
+        client = mock.Mock()
+        client.get.return_value = None
+
+        store = MemcacheBackingStore(60, client)
+        self.assertIs(MISSING, store.lookup("get_templates"))
+
+    def test_retrieve_encoded_value(self):
+        client = mock.Mock()
+        client.get.return_value = "\xfa\x01\x00\x80\x02U\x07contentq\x01."
+
+        store = MemcacheBackingStore(60, client)
+
+        self.assertEqual("content", store.retrieve("get_templates"))
+
+    def test_get_many(self):
+        client = mock.Mock()
+        client.get_multi.return_value = {"a": (10, "value")}
+
+        store = MemcacheBackingStore(60, client)
+        entries = store.get_many(["a", "b"])
+
+        client.get_multi.assert_called_once_with(["a", "b"])
+        self.assertEqual((10, "value"),
+                         (entries["a"].birthday, entries["a"].value))
+        self.assertIs(MISSING, entries["b"])
+
+    def test_set_many(self):
+        client = mock.Mock()
+
+        store = MemcacheBackingStore(60, client, ttl=90)
+        store.set_many({"a": "content"})
+
+        client.set_multi.assert_called_once_with(
+            {"a": "\xfa\x01\x00\x80\x02U\x07contentq\x01."}, time=90)
+
+    def test_open_circuit_skips_client(self):
+        client = mock.Mock()
+        client.get_multi.side_effect = pylibmc.Error()
+        breaker = CircuitBreaker("memcache", failure_threshold=1,
+                                 reset_timeout=60)
+
+        store = MemcacheBackingStore(60, client, breaker=breaker)
+        store.get_many(["a"])
+        self.assertEqual({"a": MISSING}, store.get_many(["a"]))
+
+        self.assertEqual(1, client.get_multi.call_count)
+
+
+class ClientCreationTest(unittest.TestCase):
+    def setUp(self):
+        cache_backing_store._CLIENTS.clear()
+        self.addCleanup(cache_backing_store._CLIENTS.clear)
+
+    @mock.patch('os.getpid')
+    @mock.patch('redis.ConnectionPool.from_url')
+    def test_redis_client_created_once_per_process(self, mock_from_url,
+                                                   mock_getpid):
+        mock_getpid.return_value = 100
+        first = cache_backing_store.get_redis_client()
+        self.assertIs(first, cache_backing_store.get_redis_client())
+        self.assertEqual(1, mock_from_url.call_count)
+        self.assertEqual(10, mock_from_url.call_args[1]['max_connections'])
+
+        mock_getpid.return_value = 101
+        second = cache_backing_store.get_redis_client()
+
+        self.assertIsNot(first, second)
+        self.assertEqual(2, mock_from_url.call_count)
+
+    @mock.patch('redis.ConnectionPool.from_url')
+    def test_client_creation_failure_is_retried(self, mock_from_url):
+        mock_from_url.side_effect = [ValueError("bad url"), mock.Mock()]
+
+        self.assertIsNone(cache_backing_store.get_redis_client())
+        self.assertIsNotNone(cache_backing_store.get_redis_client())
+
+    @mock.patch('pylibmc.Client')
+    def test_memcache_client_timeouts(self, mock_client):
+        client = cache_backing_store.get_memcache_client()
+
+        self.assertIs(mock_client.return_value, client)
+        behaviors = mock_client.call_args[1]['behaviors']
+        self.assertEqual(500, behaviors['connect_timeout'])
+        self.assertEqual(1000000, behaviors['receive_timeout'])
+
+    @mock.patch.object(cache_backing_store, 'get_redis_client')
+    def test_store_resolves_client_lazily(self, mock_get_client):
+        store = RedisBackingStore(60)
+        self.assertFalse(mock_get_client.called)
+
+        mock_get_client.return_value.get.return_value = None
+        self.assertIs(MISSING, store.lookup("get_templates"))
+        mock_get_client.return_value.get.assert_called_once_with(
+            "get_templates")
+
+    def test_acquire_lease(self):
+        client = mock.Mock()
+        client.incr.return_value = 3
+        client.add.side_effect = [False, True]
+
+        store = MemcacheBackingStore(60, client)
+
+        self.assertEqual(3, store.acquire_lease("key", 30))
+        client.add.assert_any_call("fence:key", 0,
+                                   time=cache_backing_store.FENCE_TTL)
+        client.add.assert_called_with("lease:key", 3, time=30)
+
+    def test_acquire_lease_held_elsewhere(self):
+        client = mock.Mock()
+        client.incr.return_value = 4
+        client.add.side_effect = [False, False]
+
+        store = MemcacheBackingStore(60, client)
+
+        self.assertIsNone(store.acquire_lease("key", 30))
+
+    def test_cache_fenced_checks_lease(self):
+        client = mock.Mock()
+        client.get.return_value = 4
+
+        store = MemcacheBackingStore(60, client)
+
+        self.assertFalse(store.cache_fenced("key", "content", 3))
+        self.assertFalse(client.set.called)
+        self.assertTrue(store.cache_fenced("key", "content", 4))
+        self.assertTrue(client.set.called)
+
+    def test_release_lease_only_deletes_own_lease(self):
+        client = mock.Mock()
+        client.get.return_value = 4
+
+        store = MemcacheBackingStore(60, client)
+        store.release_lease("key", 3)
+        self.assertFalse(client.delete.called)
+
+        store.release_lease("key", 4)
+        client.delete.assert_called_once_with("lease:key")
+
+
+class TieredBackingStoreTest(unittest.TestCase):
+    def test_lookup_promotes_hit_to_faster_tiers(self):
+        fast, middle, slow = mock.Mock(), mock.Mock(), mock.Mock()
+        fast.lookup.return_value = MISSING
+        middle.lookup.return_value = MISSING
+        slow.lookup.return_value = CacheEntry("data", 10, True)
+
+        store = TieredBackingStore(60, [fast, middle, slow])
+        entry = store.lookup("key")
+
+        self.assertEqual("data", entry.value)
+        fast.cache.assert_called_once_with("key", (10, "data"))
+        middle.cache.assert_called_once_with("key", (10, "data"))
+        self.assertFalse(slow.cache.called)
+
+    def test_lookup_stops_at_first_hit(self):
+        fast, slow = mock.Mock(), mock.Mock()
+        fast.lookup.return_value = CacheEntry("data", 10, True)
+
+        store = TieredBackingStore(60, [fast, slow])
+
+        self.assertTrue(store.lookup("key").found)
+        self.assertFalse(slow.lookup.called)
+        self.assertFalse(fast.cache.called)
+
+    def test_lookup_miss(self):
+        fast, slow = mock.Mock(), mock.Mock()
+        fast.lookup.return_value = MISSING
+        slow.lookup.return_value = MISSING
+
+        store = TieredBackingStore(60, [fast, slow])
+
+        self.assertIs(MISSING, store.lookup("key"))
+        self.assertRaises(KeyError, store.retrieve, "key")
+
+    def test_cache_fans_out(self):
+        fast, slow = mock.Mock(), mock.Mock()
+        fast.cache.return_value = False
+        slow.cache.return_value = True
+
+        store = TieredBackingStore(60, [fast, slow])
+        self.assertTrue(store.cache("key", (10, "data")))
+
+        fast.cache.assert_called_once_with("key", (10, "data"))
+        slow.cache.assert_called_once_with("key", (10, "data"))
+
+    def test_counters_in_every_tier(self):
+        fast, slow = mock.Mock(), mock.Mock()
+        fast.get_counter.return_value = None
+        slow.get_counter.return_value = 4
+        store = TieredBackingStore(60, [fast, slow])
+
+        store.set_counter("generation", 5)
+
+        fast.set_counter.assert_called_once_with("generation", 5)
+        slow.set_counter.assert_called_once_with("generation", 5)
+        self.assertEqual(4, store.get_counter("generation"))
+
+    def test_bind_labels_every_tier(self):
+        fast, slow = mock.Mock(), mock.Mock()
+
+        TieredBackingStore(60, [fast, slow]).bind("get_templates")
+
+        fast.bind.assert_called_once_with("get_templates")
+        slow.bind.assert_called_once_with("get_templates")
+
+    def test_delete_fans_out(self):
+        fast, slow = mock.Mock(), mock.Mock()
+
+        TieredBackingStore(60, [fast, slow]).delete("key")
+
+        fast.delete.assert_called_once_with("key")
+        slow.delete.assert_called_once_with("key")
+
+    def test_get_many(self):
+        fast, slow = mock.Mock(), mock.Mock()
+        fast.get_many.return_value = {"a": CacheEntry("a", 10, True),
+                                      "b": MISSING, "c": MISSING}
+        slow.get_many.return_value = {"b": CacheEntry("b", 10, True),
+                                      "c": MISSING}
+
+        store = TieredBackingStore(60, [fast, slow])
+        entries = store.get_many(["a", "b", "c"])
+
+        self.assertEqual("a", entries["a"].value)
+        self.assertEqual("b", entries["b"].value)
+        self.assertIs(MISSING, entries["c"])
+        slow.get_many.assert_called_once_with(["b", "c"])
+        fast.set_many.assert_called_once_with({"b": (10, "b")})
+
+    def test_leases_use_first_shared_tier(self):
+        local = FileSystemBackingStore.__new__(FileSystemBackingStore)
+        shared = mock.Mock(shared_leases=True)
+        shared.acquire_lease.return_value = 5
+
+        store = TieredBackingStore(60, [local, shared])
+
+        self.assertTrue(store.shared_leases)
+        self.assertEqual(5, store.acquire_lease("key", 30))
+        store.release_lease("key", 5)
+        shared.release_lease.assert_called_once_with("key", 5)
+
+    def test_cache_fenced_by_shared_tier(self):
+        local, shared = mock.Mock(shared_leases=False), mock.Mock(
+            shared_leases=True)
+        store = TieredBackingStore(60, [local, shared])
+
+        shared.cache_fenced.return_value = False
+        self.assertFalse(store.cache_fenced("key", (10, "data"), 5))
+        self.assertFalse(local.cache.called)
+
+        shared.cache_fenced.return_value = True
+        self.assertTrue(store.cache_fenced("key", (10, "data"), 5))
+        local.cache.assert_called_once_with("key", (10, "data"))
+        self.assertFalse(shared.cache.called)
+
+    def test_leases_granted_locally_without_shared_tier(self):
+        local = FileSystemBackingStore.__new__(FileSystemBackingStore)
+
+        store = TieredBackingStore(60, [local])
+
+        self.assertFalse(store.shared_leases)
+        self.assertIsNotNone(store.acquire_lease("key", 30))
+        self.assertTrue(store.lease_valid("key", 1))
+
+    @mock.patch('fusion.common.config.safe_get_config')
+    def test_create_from_configuration(self, mock_get_config):
+        def get_config(group, name):
+            return {"backing_stores": ["memcache", "filesystem"],
+                    "stale_grace": 0}.get(name)
+        mock_get_config.side_effect = get_config
+
+        store = BackingStore.create(cache_backing_store.CONFIGURED, 60)
+
+        self.assertIsInstance(store, TieredBackingStore)
+        self.assertIsInstance(store.tiers[0], MemcacheBackingStore)
+        self.assertIsInstance(store.tiers[1], FileSystemBackingStore)
+
+    @mock.patch('fusion.common.config.safe_get_config')
+    def test_create_keeps_entries_until_max_stale(self, mock_get_config):
+        config = {"stale_grace": 30, "max_stale": 3600}
+        mock_get_config.side_effect = lambda group, name: config.get(name)
+
+        self.assertEqual(3600, BackingStore.create("memcache", 60)._ttl)
+        config["max_stale"] = 60
+        self.assertEqual(90, BackingStore.create("memcache", 60)._ttl)
+
+    @mock.patch('fusion.common.config.safe_get_config')
+    def test_create_uses_given_stale_settings(self, mock_get_config):
+        config = {"stale_grace": 30, "max_stale": 3600}
+        mock_get_config.side_effect = lambda group, name: config.get(name)
+
+        store = BackingStore.create(["memcache"], 60, stale_grace=0,
+                                    max_stale=600)
+
+        self.assertEqual(600, store._ttl)
+
+    def test_create_single_tier_list(self):
+        store = BackingStore.create(["memcache"], 60)
+
+        self.assertIsInstance(store, MemcacheBackingStore)
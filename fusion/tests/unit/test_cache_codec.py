@@ -0,0 +1,72 @@
+import cPickle as pickle
+import datetime
+import unittest
+
+from fusion.common import cache_codec
+from fusion.common.cache_codec import Codec, CodecError
+
+VALUE = (10, [{"id": "1234", "description": "redis " * 100}])
+
+
+class CodecTest(unittest.TestCase):
+    def test_pickle_round_trip(self):
+        codec = Codec()
+        blob = codec.encode(VALUE)
+
+        self.assertEqual("\xfa\x01\x00", blob[:3])
+        self.assertEqual(VALUE, codec.decode(blob))
+
+    def test_json_round_trip(self):
+        codec = Codec(serializer=cache_codec.JSON)
+        blob = codec.encode(VALUE)
+
+        self.assertEqual("\xfa\x02\x00", blob[:3])
+        self.assertEqual(list(VALUE), codec.decode(blob))
+
+    def test_json_keeps_dates(self):
+        codec = Codec(serializer=cache_codec.JSON)
+        value = {"heat_template_version": datetime.date(2013, 5, 23),
+                 "created": datetime.datetime(2014, 1, 2, 3, 4, 5, 6)}
+
+        self.assertEqual(value, codec.decode(codec.encode(value)))
+
+    def test_unencodable_value(self):
+        value = {"heat_template_version": datetime.date(2013, 5, 23)}
+
+        self.assertRaises(CodecError,
+                          Codec(serializer=cache_codec.MARSHAL).encode, value)
+        self.assertRaises(CodecError,
+                          Codec(serializer=cache_codec.JSON).encode, object())
+
+    def test_marshal_round_trip(self):
+        codec = Codec(serializer=cache_codec.MARSHAL)
+
+        self.assertEqual(VALUE, codec.decode(codec.encode(VALUE)))
+
+    def test_compression_above_threshold(self):
+        codec = Codec(compressor=cache_codec.ZLIB, compress_threshold=100)
+        blob = codec.encode(VALUE)
+
+        self.assertEqual("\xfa\x01\x01", blob[:3])
+        self.assertTrue(len(blob) < len(pickle.dumps(VALUE, 2)))
+        self.assertEqual(VALUE, codec.decode(blob))
+
+    def test_no_compression_below_threshold(self):
+        codec = Codec(compressor=cache_codec.ZLIB, compress_threshold=10000)
+
+        self.assertEqual("\xfa\x01\x00", codec.encode(VALUE)[:3])
+
+    def test_decodes_values_of_other_codecs(self):
+        blob = Codec(serializer=cache_codec.MARSHAL,
+                     compressor=cache_codec.ZLIB).encode(VALUE)
+
+        self.assertEqual(VALUE, Codec().decode(blob))
+
+    def test_decodes_legacy_pickle(self):
+        blob = pickle.dumps(VALUE, pickle.HIGHEST_PROTOCOL)
+
+        self.assertEqual(VALUE, Codec().decode(blob))
+
+    def test_unknown_codec(self):
+        self.assertRaises(CodecError, Codec, serializer="yaml")
+        self.assertRaises(CodecError, Codec().decode, "\xfa\x09\x00data")
@@ -0,0 +1,79 @@
+import unittest
+
+from fusion.common.cache_key import canonical, KeyBuilder
+
+
+class Owner(object):
+    def __init__(self, name):
+        self.name = name
+
+    def cache_key(self):
+        return ["owner", self.name]
+
+
+def get_template(self, template_id, ref, with_meta=False):
+    pass
+
+
+class CanonicalTest(unittest.TestCase):
+    def test_canonical_values(self):
+        self.assertEqual([1, u"a", None, True],
+                         canonical((1, "a", None, True)))
+        self.assertEqual({u"1": [u"b"]}, canonical({1: ("b",)}))
+        self.assertEqual([1, 2], canonical(set([2, 1])))
+
+    def test_canonical_uses_cache_key(self):
+        self.assertEqual([u"owner", u"heat"], canonical(Owner("heat")))
+
+
+class KeyBuilderTest(unittest.TestCase):
+    def test_key_format(self):
+        builder = KeyBuilder(namespace="templates", prefix="fusion")
+        key = builder.build("get_templates", (["stable"], False), {})
+
+        self.assertTrue(key.startswith("fusion:templates:v1:"))
+        self.assertEqual(len("fusion:templates:v1:") + 40, len(key))
+
+    def test_key_is_stable_for_equal_arguments(self):
+        builder = KeyBuilder(namespace="templates", prefix="fusion")
+
+        self.assertEqual(
+            builder.build("f", (Owner("heat"),), {"b": 1, "a": 2}),
+            builder.build("f", (Owner("heat"),), {"a": 2, "b": 1}))
+        self.assertNotEqual(
+            builder.build("f", (Owner("heat"),), {}),
+            builder.build("f", (Owner("other"),), {}))
+        self.assertNotEqual(builder.build("f", (), {}),
+                            builder.build("g", (), {}))
+
+    def test_version_changes_key(self):
+        v1 = KeyBuilder(namespace="templates", prefix="fusion")
+        v2 = KeyBuilder(namespace="templates", prefix="fusion", version=2)
+
+        self.assertNotEqual(v1.build("f", (), {}), v2.build("f", (), {}))
+
+    def test_generation_changes_key(self):
+        builder = KeyBuilder(namespace="templates", prefix="fusion")
+
+        self.assertEqual(builder.build("f", (), {}),
+                         builder.build("f", (), {}, generation=0))
+        key = builder.build("f", (), {}, generation=3)
+        self.assertTrue(key.startswith("fusion:templates:v1:g3:"))
+        self.assertEqual("fusion:templates:v1:generation",
+                         builder.generation_key())
+
+    def test_key_args_select_arguments(self):
+        builder = KeyBuilder(key_args=("template_id", "ref"),
+                             prefix="fusion")
+        builder.bind(get_template)
+
+        self.assertEqual(
+            builder.build("get_template", (Owner("a"), "1", "stable"), {}),
+            builder.build("get_template", (Owner("b"), "1"),
+                          {"ref": "stable", "with_meta": True}))
+        self.assertTrue(builder.build("get_template", (None, "1", "x"), {})
+                        .startswith("fusion:get_template:v1:"))
+
+    def test_unknown_key_args(self):
+        builder = KeyBuilder(key_args=("missing",))
+        self.assertRaises(ValueError, builder.bind, get_template)
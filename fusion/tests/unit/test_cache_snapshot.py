@@ -0,0 +1,71 @@
+import os
+import shutil
+import tempfile
+
+import mock
+import unittest
+
+from fusion.common import cache_snapshot
+from fusion.common.cache_snapshot import CacheSnapshot
+from fusion.common.memory_store import MemoryStore
+
+
+class CacheSnapshotTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        self.path = os.path.join(self.root, "templates.snapshot")
+
+    def test_save_and_load_keep_birthdays(self):
+        store = MemoryStore()
+        store["a"] = (10, {"id": "1234"})
+        store["b"] = (20, "b", 2.5)
+        self.assertTrue(CacheSnapshot(store, self.path).save())
+
+        restored = MemoryStore()
+        self.assertEqual(2, CacheSnapshot(restored, self.path).load())
+
+        self.assertEqual((10, {"id": "1234"}), restored["a"])
+        self.assertEqual((20, "b", 2.5), restored["b"])
+        self.assertEqual([], [name for name in os.listdir(self.root)
+                              if name.startswith(CacheSnapshot.TEMP_PREFIX)])
+
+    def test_load_without_snapshot(self):
+        self.assertEqual(0, CacheSnapshot(MemoryStore(), self.path).load())
+
+    def test_load_ignores_corrupt_snapshot(self):
+        with open(self.path, 'wb') as snapshot:
+            snapshot.write("\xfa\x01\x01garbage")
+        store = MemoryStore()
+
+        self.assertEqual(0, CacheSnapshot(store, self.path).load())
+        self.assertEqual(0, len(store))
+
+    def test_save_to_missing_directory(self):
+        path = os.path.join(self.root, "missing", "templates.snapshot")
+
+        self.assertFalse(CacheSnapshot(MemoryStore(), path).save())
+
+    def test_save_all(self):
+        store = MemoryStore()
+        store["a"] = (10, "a")
+        snapshot = CacheSnapshot(store, self.path)
+
+        cache_snapshot.save_all()
+
+        self.assertTrue(os.path.exists(self.path))
+
+    @mock.patch('eventlet.spawn_n')
+    def test_start_schedules_once_per_process(self, mock_spawn):
+        snapshot = CacheSnapshot(MemoryStore(), self.path, interval=60)
+
+        snapshot.start()
+        snapshot.start()
+
+        self.assertEqual(1, mock_spawn.call_count)
+
+    @mock.patch('fusion.common.config.safe_get_config')
+    def test_disabled_without_path(self, mock_get_config):
+        mock_get_config.return_value = None
+
+        self.assertIsNone(CacheSnapshot.from_config(MemoryStore()))
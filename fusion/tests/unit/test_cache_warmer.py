@@ -0,0 +1,63 @@
+import mock
+import unittest
+
+from fusion.common import cache_warmer
+from fusion.common.cache_warmer import CacheWarmer
+
+
+class CacheWarmerTest(unittest.TestCase):
+    def setUp(self):
+        cache_warmer.WARMERS.clear()
+
+    def test_ready_after_warm_up(self):
+        job = mock.Mock()
+        warmer = CacheWarmer([job])
+
+        self.assertFalse(warmer.ready)
+        self.assertFalse(cache_warmer.is_ready())
+        warmer.warm()
+
+        self.assertTrue(job.called)
+        self.assertTrue(warmer.ready)
+        self.assertTrue(cache_warmer.is_ready())
+        self.assertEqual(1, warmer.stats['runs'])
+
+    def test_failed_job_does_not_block_readiness(self):
+        other = mock.Mock()
+        warmer = CacheWarmer([mock.Mock(side_effect=ValueError()), other])
+
+        warmer.warm()
+
+        self.assertTrue(other.called)
+        self.assertTrue(warmer.ready)
+        self.assertEqual(1, warmer.stats['failures'])
+
+    @mock.patch('eventlet.spawn_n')
+    def test_start_schedules_once_per_process(self, mock_spawn):
+        warmer = CacheWarmer([], interval=60)
+
+        warmer.start()
+        warmer.start()
+
+        self.assertEqual(1, mock_spawn.call_count)
+
+    @mock.patch('eventlet.spawn_n')
+    def test_start_without_interval(self, mock_spawn):
+        CacheWarmer([], interval=0).start()
+
+        self.assertFalse(mock_spawn.called)
+
+    @mock.patch('eventlet.sleep')
+    def test_schedule_warms_periodically(self, mock_sleep):
+        warmer = CacheWarmer([], interval=60)
+        warmer._schedule.pid = 1
+
+        def stop(seconds):
+            if warmer.stats['runs'] == 2:
+                warmer._schedule.release()
+        mock_sleep.side_effect = stop
+
+        warmer._run_schedule(1)
+
+        mock_sleep.assert_called_with(60)
+        self.assertEqual(3, warmer.stats['runs'])
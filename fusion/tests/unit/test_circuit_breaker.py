@@ -0,0 +1,78 @@
+import mock
+import time
+import unittest
+
+from fusion.common import circuit_breaker
+from fusion.common import metrics
+from fusion.common.circuit_breaker import CircuitBreaker, CircuitOpenError
+
+
+@mock.patch.object(time, 'time')
+class CircuitBreakerTest(unittest.TestCase):
+    def setUp(self):
+        metrics.REGISTRY.reset()
+
+    def test_opens_after_threshold(self, mock_time):
+        mock_time.return_value = 100
+        breaker = CircuitBreaker("redis", failure_threshold=2,
+                                 reset_timeout=30)
+
+        breaker.record_failure()
+        self.assertTrue(breaker.allow())
+        breaker.record_failure()
+
+        self.assertEqual(circuit_breaker.OPEN, breaker.state)
+        self.assertFalse(breaker.allow())
+        self.assertEqual(1, breaker.trips)
+        self.assertEqual(1, breaker.rejected)
+        self.assertEqual(1, circuit_breaker.TRIPS.total(service="redis"))
+        self.assertEqual(1, circuit_breaker.REJECTED.total(service="redis"))
+
+    def test_success_resets_failure_count(self, mock_time):
+        breaker = CircuitBreaker("redis", failure_threshold=2)
+
+        breaker.record_failure()
+        breaker.record_success()
+        breaker.record_failure()
+
+        self.assertEqual(circuit_breaker.CLOSED, breaker.state)
+
+    def test_single_probe_after_cool_down(self, mock_time):
+        mock_time.return_value = 100
+        breaker = CircuitBreaker("redis", failure_threshold=1,
+                                 reset_timeout=30)
+        breaker.record_failure()
+
+        mock_time.return_value = 131
+        self.assertTrue(breaker.allow())
+        self.assertEqual(circuit_breaker.HALF_OPEN, breaker.state)
+        self.assertFalse(breaker.allow())
+
+        breaker.record_success()
+        self.assertEqual(circuit_breaker.CLOSED, breaker.state)
+        self.assertTrue(breaker.allow())
+
+    def test_failed_probe_reopens(self, mock_time):
+        mock_time.return_value = 100
+        breaker = CircuitBreaker("redis", failure_threshold=1,
+                                 reset_timeout=30)
+        breaker.record_failure()
+        mock_time.return_value = 131
+        breaker.allow()
+
+        breaker.record_failure()
+
+        self.assertEqual(circuit_breaker.OPEN, breaker.state)
+        self.assertEqual(2, breaker.trips)
+        self.assertFalse(breaker.allow())
+
+    def test_call(self, mock_time):
+        mock_time.return_value = 100
+        breaker = CircuitBreaker("redis", failure_threshold=1)
+        operation = mock.Mock(side_effect=[ValueError(), "ok"])
+
+        self.assertRaises(ValueError, breaker.call, operation, "key")
+        self.assertRaises(CircuitOpenError, breaker.call, operation, "key")
+        operation.assert_called_once_with("key")
+        self.assertEqual({'state': circuit_breaker.OPEN, 'failures': 1,
+                          'trips': 1, 'rejected': 1}, breaker.stats())
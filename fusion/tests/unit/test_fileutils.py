@@ -0,0 +1,30 @@
+import os
+import shutil
+import tempfile
+
+import mock
+import unittest
+
+from fusion.common import fileutils
+
+
+class WriteAtomicallyTest(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        self.path = os.path.join(self.root, "file")
+
+    def test_write(self):
+        fileutils.write_atomically(self.path, "data")
+
+        with open(self.path, 'rb') as written:
+            self.assertEqual("data", written.read())
+        self.assertEqual(["file"], os.listdir(self.root))
+
+    @mock.patch('os.rename')
+    def test_failed_write_removes_temporary_file(self, mock_rename):
+        mock_rename.side_effect = OSError()
+
+        self.assertRaises(OSError, fileutils.write_atomically, self.path,
+                          "data")
+        self.assertEqual([], os.listdir(self.root))
@@ -1,12 +1,21 @@
+import io
+import tarfile
 import yaml
 
 import mock
 import unittest
+from github import GithubException
+from requests.packages.urllib3.exceptions import ProtocolError
 
+from fusion.api.templates import http_cache
+from fusion.api.templates import repo_index
 from fusion.api.templates import template_manager as managers
 
 
 class GithubManagerTest(unittest.TestCase):
+    def setUp(self):
+        repo_index.INDEXES.clear()
+
     @mock.patch('base64.b64decode')
     @mock.patch.object(managers.GithubManager, 'get_client')
     def test_get_templates_without_meta(self, mock_get_client, mock_decode):
@@ -97,6 +106,8 @@ class GithubManagerTest(unittest.TestCase):
         mock_org.get_repos.return_value = [redis_repo, wordpress_repo]
         mock_decode.side_effect = [redis_template, redis_metadata,
                                    wordpress_template]
+        for repo in (redis_repo, wordpress_repo):
+            repo.get_archive_link.side_effect = GithubException(404, "")
 
         mock_options = mock.Mock(
             github=mock.Mock(api_base="https://api.github.com",
@@ -155,6 +166,7 @@ class GithubManagerTest(unittest.TestCase):
         mock_org = mock_client.get_organization.return_value
         mock_repo = mock.MagicMock(id=1234)
         mock_org.get_repos.return_value = [mock_repo]
+        mock_repo.get_archive_link.side_effect = GithubException(404, "")
         mock_repo.get_file_contents.side_effect = [
             mock.Mock(content="template"), mock.Mock(content="metadata")]
         mock_decode.side_effect = [redis_template, redis_metadata]
@@ -217,3 +229,178 @@ class GithubManagerTest(unittest.TestCase):
         mock_decode.assert_called_once_with("template")
         mock_client.get_organization.assert_called_once_with("heat-templates")
         self.assertTrue(mock_org.get_repos.called)
+
+    @mock.patch.object(managers.GithubManager, 'get_template')
+    @mock.patch.object(managers.GithubManager, 'get_templates')
+    @mock.patch.object(managers.GithubManager, 'get_client')
+    def test_warm_cache(self, mock_get_client, mock_get_templates,
+                        mock_get_template):
+        mock_get_templates.return_value = [{'id': '1234'}, {'id': '2345'}]
+        mock_options = mock.Mock(github=mock.Mock(default_version="stable"))
+
+        manager = managers.GithubManager(mock_options)
+        manager.warm_cache()
+
+        mock_get_templates.assert_has_calls([mock.call(['stable'], False),
+                                             mock.call(['stable'], True)])
+        mock_get_template.assert_has_calls([
+            mock.call('1234', 'stable', False),
+            mock.call('2345', 'stable', False),
+            mock.call('1234', 'stable', True),
+            mock.call('2345', 'stable', True)], any_order=True)
+        self.assertEqual(4, mock_get_template.call_count)
+
+    @mock.patch.object(managers.GithubManager, 'get_client')
+    def test_get_template_uses_repo_index(self, mock_get_client):
+        mock_client = mock_get_client.return_value
+        mock_org = mock_client.get_organization.return_value
+        mock_repo = mock.MagicMock(id=1234)
+        mock_org.get_repos.return_value = [mock_repo]
+        mock_repo.get_file_contents.return_value = None
+        mock_options = mock.Mock(
+            github=mock.Mock(api_base="https://api.github.com",
+                             organization="heat-templates",
+                             metadata_file="heat.metadata",
+                             template_file="heat.template"))
+
+        manager = managers.GithubManager(mock_options)
+        manager.get_template("1234", "stable", False)
+        manager.get_template("1234", "master", False)
+
+        self.assertIsNone(manager.get_template("9999", "stable", False))
+        self.assertEqual(1, mock_org.get_repos.call_count)
+        self.assertEqual(1, mock_client.get_organization.call_count)
+        self.assertEqual(2, mock_repo.get_file_contents.call_count)
+
+    @staticmethod
+    def _archive(files):
+        data = io.BytesIO()
+        archive = tarfile.open(fileobj=data, mode="w:gz")
+        for name, content in files:
+            info = tarfile.TarInfo("heat-templates-redis-abc123/" + name)
+            info.size = len(content)
+            archive.addfile(info, io.BytesIO(content))
+        archive.close()
+        return io.BytesIO(data.getvalue())
+
+    @mock.patch.object(http_cache, 'get_session')
+    @mock.patch.object(managers.GithubManager, 'get_client')
+    def test_get_template_with_metadata_from_archive(self, mock_get_client,
+                                                     mock_get_session):
+        mock_repo = mock.MagicMock(id=1234)
+        mock_repo.get_archive_link.return_value = "https://codeload/redis"
+        response = mock_get_session.return_value.get.return_value
+        response.raw = self._archive([
+            ("README.md", "readme"),
+            ("heat.template", "description: redis\n"),
+            ("heat.metadata", "meta: data\n")])
+        mock_options = mock.Mock(
+            github=mock.Mock(metadata_file="heat.metadata",
+                             template_file="heat.template"))
+
+        manager = managers.GithubManager(mock_options)
+        template = manager._get_template(mock_repo, "stable", True)
+
+        self.assertEqual({'description': 'redis', 'meta': 'data',
+                          'id': '1234', 'version': 'stable'}, template)
+        mock_repo.get_archive_link.assert_called_once_with("tarball",
+                                                           "stable")
+        mock_get_session.return_value.get.assert_called_once_with(
+            "https://codeload/redis", stream=True,
+            timeout=managers.ARCHIVE_TIMEOUT)
+        self.assertFalse(mock_repo.get_file_contents.called)
+        self.assertTrue(response.close.called)
+
+    @mock.patch('fusion.common.config.safe_get_config')
+    @mock.patch.object(http_cache, 'get_session')
+    @mock.patch.object(managers.GithubManager, 'get_client')
+    def test_oversized_archive_falls_back_to_contents(self, mock_get_client,
+                                                      mock_get_session,
+                                                      mock_get_config):
+        mock_get_config.return_value = 16
+        mock_repo = mock.MagicMock(id=1234)
+        mock_get_session.return_value.get.return_value.raw = self._archive(
+            [("heat.template", "description: redis\n")])
+        mock_repo.get_file_contents.side_effect = [
+            mock.Mock(content="ZGVzY3JpcHRpb246IHJlZGlzCg=="), None]
+        mock_options = mock.Mock(
+            github=mock.Mock(metadata_file="heat.metadata",
+                             template_file="heat.template"))
+
+        manager = managers.GithubManager(mock_options)
+        template = manager._get_template(mock_repo, "stable", True)
+
+        self.assertEqual({'description': 'redis', 'id': '1234',
+                          'version': 'stable'}, template)
+        mock_repo.get_file_contents.assert_has_calls([
+            mock.call("heat.template", ref="stable"),
+            mock.call("heat.metadata", ref="stable")])
+
+    @mock.patch.object(managers.GithubManager, 'get_client')
+    def test_large_file_read_from_blob_api(self, mock_get_client):
+        mock_repo = mock.MagicMock(id=1234)
+        mock_repo.get_file_contents.return_value = mock.Mock(
+            content="", size=2 * 1024 * 1024, sha="abc123")
+        mock_repo.get_git_blob.return_value = mock.Mock(
+            content="ZGVzY3JpcHRpb246IHJlZGlzCg==")
+        mock_options = mock.Mock(
+            github=mock.Mock(metadata_file="heat.metadata",
+                             template_file="heat.template"))
+
+        manager = managers.GithubManager(mock_options)
+        template = manager._get_template(mock_repo, "stable", False)
+
+        self.assertEqual('redis', template['description'])
+        mock_repo.get_git_blob.assert_called_once_with("abc123")
+
+    @mock.patch.object(managers.GithubManager, 'get_client')
+    def test_archive_error_falls_back_to_contents(self, mock_get_client):
+        mock_repo = mock.MagicMock(id=1234)
+        mock_repo.get_archive_link.side_effect = GithubException(404, "")
+        mock_repo.get_file_contents.return_value = None
+        mock_options = mock.Mock(
+            github=mock.Mock(metadata_file="heat.metadata",
+                             template_file="heat.template"))
+
+        manager = managers.GithubManager(mock_options)
+
+        self.assertIsNone(manager._get_template(mock_repo, "stable", True))
+        self.assertEqual(2, mock_repo.get_file_contents.call_count)
+
+    @mock.patch.object(http_cache, 'get_session')
+    @mock.patch.object(managers.GithubManager, 'get_client')
+    def test_broken_download_falls_back_to_contents(self, mock_get_client,
+                                                    mock_get_session):
+        mock_repo = mock.MagicMock(id=1234)
+        response = mock_get_session.return_value.get.return_value
+        response.raw.read.side_effect = ProtocolError("Connection broken")
+        mock_repo.get_file_contents.side_effect = [
+            mock.Mock(content="ZGVzY3JpcHRpb246IHJlZGlzCg=="), None]
+        mock_options = mock.Mock(
+            github=mock.Mock(metadata_file="heat.metadata",
+                             template_file="heat.template"))
+
+        manager = managers.GithubManager(mock_options)
+        template = manager._get_template(mock_repo, "stable", True)
+
+        self.assertEqual('redis', template['description'])
+        self.assertTrue(response.close.called)
+
+    @mock.patch.object(http_cache, 'installed')
+    @mock.patch.object(managers.GithubManager, 'get_client')
+    def test_contents_api_used_with_http_cache(self, mock_get_client,
+                                               mock_installed):
+        mock_installed.return_value = True
+        mock_repo = mock.MagicMock(id=1234)
+        mock_repo.get_file_contents.side_effect = [
+            mock.Mock(content="ZGVzY3JpcHRpb246IHJlZGlzCg=="), None]
+        mock_options = mock.Mock(
+            github=mock.Mock(metadata_file="heat.metadata",
+                             template_file="heat.template"))
+
+        manager = managers.GithubManager(mock_options)
+        template = manager._get_template(mock_repo, "stable", True)
+
+        self.assertEqual('redis', template['description'])
+        self.assertFalse(mock_repo.get_archive_link.called)
+
@@ -0,0 +1,148 @@
+import os
+import shutil
+import tempfile
+import time
+
+import mock
+import unittest
+from github import Requester
+
+from fusion.api.templates import http_cache
+from fusion.api.templates.http_cache import ConditionalRequestsMixin
+from fusion.common.cache_backing_store import FileSystemBackingStore
+
+
+class FakeConnection(object):
+    def __init__(self, host, port=None, strict=False, timeout=None,
+                 retry=None, **kwargs):
+        self.host = host
+        self.port = port
+        self.protocol = "https"
+        self.responses = []
+        self.sent = []
+
+    def request(self, verb, url, input, headers):
+        self.verb = verb
+        self.url = url
+        self.headers = headers
+
+    def getresponse(self):
+        self.sent.append(self.headers)
+        return self.responses.pop(0)
+
+
+class CachingConnection(ConditionalRequestsMixin, FakeConnection):
+    pass
+
+
+def response(status, body="", **headers):
+    return mock.Mock(status=status, headers=headers, text=body)
+
+
+class ConditionalRequestsTest(unittest.TestCase):
+    def setUp(self):
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir, True)
+        store = mock.patch.object(http_cache, "_store",
+                                  FileSystemBackingStore(60,
+                                                         cache_root=cache_dir))
+        store.start()
+        self.addCleanup(store.stop)
+        self.connection = CachingConnection("api.github.com", 443)
+
+    def _get(self, url, *responses, **headers):
+        headers.setdefault('Authorization', "token a")
+        self.connection.responses = list(responses)
+        self.connection.request("GET", url, None, headers)
+        return self.connection.getresponse()
+
+    def test_not_modified_replays_stored_response(self):
+        self._get("/repos/a", response(200, "body", ETag='"v1"',
+                                       **{'X-RateLimit-Remaining': "10"}))
+
+        replayed = self._get("/repos/a", response(
+            304, **{'X-RateLimit-Remaining': "9"}))
+
+        self.assertEqual('"v1"', self.connection.sent[-1]['If-None-Match'])
+        self.assertEqual(200, replayed.status)
+        self.assertEqual("body", replayed.read())
+        self.assertEqual("9", dict(replayed.getheaders())[
+            'x-ratelimit-remaining'])
+
+    def test_not_modified_renews_stored_response(self):
+        self._get("/repos/a", response(200, "body", ETag='"v1"'))
+        key = self.connection._cache_key()
+        path = http_cache._store._cache_file(key)
+        os.utime(path, (time.time() - 100, time.time() - 100))
+
+        self._get("/repos/a", response(304))
+
+        self.assertTrue(time.time() - os.stat(path).st_mtime < 10)
+        self.assertEqual(0, http_cache._store.gc())
+
+    def test_last_modified_sent(self):
+        self._get("/repos/a", response(200, "body", **{
+            'Last-Modified': "Mon, 01 Jan 2024 00:00:00 GMT"}))
+
+        self._get("/repos/a", response(304))
+
+        self.assertEqual("Mon, 01 Jan 2024 00:00:00 GMT",
+                         self.connection.sent[-1]['If-Modified-Since'])
+
+    def test_changed_response_replaces_stored_one(self):
+        self._get("/repos/a", response(200, "old", ETag='"v1"'))
+        self._get("/repos/a", response(200, "new", ETag='"v2"'))
+
+        replayed = self._get("/repos/a", response(304))
+
+        self.assertEqual('"v2"', self.connection.sent[-1]['If-None-Match'])
+        self.assertEqual("new", replayed.read())
+
+    def test_responses_are_kept_per_authorization(self):
+        self._get("/repos/a", response(200, "body", ETag='"v1"'))
+
+        self._get("/repos/a", response(200, "body"),
+                  Authorization="token b")
+
+        self.assertNotIn('If-None-Match', self.connection.sent[-1])
+
+    def test_responses_without_validators_are_not_stored(self):
+        self._get("/repos/a", response(200, "body"))
+
+        self._get("/repos/a", response(200, "body"))
+
+        self.assertNotIn('If-None-Match', self.connection.sent[-1])
+        self.assertNotIn('If-Modified-Since', self.connection.sent[-1])
+
+    def test_other_verbs_pass_through(self):
+        self.connection.responses = [response(200, ETag='"v1"')]
+        self.connection.request("POST", "/repos/a", "{}", {})
+        self.connection.getresponse()
+
+        self._get("/repos/a", response(200))
+
+        self.assertNotIn('If-None-Match', self.connection.sent[-1])
+
+
+class InstallTest(unittest.TestCase):
+    def setUp(self):
+        self.addCleanup(http_cache.uninstall)
+
+    @mock.patch('fusion.common.config.safe_get_config')
+    def test_disabled_without_cache_dir(self, mock_get_config):
+        mock_get_config.return_value = None
+
+        self.assertFalse(http_cache.install())
+        self.assertIsNone(http_cache._store)
+
+    @mock.patch.object(Requester.Requester, 'injectConnectionClasses')
+    def test_install_injects_connection_classes_once(self, mock_inject):
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir, True)
+
+        self.assertTrue(http_cache.install(cache_dir))
+        self.assertTrue(http_cache.install(cache_dir))
+
+        mock_inject.assert_called_once_with(
+            http_cache.ConditionalHTTPConnection,
+            http_cache.ConditionalHTTPSConnection)
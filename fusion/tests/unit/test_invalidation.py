@@ -0,0 +1,127 @@
+import json
+
+import mock
+import unittest
+
+from fusion.common import invalidation
+from fusion.common.invalidation import LocalBus, RedisBus
+
+
+class LocalBusTest(unittest.TestCase):
+    def test_publish_reaches_other_buses_only(self):
+        peers = []
+        sender, receiver = LocalBus(peers), LocalBus(peers)
+        sent, received = mock.Mock(), mock.Mock()
+        sender.subscribe(sent)
+        receiver.subscribe(received)
+
+        sender.publish({'keys': ["a"]})
+
+        self.assertFalse(sent.called)
+        message = received.call_args[0][0]
+        self.assertEqual(["a"], message['keys'])
+        self.assertEqual(sender.origin, message['origin'])
+        self.assertEqual(1, sender.stats['published'])
+        self.assertEqual(1, receiver.stats['received'])
+
+    def test_handler_errors_are_contained(self):
+        peers = []
+        sender, receiver = LocalBus(peers), LocalBus(peers)
+        good = mock.Mock()
+        receiver.subscribe(mock.Mock(side_effect=ValueError()))
+        receiver.subscribe(good)
+
+        sender.publish({'keys': ["a"]})
+
+        self.assertTrue(good.called)
+
+    def test_malformed_message_ignored(self):
+        bus = LocalBus()
+        handler = mock.Mock()
+        bus.subscribe(handler)
+
+        bus.deliver("not json")
+
+        self.assertFalse(handler.called)
+
+    @mock.patch('os.getpid')
+    def test_forked_worker_gets_new_origin(self, mock_getpid):
+        bus = LocalBus()
+        mock_getpid.return_value = 1
+        parent = bus.origin
+        mock_getpid.return_value = 2
+
+        self.assertNotEqual(parent, bus.origin)
+
+
+class RedisBusTest(unittest.TestCase):
+    def test_publish(self):
+        client = mock.Mock()
+        bus = RedisBus("channel", client=client)
+
+        bus.publish({'keys': ["a"]})
+
+        channel, payload = client.publish.call_args[0]
+        self.assertEqual("channel", channel)
+        self.assertEqual(["a"], json.loads(payload)['keys'])
+
+    def test_publish_error_is_counted(self):
+        client = mock.Mock()
+        client.publish.side_effect = Exception()
+        bus = RedisBus("channel", client=client)
+
+        bus.publish({'keys': ["a"]})
+
+        self.assertEqual(1, bus.stats['failed'])
+
+    @mock.patch('eventlet.sleep')
+    def test_listener_delivers_and_resyncs_after_reconnect(self, mock_sleep):
+        other = json.dumps({'keys': ["a"], 'origin': "other"})
+        first, second = mock.Mock(), mock.Mock()
+        first.listen.return_value = iter([
+            {'type': 'message', 'data': other}])
+        second.listen.side_effect = Exception("disconnected")
+        bus = RedisBus("channel",
+                       pubsub_factory=mock.Mock(side_effect=[first, second]))
+        handler = mock.Mock()
+        bus.subscribe(handler)
+        bus._listener.pid = 1
+        # Stop after the second connection attempt.
+        mock_sleep.side_effect = [None, Exception("stop")]
+
+        self.assertRaises(Exception, bus._listen, 1)
+
+        first.subscribe.assert_called_once_with("channel")
+        self.assertEqual([mock.call({'keys': ["a"], 'origin': "other"}),
+                          mock.call({'resync': True})],
+                         handler.call_args_list)
+
+    @mock.patch('eventlet.spawn_n')
+    def test_listener_started_once_per_process(self, mock_spawn):
+        bus = RedisBus("channel")
+
+        bus.ensure_listener()
+        bus.ensure_listener()
+
+        self.assertEqual(1, mock_spawn.call_count)
+
+
+class GetBusTest(unittest.TestCase):
+    def setUp(self):
+        invalidation.BUSES.clear()
+        self.addCleanup(invalidation.BUSES.clear)
+
+    @mock.patch('fusion.common.config.safe_get_config')
+    def test_disabled_by_default(self, mock_get_config):
+        mock_get_config.return_value = None
+
+        self.assertIsNone(invalidation.get_bus())
+
+    @mock.patch('fusion.common.config.safe_get_config')
+    def test_configured_bus_is_shared(self, mock_get_config):
+        mock_get_config.return_value = "redis"
+
+        bus = invalidation.get_bus()
+
+        self.assertIsInstance(bus, RedisBus)
+        self.assertIs(bus, invalidation.get_bus())
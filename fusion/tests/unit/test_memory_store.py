@@ -0,0 +1,117 @@
+import mock
+import unittest
+
+from fusion.common import memory_store
+from fusion.common.memory_store import MemoryStore
+
+
+class MemoryStoreTest(unittest.TestCase):
+    def test_get_and_set(self):
+        store = MemoryStore()
+        store["key"] = (10, "data")
+
+        self.assertTrue("key" in store)
+        self.assertEqual((10, "data"), store["key"])
+        self.assertEqual(1, len(store))
+
+    def test_lru_eviction_on_max_entries(self):
+        store = MemoryStore(max_entries=2)
+        store["a"] = (10, "a")
+        store["b"] = (10, "b")
+        store["a"]
+        store["c"] = (10, "c")
+
+        self.assertEqual(["a", "c"], sorted(store.keys()))
+        self.assertEqual(1, store.evictions['entries'])
+
+    def test_ttl_eviction_on_max_entries(self):
+        store = MemoryStore(max_entries=2, policy=memory_store.TTL)
+        store["a"] = (5, "a")
+        store["b"] = (10, "b")
+        store["b"]
+        store["a"]
+        store["c"] = (20, "c")
+
+        self.assertEqual(["b", "c"], sorted(store.keys()))
+
+    def test_eviction_on_max_bytes(self):
+        store = MemoryStore(max_bytes=10, sizeof=lambda entry: 4)
+        store["a"] = (10, "a")
+        store["b"] = (10, "b")
+        store["c"] = (10, "c")
+
+        self.assertEqual(["b", "c"], sorted(store.keys()))
+        self.assertEqual(8, store.size_bytes)
+        self.assertEqual(1, store.evictions['bytes'])
+
+    def test_oversized_entry_is_not_stored(self):
+        store = MemoryStore(max_bytes=10, sizeof=lambda entry: 11)
+        store["a"] = (10, "a")
+
+        self.assertFalse("a" in store)
+        self.assertEqual(0, store.size_bytes)
+
+    def test_replacing_entry_updates_size(self):
+        store = MemoryStore()
+        store["a"] = (10, "a")
+        store["a"] = (10, "a" * 100)
+        del store["a"]
+
+        self.assertEqual(0, store.size_bytes)
+
+    @mock.patch.object(MemoryStore, '_now')
+    def test_sweep_removes_expired_entries(self, mock_now):
+        mock_now.return_value = 100
+        store = MemoryStore(ttl=50, sweep_interval=30)
+        store["old"] = (40, "old")
+        store["new"] = (90, "new")
+        self.assertEqual(2, len(store))
+
+        mock_now.return_value = 130
+        store["newest"] = (130, "newest")
+
+        self.assertEqual(["new", "newest"], sorted(store.keys()))
+        self.assertEqual(1, store.evictions['expired'])
+
+    def test_invalid_policy(self):
+        self.assertRaises(ValueError, MemoryStore, policy="random")
+
+    @mock.patch.object(MemoryStore, "_now")
+    def test_snapshot_and_restore(self, mock_now):
+        mock_now.return_value = 100
+        store = MemoryStore(ttl=50)
+        store["a"] = (90, "a", 1.5)
+        store["b"] = (80, "b")
+        store["a"]
+
+        restored = MemoryStore(ttl=50)
+        restored["b"] = (95, "newer")
+        mock_now.return_value = 135
+
+        self.assertEqual(1, restored.restore(store.snapshot()))
+        self.assertEqual((90, "a", 1.5), restored["a"])
+        self.assertEqual((95, "newer"), restored["b"])
+
+    @mock.patch.object(MemoryStore, "_now")
+    def test_restore_skips_expired_entries(self, mock_now):
+        mock_now.return_value = 100
+        store = MemoryStore(ttl=50)
+
+        self.assertEqual(0, store.restore([("a", (40, "a"))]))
+        self.assertNotIn("a", store)
+
+    @mock.patch('fusion.common.config.safe_get_config')
+    def test_from_config_keeps_entries_until_max_stale(self, mock_get_config):
+        config = {"default_timeout": 60, "stale_grace": 30, "max_stale": 0}
+        mock_get_config.side_effect = lambda group, name: config.get(name)
+
+        self.assertEqual(90, MemoryStore.from_config()._ttl)
+        self.assertEqual(600, MemoryStore.from_config(max_stale=600)._ttl)
+
+    def test_retain_only_widens_ttl(self):
+        store = MemoryStore(ttl=50)
+
+        store.retain(30)
+        self.assertEqual(50, store._ttl)
+        store.retain(90)
+        self.assertEqual(90, store._ttl)
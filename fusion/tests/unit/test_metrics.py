@@ -0,0 +1,81 @@
+import mock
+import unittest
+
+from fusion.common.metrics import Counter, Histogram, MetricsRegistry
+
+
+class MetricsRegistryTest(unittest.TestCase):
+    def setUp(self):
+        self.registry = MetricsRegistry()
+
+    def test_counter_series_per_label_values(self):
+        counter = Counter("hits_total", "Hits.", ("function", "tier"),
+                          registry=self.registry)
+
+        counter.labels(function="f", tier="memory").inc()
+        counter.labels(tier="memory", function="f").inc(2)
+        counter.labels(function="g", tier="redis").inc()
+
+        self.assertEqual(3, counter.labels(function="f",
+                                           tier="memory").value)
+        self.assertEqual(
+            "# HELP hits_total Hits.\n"
+            "# TYPE hits_total counter\n"
+            'hits_total{function="f",tier="memory"} 3\n'
+            'hits_total{function="g",tier="redis"} 1\n',
+            self.registry.render())
+
+    def test_counter_total(self):
+        counter = Counter("hits_total", "Hits.", ("function", "tier"),
+                          registry=self.registry)
+
+        counter.labels(function="f", tier="memory").inc()
+        counter.labels(function="f", tier="redis").inc(2)
+        counter.labels(function="g", tier="redis").inc(4)
+
+        self.assertEqual(3, counter.total(function="f"))
+        self.assertEqual(6, counter.total(tier="redis"))
+        self.assertEqual(0, counter.total(function="h"))
+        self.assertEqual(7, counter.total())
+
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = Histogram("refresh_seconds", "Refreshes.",
+                              ("function",), buckets=(0.1, 1.0),
+                              registry=self.registry)
+
+        for value in (0.05, 0.5, 5.0):
+            histogram.labels(function="f").observe(value)
+
+        self.assertEqual(
+            "# HELP refresh_seconds Refreshes.\n"
+            "# TYPE refresh_seconds histogram\n"
+            'refresh_seconds_bucket{function="f",le="0.1"} 1\n'
+            'refresh_seconds_bucket{function="f",le="1.0"} 2\n'
+            'refresh_seconds_bucket{function="f",le="+Inf"} 3\n'
+            'refresh_seconds_sum{function="f"} 5.55\n'
+            'refresh_seconds_count{function="f"} 3\n',
+            self.registry.render())
+
+    def test_label_values_are_escaped(self):
+        counter = Counter("c", "C.", ("function",), registry=self.registry)
+        counter.labels(function='a"b\\').inc()
+
+        self.assertIn('c{function="a\\"b\\\\"} 1', self.registry.render())
+
+    def test_reset(self):
+        counter = Counter("c", "C.", registry=self.registry)
+        counter.labels().inc()
+
+        self.registry.reset()
+
+        self.assertEqual([(counter, [])], self.registry.collect())
+
+    @mock.patch('os.getpid')
+    def test_values_dropped_after_fork(self, mock_getpid):
+        mock_getpid.return_value = 1
+        counter = Counter("c", "C.", registry=self.registry)
+        counter.labels().inc()
+
+        mock_getpid.return_value = 2
+
+        self.assertEqual(0, counter.labels().value)
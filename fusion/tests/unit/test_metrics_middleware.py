@@ -0,0 +1,35 @@
+import mock
+import unittest
+import webob
+
+from fusion.common import metrics_middleware
+from fusion.common.metrics_middleware import MetricsMiddleware
+
+
+class MetricsMiddlewareTest(unittest.TestCase):
+    @mock.patch('fusion.common.metrics.REGISTRY')
+    def test_metrics(self, mock_registry):
+        mock_registry.render.return_value = "hits_total 1\n"
+        app = mock.Mock()
+
+        response = webob.Request.blank("/metrics").get_response(
+            MetricsMiddleware(app))
+
+        self.assertEqual(200, response.status_int)
+        self.assertEqual("hits_total 1\n", response.body)
+        self.assertTrue(response.content_type.startswith("text/plain"))
+        self.assertFalse(app.called)
+
+    def test_other_requests_pass_through(self):
+        middleware = MetricsMiddleware(mock.Mock())
+
+        self.assertIsNone(middleware.process_request(
+            webob.Request.blank("/v1/templates")))
+
+    def test_filter_factory(self):
+        app = mock.Mock()
+
+        middleware = metrics_middleware.MetricsMiddleware_filter_factory(
+            {})(app)
+
+        self.assertIsInstance(middleware, MetricsMiddleware)
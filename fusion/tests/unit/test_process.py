@@ -0,0 +1,32 @@
+import mock
+import unittest
+
+from fusion.common.process import ProcessOwner
+
+
+@mock.patch('os.getpid')
+class ProcessOwnerTest(unittest.TestCase):
+    def test_claimed_once_per_process(self, mock_getpid):
+        mock_getpid.return_value = 1
+        owner = ProcessOwner()
+
+        self.assertTrue(owner.claim())
+        self.assertFalse(owner.claim())
+        mock_getpid.return_value = 2
+        self.assertTrue(owner.claim())
+        self.assertEqual(2, owner.pid)
+
+    def test_claimed_on_creation(self, mock_getpid):
+        mock_getpid.return_value = 1
+        owner = ProcessOwner(claimed=True)
+
+        self.assertFalse(owner.claim())
+
+    def test_release(self, mock_getpid):
+        mock_getpid.return_value = 1
+        owner = ProcessOwner(claimed=True)
+
+        owner.release()
+
+        self.assertIsNone(owner.pid)
+        self.assertTrue(owner.claim())
@@ -0,0 +1,43 @@
+import json
+
+import mock
+import unittest
+import webob
+
+from fusion.common import readiness_middleware
+from fusion.common.readiness_middleware import ReadinessMiddleware
+
+
+class ReadinessMiddlewareTest(unittest.TestCase):
+    @mock.patch('fusion.common.cache_warmer.is_ready')
+    def test_not_ready_while_warming(self, mock_ready):
+        mock_ready.return_value = False
+        app = mock.Mock()
+
+        response = webob.Request.blank("/ready").get_response(
+            ReadinessMiddleware(app))
+
+        self.assertEqual(503, response.status_int)
+        self.assertFalse(json.loads(response.body)['ready'])
+        self.assertFalse(app.called)
+
+    @mock.patch('fusion.common.cache_warmer.is_ready')
+    def test_ready(self, mock_ready):
+        mock_ready.return_value = True
+
+        response = webob.Request.blank("/ready").get_response(
+            ReadinessMiddleware(mock.Mock()))
+
+        self.assertEqual(200, response.status_int)
+
+    def test_other_requests_pass_through(self):
+        middleware = ReadinessMiddleware(mock.Mock())
+
+        self.assertIsNone(middleware.process_request(
+            webob.Request.blank("/v1/templates")))
+
+    def test_filter_factory(self):
+        app = mock.Mock()
+        filter = readiness_middleware.ReadinessMiddleware_filter_factory({})
+
+        self.assertIs(app, filter(app).application)
@@ -0,0 +1,96 @@
+import eventlet
+import mock
+import unittest
+
+from fusion.common.refresh_executor import RefreshExecutor
+
+
+class RefreshExecutorTest(unittest.TestCase):
+    def test_submit_runs_job_in_background(self):
+        job = mock.Mock()
+        executor = RefreshExecutor()
+
+        self.assertTrue(executor.submit("key", job, 1, 2))
+        self.assertFalse(job.called)
+        eventlet.sleep(0)
+
+        job.assert_called_once_with(1, 2)
+        self.assertFalse(executor.is_pending("key"))
+        self.assertEqual(1, executor.stats['completed'])
+        self.assertEqual(1, executor.metrics()['latency']['count'])
+
+    def test_pending_key_is_deduplicated(self):
+        job = mock.Mock()
+        executor = RefreshExecutor()
+
+        executor.submit("key", job)
+        self.assertFalse(executor.submit("key", job))
+        eventlet.sleep(0)
+
+        self.assertEqual(1, job.call_count)
+        self.assertEqual(1, executor.stats['deduplicated'])
+
+    def test_concurrency_is_capped(self):
+        running = []
+        done = eventlet.event.Event()
+
+        def job(key):
+            running.append(key)
+            done.wait()
+
+        executor = RefreshExecutor(concurrency=2)
+        for key in ("a", "b", "c"):
+            executor.submit(key, job, key)
+        eventlet.sleep(0)
+
+        self.assertEqual(["a", "b"], running)
+        self.assertEqual(2, executor.running)
+        self.assertEqual(1, executor.depth)
+
+        done.send()
+        eventlet.sleep(0)
+        eventlet.sleep(0)
+        self.assertEqual(["a", "b", "c"], running)
+
+    def test_most_requested_key_runs_first(self):
+        order = []
+        done = eventlet.event.Event()
+        executor = RefreshExecutor(concurrency=1)
+        executor.submit("busy", done.wait)
+        for key in ("cold", "hot", "hot", "hot", "warm", "warm"):
+            executor.submit(key, order.append, key)
+
+        done.send()
+        for _ in range(4):
+            eventlet.sleep(0)
+
+        self.assertEqual(["hot", "warm", "cold"], order)
+
+    def test_full_queue_drops_new_keys(self):
+        done = eventlet.event.Event()
+        executor = RefreshExecutor(concurrency=1, max_queue=1)
+        executor.submit("a", done.wait)
+        executor.submit("b", mock.Mock())
+
+        self.assertFalse(executor.submit("c", mock.Mock()))
+        self.assertEqual(1, executor.stats['dropped'])
+        done.send()
+
+    def test_failed_job_is_counted_and_cleared(self):
+        executor = RefreshExecutor()
+
+        executor.submit("key", mock.Mock(side_effect=ValueError()))
+        eventlet.sleep(0)
+
+        self.assertEqual(1, executor.stats['failed'])
+        self.assertFalse(executor.is_pending("key"))
+
+    @mock.patch('os.getpid')
+    def test_fork_forgets_parent_refreshes(self, mock_getpid):
+        mock_getpid.return_value = 1
+        executor = RefreshExecutor(concurrency=1)
+        executor._running.add("key")
+
+        mock_getpid.return_value = 2
+
+        self.assertFalse(executor.is_pending("key"))
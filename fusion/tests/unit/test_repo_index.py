@@ -0,0 +1,103 @@
+import mock
+import unittest
+
+from github import GithubException
+
+from fusion.api.templates import repo_index
+from fusion.api.templates.repo_index import RepositoryIndex
+
+
+def make_repo(repo_id, pushed_at):
+    repo = mock.Mock(id=repo_id, default_branch="master",
+                     pushed_at=pushed_at)
+    # Mock's own name argument names the mock, not the repo.
+    repo.name = str(repo_id)
+    return repo
+
+
+class RepositoryIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.owner = mock.Mock()
+        self.get_owner = mock.Mock(return_value=self.owner)
+        now = mock.patch('time.time', return_value=1000)
+        self.mock_time = now.start()
+        self.addCleanup(now.stop)
+
+    def test_get(self):
+        self.owner.get_repos.return_value = [make_repo(2, 20),
+                                             make_repo(1, 10)]
+        index = RepositoryIndex(self.get_owner)
+
+        entry = index.get("1")
+
+        self.assertEqual({'id': '1', 'name': '1', 'default_branch': 'master',
+                          'pushed_at': 10},
+                         dict((key, value) for key, value in entry.items()
+                              if key != 'repo'))
+        self.assertEqual(["1", "2"],
+                         [item['id'] for item in index.entries()])
+        self.owner.get_repos.assert_called_once_with(sort="pushed",
+                                                     direction="desc")
+
+    def test_no_listing_until_interval_passes(self):
+        self.owner.get_repos.return_value = [make_repo(1, 10)]
+        index = RepositoryIndex(self.get_owner, interval=300)
+        index.get(1)
+
+        self.assertIsNone(index.get(3))
+        self.mock_time.return_value = 1299
+        index.get(1)
+
+        self.assertEqual(1, self.owner.get_repos.call_count)
+        self.assertEqual(1, self.get_owner.call_count)
+
+    def test_incremental_update_stops_at_unchanged_repo(self):
+        self.owner.get_repos.return_value = [make_repo(2, 20),
+                                             make_repo(1, 10)]
+        index = RepositoryIndex(self.get_owner, interval=300,
+                                full_interval=3600)
+        index.get(1)
+        unchanged = mock.Mock(id=2, pushed_at=20)
+        older = mock.Mock()
+        self.owner.get_repos.return_value = [make_repo(3, 30),
+                                             make_repo(1, 25), unchanged,
+                                             older]
+
+        self.mock_time.return_value = 1300
+        self.assertIsNotNone(index.get(3))
+
+        self.assertEqual(25, index.get(1)['pushed_at'])
+        self.assertEqual(["1", "2", "3"],
+                         [item['id'] for item in index.entries()])
+        self.assertFalse(older.method_calls)
+
+    def test_full_rebuild_drops_deleted_repos(self):
+        self.owner.get_repos.return_value = [make_repo(2, 20),
+                                             make_repo(1, 10)]
+        index = RepositoryIndex(self.get_owner, interval=300,
+                                full_interval=3600)
+        index.get(1)
+        self.owner.get_repos.return_value = [make_repo(1, 10)]
+
+        self.mock_time.return_value = 4600
+
+        self.assertIsNone(index.get(2))
+        self.assertIsNotNone(index.get(1))
+
+    def test_listing_error_keeps_index(self):
+        self.owner.get_repos.return_value = [make_repo(1, 10)]
+        index = RepositoryIndex(self.get_owner, interval=300)
+        index.get(1)
+        self.owner.get_repos.side_effect = GithubException(500, "error")
+
+        self.mock_time.return_value = 1300
+
+        self.assertIsNotNone(index.get(1))
+
+    def test_get_index_is_shared(self):
+        self.addCleanup(repo_index.INDEXES.clear)
+
+        index = repo_index.get_index(["api", "org"], self.get_owner)
+
+        self.assertIs(index, repo_index.get_index(["api", "org"],
+                                                  self.get_owner))
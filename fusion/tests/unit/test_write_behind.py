@@ -0,0 +1,97 @@
+import eventlet
+import mock
+import unittest
+
+from fusion.common import write_behind
+from fusion.common.write_behind import WriteBehindQueue
+
+
+class WriteBehindQueueTest(unittest.TestCase):
+    def test_put_writes_in_background(self):
+        store = mock.Mock()
+        queue = WriteBehindQueue(store)
+
+        queue.put("key", (10, "data"))
+        self.assertFalse(store.cache.called)
+        self.assertEqual(1, queue.depth)
+
+        eventlet.sleep(0)
+        store.cache.assert_called_once_with("key", (10, "data"))
+        self.assertEqual(0, queue.depth)
+        self.assertEqual(1, queue.stats['written'])
+
+    def test_repeated_writes_are_coalesced(self):
+        store = mock.Mock()
+        queue = WriteBehindQueue(store)
+
+        queue.put("key", (10, "old"))
+        queue.put("key", (20, "new"))
+        queue.flush()
+
+        store.cache.assert_called_once_with("key", (20, "new"))
+        self.assertEqual(1, queue.stats['coalesced'])
+
+    def test_on_write_called_after_write(self):
+        store = mock.Mock()
+        on_write = mock.Mock()
+        queue = WriteBehindQueue(store, on_write=on_write)
+
+        queue.put("key", (10, "data"))
+        queue.flush()
+
+        on_write.assert_called_once_with(["key"])
+
+    def test_writes_dropped_when_full(self):
+        store = mock.Mock()
+        queue = WriteBehindQueue(store, max_size=1)
+
+        self.assertTrue(queue.put("a", (10, "a")))
+        self.assertFalse(queue.put("b", (10, "b")))
+        self.assertTrue(queue.put("a", (20, "a")))
+        queue.flush()
+
+        store.cache.assert_called_once_with("a", (20, "a"))
+        self.assertEqual(1, queue.stats['dropped'])
+
+    def test_failed_write_is_counted(self):
+        store = mock.Mock()
+        store.cache.side_effect = Exception()
+        queue = WriteBehindQueue(store)
+
+        queue.put("key", (10, "data"))
+        queue.flush()
+
+        self.assertEqual(1, queue.stats['failed'])
+        self.assertEqual(0, queue.depth)
+
+    def test_skipped_write_is_counted(self):
+        store = mock.Mock()
+        store.cache.return_value = False
+        on_write = mock.Mock()
+        queue = WriteBehindQueue(store, on_write=on_write)
+
+        queue.put("key", (10, "data"))
+        queue.flush()
+
+        self.assertEqual(1, queue.stats['failed'])
+        self.assertFalse(on_write.called)
+
+    def test_discard_drops_pending_write(self):
+        store = mock.Mock()
+        queue = WriteBehindQueue(store)
+        queue.put("key", (10, "data"))
+
+        queue.discard("key")
+        queue.flush()
+
+        self.assertFalse(store.cache.called)
+        self.assertEqual(0, queue.depth)
+
+    def test_flush_all(self):
+        store = mock.Mock()
+        queue = WriteBehindQueue(store)
+        queue.put("key", (10, "data"))
+
+        write_behind.flush_all()
+
+        store.cache.assert_called_once_with("key", (10, "data"))
@@ -0,0 +1,51 @@
+import signal
+
+import mock
+import unittest
+
+from fusion.common import wsgi
+
+
+class ServerWorkerStopTest(unittest.TestCase):
+    def setUp(self):
+        self.on_worker_stop = mock.Mock()
+        self.server = wsgi.Server(on_worker_stop=self.on_worker_stop)
+        self.server.logger = mock.Mock()
+
+    @mock.patch('signal.signal')
+    def test_sigterm_handled_with_hook(self, mock_signal):
+        self.server._handle_worker_stop()
+
+        mock_signal.assert_called_once_with(
+            signal.SIGTERM, self.server._worker_terminated)
+
+    @mock.patch('signal.signal')
+    def test_sigterm_default_without_hook(self, mock_signal):
+        wsgi.Server()._handle_worker_stop()
+
+        self.assertFalse(mock_signal.called)
+
+    @mock.patch('eventlet.spawn_n')
+    @mock.patch('signal.signal')
+    def test_sigterm_runs_hook_from_greenthread(self, mock_signal,
+                                                mock_spawn):
+        self.server._worker_terminated(signal.SIGTERM, None)
+
+        mock_signal.assert_called_once_with(signal.SIGTERM, signal.SIG_DFL)
+        mock_spawn.assert_called_once_with(self.server._worker_stopped)
+        self.assertFalse(self.on_worker_stop.called)
+
+    @mock.patch('os.kill')
+    def test_worker_exits_after_hook(self, mock_kill):
+        self.server._worker_stopped()
+
+        self.assertTrue(self.on_worker_stop.called)
+        self.assertEqual(signal.SIGTERM, mock_kill.call_args[0][1])
+
+    @mock.patch('os.kill')
+    def test_worker_exits_when_hook_fails(self, mock_kill):
+        self.on_worker_stop.side_effect = Exception()
+
+        self.server._worker_stopped()
+
+        self.assertTrue(mock_kill.called)